@@ -1,24 +1,194 @@
 // clustering.cpp
-// Build: from repo root -> cd cpp && g++ -std=c++17 clustering.cpp -o cluster_engine && cd ..
+// Build: from repo root -> make -C cpp, or by hand:
+//   cd cpp && g++ -std=c++17 -O2 -pthread clustering.cpp -o cluster_engine && cd ..
+//   cd cpp && g++ -std=c++17 -O2 -pthread -shared -fPIC -DKMEANS_LIBRARY clustering.cpp -o libkmeans.so && cd ..
 // (On Windows with MinGW/WSL, same command; ensure a C++17 compiler is available.)
+// The shared library exports the C API at the end of this file (kmeans_fit),
+// which python/kmeans_engine.py calls in-process.
+// Usage: cluster_engine [k] [--seed N] [--max-iter N] [--tol X] [--threads N]
+//                       [--input PATH] [--output PATH]
+//                       [--minibatch [--batch-size N] [--epochs N] [--refine N]]
+//                       [--sweep MIN:MAX [--silhouette-sample N]] [--neighbors K]
+//   --input is a binary feature file (.bin, memory-mapped; layout in
+//   python/feature_io.py) or a CSV with game_id first. Default:
+//   data/features_for_clustering.bin if it exists, else the .csv next to it.
+//   --output is written in the same format as the input unless its extension
+//   says otherwise (default data/cluster_labels.bin or data/cluster_output.csv).
+//   --minibatch streams a .bin input in --batch-size (default 4096) row
+//   batches for up to --epochs (default 20) passes with bounded memory, then
+//   runs up to --refine (default 50) streamed Lloyd passes until no centroid
+//   moves more than --tol, and labels every row in one more pass (see
+//   run_minibatch and refine_minibatch).
+//   k-means++ seeding from --seed (default 42), then Lloyd iterations with
+//   Hamerly bound pruning until no centroid moves more than --tol (default
+//   1e-6, in scaled feature units) or --max-iter (default 300) is reached.
+//   --threads (default: all hardware threads) only changes speed; results are
+//   identical for any thread count.
+//   --sweep MIN:MAX fits every k in the range (in parallel across k), prints
+//   inertia, silhouette (on --silhouette-sample rows, default 2000),
+//   Davies-Bouldin, sizes and centroids for each, and writes the labels of
+//   the k with the highest silhouette (see run_sweep).
+//   --neighbors K writes the K nearest other games of every game (KD-tree,
+//   Euclidean distance in scaled units) as game_id,neighbor_id,rank,distance
+//   CSV (default data/similar_games.csv).
+// Each phase (load, fit, write, ...) also prints a line
+//   METRICS {"phase": ..., "rows": ..., "wall_seconds": ..., "cpu_seconds": ..., "peak_rss_mib": ...}
+// that python/instrumentation.py records as steps of the calling stage.
 
 #include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <cmath>
+#include <cstdint>
+#include <cstring>
+#include <ctime>
+#include <exception>
 #include <filesystem>
 #include <fstream>
 #include <iostream>
+#include <limits>
+#include <memory>
+#include <numeric>
+#include <random>
 #include <sstream>
+#include <stdexcept>
 #include <string>
-#include <unordered_map>
+#include <thread>
 #include <utility>
 #include <vector>
 
-struct Point {
-    int game_id{};
-    std::vector<double> features;
-    int cluster{-1};
+#ifndef _WIN32
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/resource.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
+// Read-only view of a whole file: mmap on POSIX, a plain read elsewhere.
+class MappedFile {
+public:
+    explicit MappedFile(const std::filesystem::path& path) {
+#ifndef _WIN32
+        int fd = ::open(path.c_str(), O_RDONLY);
+        if (fd < 0) throw std::runtime_error("Failed to open file: " + path.string());
+        struct stat st {};
+        if (::fstat(fd, &st) != 0) {
+            ::close(fd);
+            throw std::runtime_error("Failed to stat file: " + path.string());
+        }
+        size_ = static_cast<size_t>(st.st_size);
+        if (size_ > 0) {
+            void* addr = ::mmap(nullptr, size_, PROT_READ, MAP_PRIVATE, fd, 0);
+            if (addr == MAP_FAILED) {
+                ::close(fd);
+                throw std::runtime_error("Failed to map file: " + path.string());
+            }
+            data_ = static_cast<const unsigned char*>(addr);
+        }
+        ::close(fd);
+#else
+        std::ifstream file(path, std::ios::binary);
+        if (!file.is_open()) throw std::runtime_error("Failed to open file: " + path.string());
+        buffer_.assign(std::istreambuf_iterator<char>(file), std::istreambuf_iterator<char>());
+        size_ = buffer_.size();
+        data_ = reinterpret_cast<const unsigned char*>(buffer_.data());
+#endif
+    }
+
+    ~MappedFile() {
+#ifndef _WIN32
+        if (data_) ::munmap(const_cast<unsigned char*>(data_), size_);
+#endif
+    }
+
+    MappedFile(const MappedFile&) = delete;
+    MappedFile& operator=(const MappedFile&) = delete;
+
+    const unsigned char* data() const { return data_; }
+    size_t size() const { return size_; }
+
+private:
+    const unsigned char* data_{nullptr};
+    size_t size_{0};
+#ifdef _WIN32
+    std::vector<char> buffer_;
+#endif
+};
+
+// Header of the binary feature/label files (see python/feature_io.py).
+// Values are little-endian; the engine assumes a little-endian host.
+struct MatrixHeader {
+    char magic[4];
+    std::uint32_t dtype;
+    std::uint64_t rows;
+    std::uint64_t dim;
+    std::uint64_t reserved;
+};
+static_assert(sizeof(MatrixHeader) == 32, "MatrixHeader must be 32 bytes");
+
+constexpr char FEATURES_MAGIC[4] = {'G', 'F', 'M', '1'};
+constexpr char LABELS_MAGIC[4] = {'G', 'C', 'L', '1'};
+constexpr std::uint32_t DTYPE_FLOAT64 = 1;
+constexpr std::uint32_t DTYPE_FLOAT32 = 2;
+constexpr std::uint32_t DTYPE_INT32 = 3;
+
+size_t ids_offset(std::uint64_t rows, std::uint64_t dim, size_t itemsize) {
+    const size_t matrix_bytes = static_cast<size_t>(rows * dim) * itemsize;
+    return sizeof(MatrixHeader) + (matrix_bytes + 7) / 8 * 8;
+}
+
+// Feature matrix in one contiguous row-major buffer, with the ids alongside.
+// The buffers are either a memory-mapped binary file or owned vectors.
+struct Dataset {
+    size_t rows{0};
+    size_t dim{0};
+    const double* features{nullptr};  // rows x dim
+    const std::int64_t* ids{nullptr};
+
+    std::shared_ptr<MappedFile> mapping;
+    std::vector<double> owned_features;
+    std::vector<std::int64_t> owned_ids;
+
+    Dataset() = default;
+    Dataset(const Dataset&) = delete;
+    Dataset& operator=(const Dataset&) = delete;
+    Dataset(Dataset&&) = default;
+    Dataset& operator=(Dataset&&) = default;
+
+    const double* row(size_t i) const { return features + i * dim; }
 };
 
-using Matrix = std::vector<std::vector<double>>;
+// Work is split into fixed blocks of rows. Partial results are kept per block
+// and combined in block order, so floating-point sums do not depend on how
+// many threads ran or which thread handled which block.
+constexpr size_t BLOCK_ROWS = 4096;
+
+size_t block_count(size_t rows) {
+    return (rows + BLOCK_ROWS - 1) / BLOCK_ROWS;
+}
+
+// Calls fn(block, begin, end) for every block, spread over `threads` threads.
+template <typename Fn>
+void parallel_blocks(size_t rows, int threads, Fn fn) {
+    const size_t blocks = block_count(rows);
+    auto worker = [&](size_t first) {
+        for (size_t b = first; b < blocks; b += static_cast<size_t>(threads)) {
+            fn(b, b * BLOCK_ROWS, std::min(rows, (b + 1) * BLOCK_ROWS));
+        }
+    };
+    if (threads <= 1 || blocks <= 1) {
+        worker(0);
+        return;
+    }
+    std::vector<std::thread> pool;
+    pool.reserve(static_cast<size_t>(threads) - 1);
+    for (int t = 1; t < threads; ++t) {
+        pool.emplace_back(worker, static_cast<size_t>(t));
+    }
+    worker(0);
+    for (auto& th : pool) th.join();
+}
 
 std::vector<std::string> split(const std::string& line, char delim) {
     std::vector<std::string> parts;
@@ -43,13 +213,13 @@ std::filesystem::path resolve_data_path(const std::string& filename) {
     return cwd / "data" / filename;
 }
 
-std::vector<Point> read_csv(const std::filesystem::path& path) {
+Dataset read_csv(const std::filesystem::path& path) {
     std::ifstream file(path);
     if (!file.is_open()) {
         throw std::runtime_error("Failed to open file: " + path.string());
     }
 
-    std::vector<Point> points;
+    Dataset data;
     std::string line;
 
     // Header
@@ -61,121 +231,1635 @@ std::vector<Point> read_csv(const std::filesystem::path& path) {
         if (line.empty()) continue;
         auto parts = split(line, ',');
         if (parts.size() < 2) continue;
-        Point p;
-        p.game_id = std::stoi(parts[0]);
-        p.features.reserve(parts.size() - 1);
-        for (size_t i = 1; i < parts.size(); ++i) {
-            p.features.push_back(std::stod(parts[i]));
+        if (data.rows == 0) {
+            data.dim = parts.size() - 1;
+        } else if (parts.size() - 1 != data.dim) {
+            throw std::runtime_error("Inconsistent column count in " + path.string());
         }
-        points.push_back(std::move(p));
+        try {
+            data.owned_ids.push_back(std::stoll(parts[0]));
+            for (size_t i = 1; i < parts.size(); ++i) {
+                data.owned_features.push_back(std::stod(parts[i]));
+            }
+        } catch (const std::logic_error&) {
+            throw std::runtime_error("Malformed row " + std::to_string(data.rows + 1) + " in " + path.string());
+        }
+        data.rows += 1;
+    }
+
+    data.features = data.owned_features.data();
+    data.ids = data.owned_ids.data();
+    return data;
+}
+
+// Checks a feature file header against the file size; returns the value size.
+size_t feature_itemsize(const MatrixHeader& header, size_t file_size, const std::filesystem::path& path) {
+    if (std::memcmp(header.magic, FEATURES_MAGIC, 4) != 0) {
+        throw std::runtime_error("Not a binary feature file: " + path.string());
+    }
+    if (header.dtype != DTYPE_FLOAT64 && header.dtype != DTYPE_FLOAT32) {
+        throw std::runtime_error("Unsupported feature dtype in " + path.string());
+    }
+    const size_t itemsize = header.dtype == DTYPE_FLOAT64 ? 8 : 4;
+    if (file_size < ids_offset(header.rows, header.dim, itemsize) + header.rows * sizeof(std::int64_t)) {
+        throw std::runtime_error("Truncated feature file: " + path.string());
+    }
+    return itemsize;
+}
+
+Dataset read_binary(const std::filesystem::path& path) {
+    auto mapping = std::make_shared<MappedFile>(path);
+    if (mapping->size() < sizeof(MatrixHeader)) {
+        throw std::runtime_error("Truncated feature file: " + path.string());
+    }
+    MatrixHeader header;
+    std::memcpy(&header, mapping->data(), sizeof(header));
+    const size_t itemsize = feature_itemsize(header, mapping->size(), path);
+    const size_t offset = ids_offset(header.rows, header.dim, itemsize);
+
+    Dataset data;
+    data.rows = static_cast<size_t>(header.rows);
+    data.dim = static_cast<size_t>(header.dim);
+    const unsigned char* matrix = mapping->data() + sizeof(MatrixHeader);
+    if (header.dtype == DTYPE_FLOAT64) {
+        // Page-aligned mapping + 32-byte header: the doubles are aligned.
+        data.features = reinterpret_cast<const double*>(matrix);
+    } else {
+        const float* values = reinterpret_cast<const float*>(matrix);
+        data.owned_features.assign(values, values + data.rows * data.dim);
+        data.features = data.owned_features.data();
     }
+    data.ids = reinterpret_cast<const std::int64_t*>(mapping->data() + offset);
+    data.mapping = std::move(mapping);
+    return data;
+}
+
+bool is_binary_path(const std::filesystem::path& path) {
+    return path.extension() == ".bin";
+}
 
-    return points;
+Dataset read_features(const std::filesystem::path& path) {
+    return is_binary_path(path) ? read_binary(path) : read_csv(path);
 }
 
-double euclidean_sq(const std::vector<double>& a, const std::vector<double>& b) {
+inline double euclidean_sq(const double* a, const double* b, size_t dim) {
     double sum = 0.0;
-    for (size_t i = 0; i < a.size(); ++i) {
+    for (size_t i = 0; i < dim; ++i) {
         double d = a[i] - b[i];
         sum += d * d;
     }
     return sum;
 }
 
-Matrix initialize_centroids(const std::vector<Point>& points, int k) {
-    Matrix centroids;
-    centroids.reserve(k);
-    for (int i = 0; i < k; ++i) {
-        // Deterministic init: first k points (assumes k <= points.size()).
-        centroids.push_back(points[static_cast<size_t>(i % points.size())].features);
+// Uniform double in [0, 1) from the top 53 bits, so a seed gives the same
+// centroids with every standard library (std::uniform_real_distribution
+// is implementation-defined).
+double uniform01(std::mt19937_64& rng) {
+    return static_cast<double>(rng() >> 11) * 0x1.0p-53;
+}
+
+// k-means++: the first centroid is a uniformly random point, each next one is
+// drawn with probability proportional to its squared distance to the nearest
+// centroid chosen so far. Returns k x dim centroids, row-major.
+std::vector<double> initialize_centroids(const Dataset& data, int k, std::uint64_t seed, int threads) {
+    std::mt19937_64 rng(seed);
+    const size_t n = data.rows;
+    const size_t dim = data.dim;
+    std::vector<double> centroids;
+    centroids.reserve(static_cast<size_t>(k) * dim);
+    auto add_centroid = [&](size_t i) {
+        centroids.insert(centroids.end(), data.row(i), data.row(i) + dim);
+    };
+    add_centroid(static_cast<size_t>(uniform01(rng) * n));
+
+    std::vector<double> nearest(n, std::numeric_limits<double>::max());
+    std::vector<double> block_total(block_count(n));
+    for (int c = 1; c < k; ++c) {
+        const double* latest = centroids.data() + (c - 1) * dim;
+        parallel_blocks(n, threads, [&](size_t b, size_t begin, size_t end) {
+            double total = 0.0;
+            for (size_t i = begin; i < end; ++i) {
+                nearest[i] = std::min(nearest[i], euclidean_sq(data.row(i), latest, dim));
+                total += nearest[i];
+            }
+            block_total[b] = total;
+        });
+        double total = 0.0;
+        for (double t : block_total) total += t;
+
+        size_t chosen = n - 1;
+        if (total > 0.0) {
+            // Find the block holding the target, then the row within it.
+            double target = uniform01(rng) * total;
+            size_t b = 0;
+            while (b + 1 < block_total.size() && target >= block_total[b]) {
+                target -= block_total[b];
+                ++b;
+            }
+            const size_t end = std::min(n, (b + 1) * BLOCK_ROWS);
+            chosen = end - 1;
+            double cumulative = 0.0;
+            for (size_t i = b * BLOCK_ROWS; i < end; ++i) {
+                cumulative += nearest[i];
+                if (cumulative > target) {
+                    chosen = i;
+                    break;
+                }
+            }
+        } else {
+            // Fewer distinct points than k: any point will do.
+            chosen = static_cast<size_t>(uniform01(rng) * n);
+        }
+        add_centroid(chosen);
     }
     return centroids;
 }
 
-void assign_clusters(std::vector<Point>& points, const Matrix& centroids) {
-    for (auto& p : points) {
-        double best_dist = std::numeric_limits<double>::max();
-        int best_cluster = -1;
-        for (size_t i = 0; i < centroids.size(); ++i) {
-            double d = euclidean_sq(p.features, centroids[i]);
-            if (d < best_dist) {
-                best_dist = d;
-                best_cluster = static_cast<int>(i);
-            }
+struct KMeansStats {
+    int iterations{0};
+    bool converged{false};
+    std::uint64_t distance_evals{0};   // point-centroid and centroid-centroid
+    std::uint64_t lloyd_evals{0};      // what plain Lloyd would have computed
+    double inertia{0.0};
+};
+
+// Distances from one point to every centroid; returns the nearest index and
+// fills the nearest and second-nearest distances.
+int nearest_two(const double* x, const std::vector<double>& centroids, size_t dim, double& best, double& second) {
+    const size_t k = centroids.size() / dim;
+    best = std::numeric_limits<double>::max();
+    second = std::numeric_limits<double>::max();
+    int best_cluster = -1;
+    for (size_t j = 0; j < k; ++j) {
+        double d = std::sqrt(euclidean_sq(x, centroids.data() + j * dim, dim));
+        if (d < best) {
+            second = best;
+            best = d;
+            best_cluster = static_cast<int>(j);
+        } else if (d < second) {
+            second = d;
         }
-        p.cluster = best_cluster;
     }
+    return best_cluster;
 }
 
-Matrix update_centroids(const std::vector<Point>& points, int k, size_t dim) {
-    Matrix centroids(k, std::vector<double>(dim, 0.0));
-    std::vector<int> counts(k, 0);
-    for (const auto& p : points) {
-        if (p.cluster < 0) continue;
-        for (size_t j = 0; j < dim; ++j) {
-            centroids[p.cluster][j] += p.features[j];
+// Mean of each cluster's points; an empty cluster keeps its previous centroid.
+// Each block accumulates its own sums (k x dim, then k counts) and the blocks
+// are added up in order.
+std::vector<double> update_centroids(
+    const Dataset& data,
+    const std::vector<int>& labels,
+    const std::vector<double>& previous,
+    std::vector<double>& partials,
+    int threads
+) {
+    const size_t dim = data.dim;
+    const size_t k = previous.size() / dim;
+    const size_t stride = k * dim + k;
+    parallel_blocks(data.rows, threads, [&](size_t b, size_t begin, size_t end) {
+        double* sums = partials.data() + b * stride;
+        double* counts = sums + k * dim;
+        std::fill(sums, sums + stride, 0.0);
+        for (size_t i = begin; i < end; ++i) {
+            const double* x = data.row(i);
+            double* s = sums + static_cast<size_t>(labels[i]) * dim;
+            for (size_t j = 0; j < dim; ++j) s[j] += x[j];
+            counts[labels[i]] += 1.0;
         }
-        counts[p.cluster] += 1;
+    });
+
+    std::vector<double> total(stride, 0.0);
+    for (size_t b = 0; b < block_count(data.rows); ++b) {
+        const double* part = partials.data() + b * stride;
+        for (size_t j = 0; j < stride; ++j) total[j] += part[j];
     }
-    for (int i = 0; i < k; ++i) {
-        if (counts[i] == 0) continue;
+
+    std::vector<double> centroids(k * dim);
+    for (size_t c = 0; c < k; ++c) {
+        const double count = total[k * dim + c];
         for (size_t j = 0; j < dim; ++j) {
-            centroids[i][j] /= static_cast<double>(counts[i]);
+            centroids[c * dim + j] = count > 0.0 ? total[c * dim + j] / count : previous[c * dim + j];
         }
     }
     return centroids;
 }
 
-void write_clusters(const std::vector<Point>& points, const std::filesystem::path& path) {
+// Sum of squared distances from each row to its cluster's centroid.
+double total_inertia(const Dataset& data, const std::vector<double>& centroids, const std::vector<int>& labels, int threads) {
+    std::vector<double> block_inertia(block_count(data.rows));
+    parallel_blocks(data.rows, threads, [&](size_t b, size_t begin, size_t end) {
+        double sum = 0.0;
+        for (size_t i = begin; i < end; ++i) {
+            sum += euclidean_sq(data.row(i), centroids.data() + static_cast<size_t>(labels[i]) * data.dim, data.dim);
+        }
+        block_inertia[b] = sum;
+    });
+    double total = 0.0;
+    for (double s : block_inertia) total += s;
+    return total;
+}
+
+// Lloyd's algorithm with Hamerly's bounds. Each point keeps an upper bound on
+// the distance to its assigned centroid and a lower bound on the distance to
+// every other centroid. When the upper bound is below both the lower bound
+// and half the distance from its centroid to the nearest other centroid, the
+// assignment cannot change and no distances are computed for that point.
+// Stops when no centroid moves more than tol, or after max_iter iterations.
+KMeansStats run_kmeans(
+    const Dataset& data,
+    std::vector<double>& centroids,
+    std::vector<int>& labels,
+    int max_iter,
+    double tol,
+    int threads
+) {
+    const size_t n = data.rows;
+    const size_t dim = data.dim;
+    const size_t k = centroids.size() / dim;
+    const size_t blocks = block_count(n);
+    KMeansStats stats;
+
+    labels.assign(n, -1);
+    std::vector<double> upper(n), lower(n);
+    parallel_blocks(n, threads, [&](size_t, size_t begin, size_t end) {
+        for (size_t i = begin; i < end; ++i) {
+            labels[i] = nearest_two(data.row(i), centroids, dim, upper[i], lower[i]);
+        }
+    });
+    stats.distance_evals += n * k;
+
+    std::vector<double> partials(blocks * (k * dim + k));
+    std::vector<std::uint64_t> block_evals(blocks);
+    std::vector<double> shift(k), half_gap(k);
+    while (stats.iterations < max_iter) {
+        stats.iterations += 1;
+        stats.lloyd_evals += n * k;
+
+        std::vector<double> updated = update_centroids(data, labels, centroids, partials, threads);
+        double max_shift = 0.0, second_shift = 0.0;
+        size_t max_shift_cluster = 0;
+        for (size_t c = 0; c < k; ++c) {
+            shift[c] = std::sqrt(euclidean_sq(updated.data() + c * dim, centroids.data() + c * dim, dim));
+            if (shift[c] > max_shift) {
+                second_shift = max_shift;
+                max_shift = shift[c];
+                max_shift_cluster = c;
+            } else if (shift[c] > second_shift) {
+                second_shift = shift[c];
+            }
+        }
+        centroids = std::move(updated);
+        if (max_shift <= tol) {
+            stats.converged = true;
+            break;
+        }
+
+        std::fill(half_gap.begin(), half_gap.end(), std::numeric_limits<double>::max());
+        for (size_t a = 0; a < k; ++a) {
+            for (size_t c = a + 1; c < k; ++c) {
+                double d = 0.5 * std::sqrt(euclidean_sq(centroids.data() + a * dim, centroids.data() + c * dim, dim));
+                half_gap[a] = std::min(half_gap[a], d);
+                half_gap[c] = std::min(half_gap[c], d);
+            }
+        }
+        stats.distance_evals += k * (k - 1) / 2;
+
+        parallel_blocks(n, threads, [&](size_t b, size_t begin, size_t end) {
+            std::uint64_t evals = 0;
+            for (size_t i = begin; i < end; ++i) {
+                const size_t a = static_cast<size_t>(labels[i]);
+                upper[i] += shift[a];
+                lower[i] -= (a == max_shift_cluster) ? second_shift : max_shift;
+                const double bound = std::max(half_gap[a], lower[i]);
+                if (upper[i] <= bound) continue;
+                upper[i] = std::sqrt(euclidean_sq(data.row(i), centroids.data() + a * dim, dim));
+                evals += 1;
+                if (upper[i] <= bound) continue;
+                labels[i] = nearest_two(data.row(i), centroids, dim, upper[i], lower[i]);
+                evals += k;
+            }
+            block_evals[b] = evals;
+        });
+        for (std::uint64_t e : block_evals) stats.distance_evals += e;
+    }
+
+    stats.inertia = total_inertia(data, centroids, labels, threads);
+    return stats;
+}
+
+struct WarmStartStats {
+    KMeansStats stats;
+    std::uint64_t reassigned{0};  // rows that came in without a label
+    double drift{0.0};            // largest centroid move, before any full run
+    bool full_run{false};
+};
+
+// Warm start from a previous model. Rows keep their previous label unless
+// it is negative (new or changed rows), in which case they go to the nearest
+// previous centroid; then every centroid is recomputed as the mean of its
+// rows. If no centroid moved more than drift_threshold the run stops there,
+// having computed distances for the unlabelled rows only. Otherwise it falls
+// back to full Hamerly iterations (run_kmeans) from the recomputed
+// centroids, which may reassign every row.
+WarmStartStats run_warm_start(
+    const Dataset& data,
+    std::vector<double>& centroids,
+    std::vector<int>& labels,
+    int max_iter,
+    double tol,
+    double drift_threshold,
+    int threads
+) {
+    const size_t n = data.rows;
+    const size_t dim = data.dim;
+    const size_t k = centroids.size() / dim;
+    const size_t blocks = block_count(n);
+    WarmStartStats warm;
+
+    std::vector<std::uint64_t> block_reassigned(blocks);
+    parallel_blocks(n, threads, [&](size_t b, size_t begin, size_t end) {
+        std::uint64_t count = 0;
+        for (size_t i = begin; i < end; ++i) {
+            if (labels[i] >= 0 && static_cast<size_t>(labels[i]) < k) continue;
+            double best = 0.0, second = 0.0;
+            labels[i] = nearest_two(data.row(i), centroids, dim, best, second);
+            count += 1;
+        }
+        block_reassigned[b] = count;
+    });
+    for (std::uint64_t c : block_reassigned) warm.reassigned += c;
+    warm.stats.distance_evals = warm.reassigned * k;
+
+    std::vector<double> partials(blocks * (k * dim + k));
+    std::vector<double> updated = update_centroids(data, labels, centroids, partials, threads);
+    for (size_t c = 0; c < k; ++c) {
+        warm.drift = std::max(warm.drift, std::sqrt(euclidean_sq(updated.data() + c * dim, centroids.data() + c * dim, dim)));
+    }
+    centroids = std::move(updated);
+
+    if (warm.drift > drift_threshold) {
+        warm.full_run = true;
+        const std::uint64_t evals = warm.stats.distance_evals;
+        warm.stats = run_kmeans(data, centroids, labels, max_iter, tol, threads);
+        warm.stats.distance_evals += evals;
+        return warm;
+    }
+    warm.stats.converged = true;
+    warm.stats.inertia = total_inertia(data, centroids, labels, threads);
+    return warm;
+}
+
+void write_labels_binary(const Dataset& data, const std::vector<int>& labels, const std::filesystem::path& path) {
+    std::ofstream out(path, std::ios::binary);
+    if (!out.is_open()) {
+        throw std::runtime_error("Failed to write: " + path.string());
+    }
+    MatrixHeader header{};
+    std::memcpy(header.magic, LABELS_MAGIC, 4);
+    header.dtype = DTYPE_INT32;
+    header.rows = data.rows;
+    header.dim = 1;
+    out.write(reinterpret_cast<const char*>(&header), sizeof(header));
+    std::vector<std::int32_t> values(labels.begin(), labels.end());
+    out.write(reinterpret_cast<const char*>(values.data()), static_cast<std::streamsize>(values.size() * sizeof(std::int32_t)));
+    const size_t padding = ids_offset(data.rows, 1, sizeof(std::int32_t)) - sizeof(header) - values.size() * sizeof(std::int32_t);
+    const char zeros[8] = {};
+    out.write(zeros, static_cast<std::streamsize>(padding));
+    out.write(reinterpret_cast<const char*>(data.ids), static_cast<std::streamsize>(data.rows * sizeof(std::int64_t)));
+    if (!out) {
+        throw std::runtime_error("Failed to write: " + path.string());
+    }
+}
+
+void write_clusters(const Dataset& data, const std::vector<int>& labels, const std::filesystem::path& path) {
+    if (is_binary_path(path)) {
+        write_labels_binary(data, labels, path);
+        return;
+    }
     std::ofstream out(path);
     if (!out.is_open()) {
         throw std::runtime_error("Failed to write: " + path.string());
     }
     out << "game_id,cluster_id\n";
-    for (const auto& p : points) {
-        out << p.game_id << "," << p.cluster << "\n";
+    for (size_t i = 0; i < data.rows; ++i) {
+        out << data.ids[i] << "," << labels[i] << "\n";
+    }
+}
+
+// ---- Mini-batch mode -------------------------------------------------------
+
+// Reads row ranges of a binary feature file with plain reads, so only the
+// requested rows are ever in memory (used instead of mapping the whole file).
+class FeatureReader {
+public:
+    explicit FeatureReader(const std::filesystem::path& path) : path_(path), file_(path, std::ios::binary) {
+        if (!file_.is_open()) throw std::runtime_error("Failed to open file: " + path.string());
+        file_.read(reinterpret_cast<char*>(&header_), sizeof(header_));
+        if (!file_) throw std::runtime_error("Truncated feature file: " + path.string());
+        itemsize_ = feature_itemsize(header_, static_cast<size_t>(std::filesystem::file_size(path)), path);
+    }
+
+    size_t rows() const { return static_cast<size_t>(header_.rows); }
+    size_t dim() const { return static_cast<size_t>(header_.dim); }
+
+    // Rows [begin, begin + count) into out (count x dim doubles).
+    void read_rows(size_t begin, size_t count, double* out) {
+        const size_t values = count * dim();
+        seek(sizeof(MatrixHeader) + begin * dim() * itemsize_);
+        if (itemsize_ == sizeof(double)) {
+            read(out, values * sizeof(double));
+        } else {
+            scratch_.resize(values);
+            read(scratch_.data(), values * sizeof(float));
+            std::copy(scratch_.begin(), scratch_.end(), out);
+        }
+    }
+
+    void read_ids(size_t begin, size_t count, std::int64_t* out) {
+        seek(ids_offset(header_.rows, header_.dim, itemsize_) + begin * sizeof(std::int64_t));
+        read(out, count * sizeof(std::int64_t));
+    }
+
+private:
+    void seek(size_t offset) {
+        file_.clear();
+        file_.seekg(static_cast<std::streamoff>(offset));
+    }
+
+    void read(void* out, size_t bytes) {
+        file_.read(static_cast<char*>(out), static_cast<std::streamsize>(bytes));
+        if (!file_) throw std::runtime_error("Failed to read: " + path_.string());
+    }
+
+    std::filesystem::path path_;
+    std::ifstream file_;
+    MatrixHeader header_{};
+    size_t itemsize_{8};
+    std::vector<float> scratch_;
+};
+
+// A Dataset over a reusable batch buffer.
+Dataset batch_view(const std::vector<double>& buffer, const std::vector<std::int64_t>& ids, size_t rows, size_t dim) {
+    Dataset view;
+    view.rows = rows;
+    view.dim = dim;
+    view.features = buffer.data();
+    view.ids = ids.data();
+    return view;
+}
+
+// Nearest centroid of every row of a batch; returns the batch's sum of
+// squared distances (per-block partials added in order, as in run_kmeans).
+double assign_batch(const Dataset& batch, const std::vector<double>& centroids, std::vector<int>& labels, int threads) {
+    std::vector<double> block_inertia(block_count(batch.rows));
+    parallel_blocks(batch.rows, threads, [&](size_t b, size_t begin, size_t end) {
+        double sum = 0.0;
+        for (size_t i = begin; i < end; ++i) {
+            double best = 0.0, second = 0.0;
+            labels[i] = nearest_two(batch.row(i), centroids, batch.dim, best, second);
+            sum += best * best;
+        }
+        block_inertia[b] = sum;
+    });
+    double total = 0.0;
+    for (double s : block_inertia) total += s;
+    return total;
+}
+
+// Relative improvement in mean batch inertia between epochs below which the
+// mini-batch run stops early.
+constexpr double MINIBATCH_EPOCH_TOL = 1e-3;
+
+// Mini-batch k-means (Sculley, 2010) over a feature file that is never fully
+// loaded. Each epoch visits the file in batch_size-row blocks in a shuffled
+// order. A batch is assigned to the current centroids, then each point pulls
+// its centroid towards it with learning rate 1 / (points seen by that
+// centroid so far). k-means++ seeds from a sample of 3 x batch_size rows.
+// Memory is O(batch_size x dim + k x dim) whatever the file size.
+KMeansStats run_minibatch(
+    FeatureReader& reader,
+    std::vector<double>& centroids,
+    int k,
+    std::uint64_t seed,
+    size_t batch_size,
+    int epochs,
+    int threads
+) {
+    const size_t n = reader.rows();
+    const size_t dim = reader.dim();
+    std::mt19937_64 rng(seed);
+    KMeansStats stats;
+
+    // Seed from a sorted random sample of rows (duplicates are harmless).
+    const size_t init_size = std::min(n, std::max(3 * batch_size, static_cast<size_t>(k)));
+    std::vector<size_t> sample(init_size);
+    for (auto& idx : sample) idx = static_cast<size_t>(uniform01(rng) * n);
+    std::sort(sample.begin(), sample.end());
+    std::vector<double> init_buffer(init_size * dim);
+    std::vector<std::int64_t> no_ids;
+    for (size_t i = 0; i < init_size; ++i) {
+        reader.read_rows(sample[i], 1, init_buffer.data() + i * dim);
+    }
+    centroids = initialize_centroids(batch_view(init_buffer, no_ids, init_size, dim), k, seed, threads);
+    init_buffer = std::vector<double>();
+
+    const size_t batches = (n + batch_size - 1) / batch_size;
+    std::vector<size_t> order(batches);
+    std::vector<double> buffer(batch_size * dim);
+    std::vector<int> labels(batch_size);
+    std::vector<double> seen(static_cast<size_t>(k), 0.0);
+    double previous = 0.0;
+
+    for (int epoch = 1; epoch <= epochs; ++epoch) {
+        for (size_t b = 0; b < batches; ++b) order[b] = b;
+        // Fisher-Yates with uniform01 so the order is the same on every platform.
+        for (size_t b = batches; b > 1; --b) {
+            std::swap(order[b - 1], order[static_cast<size_t>(uniform01(rng) * b)]);
+        }
+
+        double epoch_inertia = 0.0;
+        for (size_t b : order) {
+            const size_t begin = b * batch_size;
+            const size_t count = std::min(batch_size, n - begin);
+            reader.read_rows(begin, count, buffer.data());
+            Dataset batch = batch_view(buffer, no_ids, count, dim);
+            epoch_inertia += assign_batch(batch, centroids, labels, threads);
+            stats.distance_evals += count * static_cast<size_t>(k);
+
+            for (size_t i = 0; i < count; ++i) {
+                const size_t c = static_cast<size_t>(labels[i]);
+                seen[c] += 1.0;
+                const double eta = 1.0 / seen[c];
+                double* centroid = centroids.data() + c * dim;
+                const double* x = batch.row(i);
+                for (size_t j = 0; j < dim; ++j) {
+                    centroid[j] += eta * (x[j] - centroid[j]);
+                }
+            }
+            stats.iterations += 1;
+        }
+
+        const double mean = epoch_inertia / static_cast<double>(n);
+        if (epoch > 1 && previous - mean < MINIBATCH_EPOCH_TOL * previous) {
+            stats.converged = true;
+            break;
+        }
+        previous = mean;
+    }
+    return stats;
+}
+
+// Streamed Lloyd iterations after mini-batch mode. Each pass assigns every
+// row batch by batch and sums the rows of each cluster, then moves every
+// centroid to its cluster's mean (a centroid with no rows stays put). The
+// per-point updates of run_minibatch stall once 1 / seen is tiny and depend on
+// the order of the file's blocks; these passes move the result to a Lloyd
+// fixed point like full k-means, still in O(batch_size x dim + k x dim)
+// memory. Stops after passes or once no centroid moves more than tol; returns
+// the passes run.
+int refine_minibatch(
+    FeatureReader& reader,
+    std::vector<double>& centroids,
+    size_t batch_size,
+    int passes,
+    double tol,
+    int threads,
+    KMeansStats& stats
+) {
+    const size_t n = reader.rows();
+    const size_t dim = reader.dim();
+    const size_t k = centroids.size() / dim;
+    std::vector<double> buffer(batch_size * dim);
+    std::vector<std::int64_t> no_ids;
+    std::vector<int> labels(batch_size);
+    std::vector<double> sums(k * dim);
+    std::vector<size_t> counts(k);
+    for (int pass = 1; pass <= passes; ++pass) {
+        std::fill(sums.begin(), sums.end(), 0.0);
+        std::fill(counts.begin(), counts.end(), size_t{0});
+        for (size_t begin = 0; begin < n; begin += batch_size) {
+            const size_t count = std::min(batch_size, n - begin);
+            reader.read_rows(begin, count, buffer.data());
+            Dataset batch = batch_view(buffer, no_ids, count, dim);
+            assign_batch(batch, centroids, labels, threads);
+            stats.distance_evals += count * k;
+            for (size_t i = 0; i < count; ++i) {
+                const size_t c = static_cast<size_t>(labels[i]);
+                counts[c] += 1;
+                const double* x = batch.row(i);
+                for (size_t j = 0; j < dim; ++j) sums[c * dim + j] += x[j];
+            }
+        }
+        double max_shift = 0.0;
+        for (size_t c = 0; c < k; ++c) {
+            if (counts[c] == 0) continue;
+            double shift = 0.0;
+            for (size_t j = 0; j < dim; ++j) {
+                const double mean = sums[c * dim + j] / static_cast<double>(counts[c]);
+                shift += (mean - centroids[c * dim + j]) * (mean - centroids[c * dim + j]);
+                centroids[c * dim + j] = mean;
+            }
+            max_shift = std::max(max_shift, std::sqrt(shift));
+        }
+        if (max_shift <= tol) return pass;
+    }
+    return passes;
+}
+
+// Final full pass for mini-batch mode: assigns every row batch by batch and
+// streams the labels to the output file. Returns the inertia.
+double write_minibatch_labels(
+    FeatureReader& reader,
+    const std::vector<double>& centroids,
+    size_t batch_size,
+    int threads,
+    const std::filesystem::path& path
+) {
+    const size_t n = reader.rows();
+    const size_t dim = reader.dim();
+    const bool binary = is_binary_path(path);
+    std::ofstream out(path, binary ? std::ios::binary : std::ios::out);
+    if (!out.is_open()) {
+        throw std::runtime_error("Failed to write: " + path.string());
+    }
+    if (binary) {
+        MatrixHeader header{};
+        std::memcpy(header.magic, LABELS_MAGIC, 4);
+        header.dtype = DTYPE_INT32;
+        header.rows = n;
+        header.dim = 1;
+        out.write(reinterpret_cast<const char*>(&header), sizeof(header));
+    } else {
+        out << "game_id,cluster_id\n";
+    }
+
+    std::vector<double> buffer(batch_size * dim);
+    std::vector<std::int64_t> ids(batch_size);
+    std::vector<int> labels(batch_size);
+    std::vector<std::int32_t> values(batch_size);
+    double inertia = 0.0;
+    for (size_t begin = 0; begin < n; begin += batch_size) {
+        const size_t count = std::min(batch_size, n - begin);
+        reader.read_rows(begin, count, buffer.data());
+        reader.read_ids(begin, count, ids.data());
+        inertia += assign_batch(batch_view(buffer, ids, count, dim), centroids, labels, threads);
+        if (binary) {
+            std::copy(labels.begin(), labels.begin() + static_cast<std::ptrdiff_t>(count), values.begin());
+            out.write(reinterpret_cast<const char*>(values.data()), static_cast<std::streamsize>(count * sizeof(std::int32_t)));
+        } else {
+            for (size_t i = 0; i < count; ++i) out << ids[i] << "," << labels[i] << "\n";
+        }
+    }
+
+    if (binary) {
+        // Pad to the ids offset, then copy the ids through in batches.
+        const size_t padding = ids_offset(n, 1, sizeof(std::int32_t)) - sizeof(MatrixHeader) - n * sizeof(std::int32_t);
+        const char zeros[8] = {};
+        out.write(zeros, static_cast<std::streamsize>(padding));
+        for (size_t begin = 0; begin < n; begin += batch_size) {
+            const size_t count = std::min(batch_size, n - begin);
+            reader.read_ids(begin, count, ids.data());
+            out.write(reinterpret_cast<const char*>(ids.data()), static_cast<std::streamsize>(count * sizeof(std::int64_t)));
+        }
+    }
+    if (!out) {
+        throw std::runtime_error("Failed to write: " + path.string());
+    }
+    return inertia;
+}
+
+// ---- k sweep ---------------------------------------------------------------
+
+// Default number of rows the silhouette is computed on (its cost is quadratic).
+constexpr size_t SILHOUETTE_SAMPLE = 2000;
+
+struct SweepResult {
+    int k{0};
+    KMeansStats stats;
+    double silhouette{0.0};
+    double davies_bouldin{0.0};
+    std::vector<double> centroids;
+    std::vector<int> labels;
+    std::vector<std::int64_t> sizes;
+};
+
+// Sorted indices of sample_size rows drawn without replacement (all rows if
+// sample_size >= rows).
+std::vector<size_t> sample_rows(size_t rows, size_t sample_size, std::uint64_t seed) {
+    std::vector<size_t> idx(rows);
+    for (size_t i = 0; i < rows; ++i) idx[i] = i;
+    if (sample_size >= rows) return idx;
+    std::mt19937_64 rng(seed);
+    for (size_t i = 0; i < sample_size; ++i) {
+        std::swap(idx[i], idx[i + static_cast<size_t>(uniform01(rng) * (rows - i))]);
+    }
+    idx.resize(sample_size);
+    std::sort(idx.begin(), idx.end());
+    return idx;
+}
+
+// Mean silhouette of the sampled rows, with distances taken within the sample
+// only (like sklearn's silhouette_score with sample_size). A row alone in its
+// cluster scores 0. Higher is better, in [-1, 1].
+double silhouette_score(const Dataset& data, const std::vector<int>& labels, int k, const std::vector<size_t>& sample, int threads) {
+    const size_t m = sample.size();
+    std::vector<double> counts(static_cast<size_t>(k), 0.0);
+    for (size_t s : sample) counts[static_cast<size_t>(labels[s])] += 1.0;
+
+    std::vector<double> scores(m, 0.0);
+    parallel_blocks(m, threads, [&](size_t, size_t begin, size_t end) {
+        std::vector<double> sums(static_cast<size_t>(k));
+        for (size_t a = begin; a < end; ++a) {
+            std::fill(sums.begin(), sums.end(), 0.0);
+            const double* x = data.row(sample[a]);
+            for (size_t b = 0; b < m; ++b) {
+                sums[static_cast<size_t>(labels[sample[b]])] += std::sqrt(euclidean_sq(x, data.row(sample[b]), data.dim));
+            }
+            const size_t own = static_cast<size_t>(labels[sample[a]]);
+            if (counts[own] < 2.0) continue;
+            const double intra = sums[own] / (counts[own] - 1.0);
+            double nearest = std::numeric_limits<double>::max();
+            for (size_t c = 0; c < sums.size(); ++c) {
+                if (c != own && counts[c] > 0.0) nearest = std::min(nearest, sums[c] / counts[c]);
+            }
+            if (nearest == std::numeric_limits<double>::max()) continue;
+            const double scale = std::max(intra, nearest);
+            scores[a] = scale > 0.0 ? (nearest - intra) / scale : 0.0;
+        }
+    });
+    double total = 0.0;
+    for (double s : scores) total += s;
+    return m ? total / static_cast<double>(m) : 0.0;
+}
+
+// Cluster sizes and the Davies-Bouldin index over all rows: the mean over
+// clusters of max_j (s_i + s_j) / d(c_i, c_j), where s_i is the mean distance
+// of cluster i's rows to its centroid. Lower is better; empty clusters are
+// skipped.
+double davies_bouldin(
+    const Dataset& data,
+    const std::vector<int>& labels,
+    const std::vector<double>& centroids,
+    std::vector<std::int64_t>& sizes,
+    int threads
+) {
+    const size_t dim = data.dim;
+    const size_t k = centroids.size() / dim;
+    std::vector<double> partials(block_count(data.rows) * 2 * k);
+    parallel_blocks(data.rows, threads, [&](size_t b, size_t begin, size_t end) {
+        double* spread = partials.data() + b * 2 * k;
+        double* counts = spread + k;
+        std::fill(spread, spread + 2 * k, 0.0);
+        for (size_t i = begin; i < end; ++i) {
+            const size_t c = static_cast<size_t>(labels[i]);
+            spread[c] += std::sqrt(euclidean_sq(data.row(i), centroids.data() + c * dim, dim));
+            counts[c] += 1.0;
+        }
+    });
+    std::vector<double> total(2 * k, 0.0);
+    for (size_t b = 0; b < block_count(data.rows); ++b) {
+        for (size_t j = 0; j < 2 * k; ++j) total[j] += partials[b * 2 * k + j];
+    }
+
+    sizes.assign(k, 0);
+    std::vector<double> spread(k, 0.0);
+    for (size_t c = 0; c < k; ++c) {
+        sizes[c] = static_cast<std::int64_t>(total[k + c]);
+        if (sizes[c] > 0) spread[c] = total[c] / total[k + c];
+    }
+    double index = 0.0;
+    size_t clusters = 0;
+    for (size_t i = 0; i < k; ++i) {
+        if (sizes[i] == 0) continue;
+        double worst = 0.0;
+        for (size_t j = 0; j < k; ++j) {
+            if (j == i || sizes[j] == 0) continue;
+            const double separation = std::sqrt(euclidean_sq(centroids.data() + i * dim, centroids.data() + j * dim, dim));
+            if (separation > 0.0) worst = std::max(worst, (spread[i] + spread[j]) / separation);
+        }
+        index += worst;
+        ++clusters;
+    }
+    return clusters ? index / static_cast<double>(clusters) : 0.0;
+}
+
+// Fits every k in [k_min, k_max] on the same data and seed and scores each
+// with the silhouette (on a seeded sample of silhouette_sample rows shared by
+// all k) and the Davies-Bouldin index. The k values run in parallel, largest
+// first, with the threads split between them; as with run_kmeans, results
+// do not depend on the thread count. Returns results in k order.
+std::vector<SweepResult> run_sweep(
+    const Dataset& data,
+    int k_min,
+    int k_max,
+    std::uint64_t seed,
+    int max_iter,
+    double tol,
+    int threads,
+    size_t silhouette_sample
+) {
+    if (k_min < 2 || k_max < k_min) {
+        throw std::invalid_argument("k sweep needs 2 <= k_min <= k_max");
+    }
+    const size_t count = static_cast<size_t>(k_max - k_min + 1);
+    const std::vector<size_t> sample = sample_rows(data.rows, silhouette_sample, seed);
+    const int workers = static_cast<int>(std::min(static_cast<size_t>(threads), count));
+    const int threads_per_k = std::max(1, threads / workers);
+
+    std::vector<SweepResult> results(count);
+    std::vector<std::exception_ptr> errors(static_cast<size_t>(workers));
+    std::atomic<size_t> next{0};
+    auto worker = [&](int w) {
+        try {
+            for (size_t i = next++; i < count; i = next++) {
+                SweepResult& r = results[count - 1 - i];
+                r.k = k_max - static_cast<int>(i);
+                r.centroids = initialize_centroids(data, r.k, seed, threads_per_k);
+                r.stats = run_kmeans(data, r.centroids, r.labels, max_iter, tol, threads_per_k);
+                r.davies_bouldin = davies_bouldin(data, r.labels, r.centroids, r.sizes, threads_per_k);
+                r.silhouette = silhouette_score(data, r.labels, r.k, sample, threads_per_k);
+            }
+        } catch (...) {
+            errors[static_cast<size_t>(w)] = std::current_exception();
+        }
+    };
+    std::vector<std::thread> pool;
+    for (int w = 1; w < workers; ++w) pool.emplace_back(worker, w);
+    worker(0);
+    for (auto& th : pool) th.join();
+    for (const auto& error : errors) {
+        if (error) std::rethrow_exception(error);
+    }
+    return results;
+}
+
+// Highest silhouette, ties broken by the lower Davies-Bouldin index.
+const SweepResult& best_by_silhouette(const std::vector<SweepResult>& results) {
+    const SweepResult* best = &results.front();
+    for (const auto& r : results) {
+        if (r.silhouette > best->silhouette ||
+            (r.silhouette == best->silhouette && r.davies_bouldin < best->davies_bouldin)) {
+            best = &r;
+        }
+    }
+    return *best;
+}
+
+// ---- Nearest-neighbour index ----------------------------------------------
+
+// Rows per KD-tree leaf; leaves are scanned linearly.
+constexpr size_t KD_LEAF_ROWS = 16;
+
+// (squared distance, row), ordered so ties go to the lower row.
+using Neighbor = std::pair<double, size_t>;
+
+// KD-tree over the rows of a Dataset, which must outlive it. Each node splits
+// its rows at the median of their widest dimension. Queries return exactly
+// what a brute-force scan would, including tie order.
+class KDTree {
+public:
+    explicit KDTree(const Dataset& data) : data_(data), order_(data.rows) {
+        std::iota(order_.begin(), order_.end(), size_t{0});
+        if (data.rows > 0) build(0, data.rows);
+    }
+
+    // The k rows nearest to point, nearest first, skipping row `exclude`
+    // (pass data.rows to skip none). Fills out with (squared distance, row).
+    void query(const double* point, size_t k, size_t exclude, std::vector<Neighbor>& out) const {
+        out.clear();
+        if (k > 0 && !nodes_.empty()) {
+            std::vector<double> offsets(data_.dim, 0.0);
+            search(0, point, k, exclude, out, 0.0, offsets);
+        }
+        std::sort_heap(out.begin(), out.end());
+    }
+
+private:
+    struct Node {
+        size_t begin;
+        size_t end;
+        size_t split_dim{0};
+        double split{0.0};
+        size_t left{0};   // 0 marks a leaf (the root is never a child)
+        size_t right{0};
+    };
+
+    size_t build(size_t begin, size_t end) {
+        const size_t id = nodes_.size();
+        nodes_.push_back(Node{begin, end});
+        if (end - begin <= KD_LEAF_ROWS) return id;
+
+        const size_t dim = data_.dim;
+        std::vector<double> lo(dim, std::numeric_limits<double>::max());
+        std::vector<double> hi(dim, std::numeric_limits<double>::lowest());
+        for (size_t i = begin; i < end; ++i) {
+            const double* x = data_.row(order_[i]);
+            for (size_t j = 0; j < dim; ++j) {
+                lo[j] = std::min(lo[j], x[j]);
+                hi[j] = std::max(hi[j], x[j]);
+            }
+        }
+        size_t split_dim = 0;
+        for (size_t j = 1; j < dim; ++j) {
+            if (hi[j] - lo[j] > hi[split_dim] - lo[split_dim]) split_dim = j;
+        }
+        if (hi[split_dim] <= lo[split_dim]) return id;  // all rows identical
+
+        const size_t mid = begin + (end - begin) / 2;
+        std::nth_element(
+            order_.begin() + static_cast<std::ptrdiff_t>(begin),
+            order_.begin() + static_cast<std::ptrdiff_t>(mid),
+            order_.begin() + static_cast<std::ptrdiff_t>(end),
+            [&](size_t a, size_t b) { return data_.row(a)[split_dim] < data_.row(b)[split_dim]; }
+        );
+        const double split = data_.row(order_[mid])[split_dim];
+        const size_t left = build(begin, mid);
+        const size_t right = build(mid, end);
+        Node& node = nodes_[id];
+        node.split_dim = split_dim;
+        node.split = split;
+        node.left = left;
+        node.right = right;
+        return id;
+    }
+
+    // out is a max-heap of the best k found so far. bound is a lower bound on
+    // the squared distance from point to any row under this node, built from
+    // per-dimension offsets to the splitting planes crossed on the way down
+    // (Arya and Mount's incremental distance).
+    void search(
+        size_t id,
+        const double* point,
+        size_t k,
+        size_t exclude,
+        std::vector<Neighbor>& out,
+        double bound,
+        std::vector<double>& offsets
+    ) const {
+        const Node& node = nodes_[id];
+        if (node.left == 0) {
+            for (size_t i = node.begin; i < node.end; ++i) {
+                const size_t row = order_[i];
+                if (row == exclude) continue;
+                const Neighbor candidate{euclidean_sq(point, data_.row(row), data_.dim), row};
+                if (out.size() < k) {
+                    out.push_back(candidate);
+                    std::push_heap(out.begin(), out.end());
+                } else if (candidate < out.front()) {
+                    std::pop_heap(out.begin(), out.end());
+                    out.back() = candidate;
+                    std::push_heap(out.begin(), out.end());
+                }
+            }
+            return;
+        }
+        const double diff = point[node.split_dim] - node.split;
+        const size_t near = diff < 0.0 ? node.left : node.right;
+        const size_t far = diff < 0.0 ? node.right : node.left;
+        search(near, point, k, exclude, out, bound, offsets);
+        const double previous = offsets[node.split_dim];
+        const double far_bound = bound - previous * previous + diff * diff;
+        // <= keeps rows at exactly the bound reachable, so ties match a scan.
+        if (out.size() < k || far_bound <= out.front().first) {
+            offsets[node.split_dim] = diff;
+            search(far, point, k, exclude, out, far_bound, offsets);
+            offsets[node.split_dim] = previous;
+        }
+    }
+
+    const Dataset& data_;
+    std::vector<size_t> order_;
+    std::vector<Node> nodes_;
+};
+
+// k nearest rows of tree's data for each of n points (n x dim), written as
+// n x k row indices and Euclidean distances. exclude (n entries, may be null)
+// names a row to skip per point, e.g. the point's own row.
+void query_neighbors(
+    const KDTree& tree,
+    const double* points,
+    size_t n,
+    size_t dim,
+    const std::int64_t* exclude,
+    size_t rows,
+    size_t k,
+    int threads,
+    std::int64_t* neighbors_out,
+    double* distances_out
+) {
+    parallel_blocks(n, threads, [&](size_t, size_t begin, size_t end) {
+        std::vector<Neighbor> found;
+        found.reserve(k);
+        for (size_t q = begin; q < end; ++q) {
+            const size_t skip = exclude ? static_cast<size_t>(exclude[q]) : rows;
+            tree.query(points + q * dim, k, skip, found);
+            for (size_t r = 0; r < k; ++r) {
+                neighbors_out[q * k + r] = r < found.size() ? static_cast<std::int64_t>(found[r].second) : -1;
+                distances_out[q * k + r] = r < found.size() ? std::sqrt(found[r].first)
+                                                            : std::numeric_limits<double>::quiet_NaN();
+            }
+        }
+    });
+}
+
+// ---- C API (shared library build) ----------------------------------------
+
+#if defined(_WIN32)
+#define KMEANS_API extern "C" __declspec(dllexport)
+#else
+#define KMEANS_API extern "C" __attribute__((visibility("default")))
+#endif
+
+struct KMeansFitInfo {
+    std::int32_t iterations;
+    std::int32_t converged;
+    std::uint64_t distance_evals;
+    std::uint64_t lloyd_evals;
+    double inertia;
+};
+
+struct KMeansSweepInfo {
+    std::int32_t k;
+    std::int32_t iterations;
+    std::int32_t converged;
+    std::int32_t reserved;
+    std::uint64_t distance_evals;
+    std::uint64_t lloyd_evals;
+    double inertia;
+    double silhouette;
+    double davies_bouldin;
+};
+
+struct KMeansWarmInfo {
+    std::int32_t iterations;
+    std::int32_t converged;
+    std::int32_t full_run;
+    std::int32_t reserved;
+    std::uint64_t reassigned;
+    std::uint64_t distance_evals;
+    std::uint64_t lloyd_evals;
+    double inertia;
+    double drift;
+    double silhouette;
+    double davies_bouldin;
+};
+
+struct NeighborIndex {
+    Dataset data;
+    std::unique_ptr<KDTree> tree;
+};
+
+namespace {
+thread_local std::string last_error;
+}
+
+KMEANS_API const char* kmeans_last_error() {
+    return last_error.c_str();
+}
+
+// Clusters a caller-owned rows x dim row-major float64 matrix in place (no
+// copy). Writes rows labels and k x dim centroids into caller buffers.
+// Returns 0 on success, -1 on error (see kmeans_last_error()).
+KMEANS_API int kmeans_fit(
+    const double* features,
+    std::int64_t rows,
+    std::int64_t dim,
+    std::int32_t k,
+    std::uint64_t seed,
+    std::int32_t max_iter,
+    double tol,
+    std::int32_t threads,
+    std::int32_t* labels_out,
+    double* centroids_out,
+    KMeansFitInfo* info
+) {
+    try {
+        if (!features || !labels_out || !centroids_out || rows <= 0 || dim <= 0) {
+            throw std::invalid_argument("features, labels and centroids must be non-empty buffers");
+        }
+        if (k <= 0 || max_iter <= 0 || tol < 0.0 || threads <= 0) {
+            throw std::invalid_argument("k, max_iter and threads must be positive and tol non-negative");
+        }
+        Dataset data;
+        data.rows = static_cast<size_t>(rows);
+        data.dim = static_cast<size_t>(dim);
+        data.features = features;
+
+        std::vector<double> centroids = initialize_centroids(data, k, seed, threads);
+        std::vector<int> labels;
+        KMeansStats stats = run_kmeans(data, centroids, labels, max_iter, tol, threads);
+
+        std::copy(labels.begin(), labels.end(), labels_out);
+        std::copy(centroids.begin(), centroids.end(), centroids_out);
+        if (info) {
+            info->iterations = stats.iterations;
+            info->converged = stats.converged ? 1 : 0;
+            info->distance_evals = stats.distance_evals;
+            info->lloyd_evals = stats.lloyd_evals;
+            info->inertia = stats.inertia;
+        }
+        return 0;
+    } catch (const std::exception& e) {
+        last_error = e.what();
+        return -1;
+    }
+}
+
+// Runs run_sweep() for k_min..k_max on a caller-owned matrix. For the i-th k
+// (k = k_min + i) writes rows labels at labels_out + i * rows, its k x dim
+// centroids after those of all smaller k, and infos[i].
+KMEANS_API int kmeans_sweep(
+    const double* features,
+    std::int64_t rows,
+    std::int64_t dim,
+    std::int32_t k_min,
+    std::int32_t k_max,
+    std::uint64_t seed,
+    std::int32_t max_iter,
+    double tol,
+    std::int32_t threads,
+    std::int64_t silhouette_sample,
+    std::int32_t* labels_out,
+    double* centroids_out,
+    KMeansSweepInfo* infos
+) {
+    try {
+        if (!features || !labels_out || !centroids_out || !infos || rows <= 0 || dim <= 0) {
+            throw std::invalid_argument("features, labels, centroids and infos must be non-empty buffers");
+        }
+        if (max_iter <= 0 || tol < 0.0 || threads <= 0 || silhouette_sample <= 0) {
+            throw std::invalid_argument("max_iter, threads and silhouette_sample must be positive and tol non-negative");
+        }
+        Dataset data;
+        data.rows = static_cast<size_t>(rows);
+        data.dim = static_cast<size_t>(dim);
+        data.features = features;
+
+        std::vector<SweepResult> results = run_sweep(
+            data, k_min, k_max, seed, max_iter, tol, threads, static_cast<size_t>(silhouette_sample)
+        );
+        for (size_t i = 0; i < results.size(); ++i) {
+            const SweepResult& r = results[i];
+            std::copy(r.labels.begin(), r.labels.end(), labels_out + i * data.rows);
+            centroids_out = std::copy(r.centroids.begin(), r.centroids.end(), centroids_out);
+            infos[i] = KMeansSweepInfo{
+                r.k, r.stats.iterations, r.stats.converged ? 1 : 0, 0,
+                r.stats.distance_evals, r.stats.lloyd_evals, r.stats.inertia,
+                r.silhouette, r.davies_bouldin,
+            };
+        }
+        return 0;
+    } catch (const std::exception& e) {
+        last_error = e.what();
+        return -1;
     }
 }
 
+// Warm start (run_warm_start) from k x dim centroids_in and per-row
+// labels_in (negative for new or changed rows). Writes final labels,
+// centroids and stats, scored like kmeans_sweep (silhouette on a sample of
+// silhouette_sample rows drawn with seed).
+KMEANS_API int kmeans_warm_start(
+    const double* features,
+    std::int64_t rows,
+    std::int64_t dim,
+    std::int32_t k,
+    const double* centroids_in,
+    const std::int32_t* labels_in,
+    std::int32_t max_iter,
+    double tol,
+    double drift_threshold,
+    std::int32_t threads,
+    std::int64_t silhouette_sample,
+    std::uint64_t seed,
+    std::int32_t* labels_out,
+    double* centroids_out,
+    KMeansWarmInfo* info
+) {
+    try {
+        if (!features || !centroids_in || !labels_in || !labels_out || !centroids_out || rows <= 0 || dim <= 0) {
+            throw std::invalid_argument("features, centroids, labels and outputs must be non-empty buffers");
+        }
+        if (k <= 0 || max_iter <= 0 || tol < 0.0 || drift_threshold < 0.0 || threads <= 0 || silhouette_sample <= 0) {
+            throw std::invalid_argument(
+                "k, max_iter, threads and silhouette_sample must be positive; tol and drift_threshold non-negative"
+            );
+        }
+        Dataset data;
+        data.rows = static_cast<size_t>(rows);
+        data.dim = static_cast<size_t>(dim);
+        data.features = features;
+
+        std::vector<double> centroids(centroids_in, centroids_in + static_cast<size_t>(k) * data.dim);
+        std::vector<int> labels(labels_in, labels_in + data.rows);
+        WarmStartStats warm = run_warm_start(data, centroids, labels, max_iter, tol, drift_threshold, threads);
+        std::vector<std::int64_t> sizes;
+        const double db = davies_bouldin(data, labels, centroids, sizes, threads);
+        const double silhouette = silhouette_score(
+            data, labels, k, sample_rows(data.rows, static_cast<size_t>(silhouette_sample), seed), threads
+        );
+
+        std::copy(labels.begin(), labels.end(), labels_out);
+        std::copy(centroids.begin(), centroids.end(), centroids_out);
+        if (info) {
+            *info = KMeansWarmInfo{
+                warm.stats.iterations, warm.stats.converged ? 1 : 0, warm.full_run ? 1 : 0, 0,
+                warm.reassigned, warm.stats.distance_evals, warm.stats.lloyd_evals, warm.stats.inertia,
+                warm.drift, silhouette, db,
+            };
+        }
+        return 0;
+    } catch (const std::exception& e) {
+        last_error = e.what();
+        return -1;
+    }
+}
+
+// Builds a KD-tree over a caller-owned rows x dim float64 matrix, which must
+// stay alive and unchanged until knn_index_free(). Returns null on error.
+KMEANS_API void* knn_index_build(const double* features, std::int64_t rows, std::int64_t dim) {
+    try {
+        if (!features || rows <= 0 || dim <= 0) {
+            throw std::invalid_argument("features must be a non-empty buffer");
+        }
+        auto index = std::make_unique<NeighborIndex>();
+        index->data.rows = static_cast<size_t>(rows);
+        index->data.dim = static_cast<size_t>(dim);
+        index->data.features = features;
+        index->tree = std::make_unique<KDTree>(index->data);
+        return index.release();
+    } catch (const std::exception& e) {
+        last_error = e.what();
+        return nullptr;
+    }
+}
+
+// The k nearest indexed rows of n query points (n x dim), nearest first, as
+// n x k row indices and distances. exclude may be null or hold one row per
+// point to leave out (its own row, when querying indexed rows). Slots beyond
+// the available rows get index -1 and distance NaN.
+KMEANS_API int knn_index_query(
+    void* index,
+    const double* points,
+    std::int64_t n,
+    const std::int64_t* exclude,
+    std::int32_t k,
+    std::int32_t threads,
+    std::int64_t* neighbors_out,
+    double* distances_out
+) {
+    try {
+        if (!index || !points || !neighbors_out || !distances_out || n < 0 || k <= 0 || threads <= 0) {
+            throw std::invalid_argument("index, points and output buffers are required; k and threads must be positive");
+        }
+        const auto* idx = static_cast<const NeighborIndex*>(index);
+        query_neighbors(
+            *idx->tree, points, static_cast<size_t>(n), idx->data.dim, exclude, idx->data.rows,
+            static_cast<size_t>(k), threads, neighbors_out, distances_out
+        );
+        return 0;
+    } catch (const std::exception& e) {
+        last_error = e.what();
+        return -1;
+    }
+}
+
+KMEANS_API void knn_index_free(void* index) {
+    delete static_cast<NeighborIndex*>(index);
+}
+
+#ifndef KMEANS_LIBRARY
+
+// Peak resident set size of this process in MiB, or -1 if unknown. Linux
+// VmHWM belongs to the current address space, so unlike ru_maxrss it does not
+// include the parent process's memory before exec.
+double peak_rss_mib() {
+#ifndef _WIN32
+    std::ifstream status("/proc/self/status");
+    std::string line;
+    while (std::getline(status, line)) {
+        if (line.rfind("VmHWM:", 0) == 0) {
+            return std::stod(line.substr(6)) / 1024.0;  // kB
+        }
+    }
+    struct rusage usage;
+    if (getrusage(RUSAGE_SELF, &usage) == 0) {
+#ifdef __APPLE__
+        return usage.ru_maxrss / (1024.0 * 1024.0);  // bytes
+#else
+        return usage.ru_maxrss / 1024.0;  // KiB
+#endif
+    }
+#endif
+    return -1.0;
+}
+
+void print_peak_rss() {
+    const double peak = peak_rss_mib();
+    if (peak >= 0.0) {
+        std::cout << "Peak RSS: " << peak << " MiB\n";
+    }
+}
+
+// User plus system CPU seconds of all of this process's threads.
+double process_cpu_seconds() {
+#ifndef _WIN32
+    struct rusage usage;
+    if (getrusage(RUSAGE_SELF, &usage) == 0) {
+        return usage.ru_utime.tv_sec + usage.ru_stime.tv_sec +
+               (usage.ru_utime.tv_usec + usage.ru_stime.tv_usec) / 1e6;
+    }
+#endif
+    return static_cast<double>(std::clock()) / CLOCKS_PER_SEC;
+}
+
+// Times consecutive phases of a CLI run; report() prints the METRICS line of
+// the phase that just ended and starts the next one.
+class PhaseTimer {
+public:
+    PhaseTimer() : wall_start_(std::chrono::steady_clock::now()), cpu_start_(process_cpu_seconds()) {}
+
+    void report(const char* phase, size_t rows) {
+        const auto now = std::chrono::steady_clock::now();
+        const double cpu = process_cpu_seconds();
+        const double peak = peak_rss_mib();
+        std::ostringstream line;
+        line << "METRICS {\"phase\": \"" << phase << "\", \"rows\": " << rows
+             << ", \"wall_seconds\": " << std::chrono::duration<double>(now - wall_start_).count()
+             << ", \"cpu_seconds\": " << cpu - cpu_start_ << ", \"peak_rss_mib\": ";
+        if (peak >= 0.0) line << peak;
+        else line << "null";
+        line << "}\n";
+        std::cout << line.str();
+        wall_start_ = now;
+        cpu_start_ = cpu;
+    }
+
+private:
+    std::chrono::steady_clock::time_point wall_start_;
+    double cpu_start_;
+};
+
+void usage(const char* prog) {
+    std::cerr << "Usage: " << prog << " [k] [--seed N] [--max-iter N] [--tol X] [--threads N]"
+              << " [--input PATH] [--output PATH] [--minibatch [--batch-size N] [--epochs N] [--refine N]]"
+              << " [--sweep MIN:MAX [--silhouette-sample N]] [--neighbors K]\n";
+}
+
 int main(int argc, char* argv[]) {
     int k = 5;
-    if (argc > 1) {
-        k = std::stoi(argv[1]);
-        if (k <= 0) {
-            std::cerr << "k must be positive\n";
-            return 1;
+    std::uint64_t seed = 42;
+    int max_iter = 300;
+    double tol = 1e-6;
+    int threads = static_cast<int>(std::max(1u, std::thread::hardware_concurrency()));
+    std::filesystem::path features_path;
+    std::filesystem::path output_path;
+    bool minibatch = false;
+    long long batch_size = 4096;
+    int epochs = 20;
+    int refine = 50;
+    int k_min = 0;
+    int k_max = 0;
+    long long silhouette_sample = static_cast<long long>(SILHOUETTE_SAMPLE);
+    int neighbors = 0;
+
+    try {
+        for (int i = 1; i < argc; ++i) {
+            std::string arg = argv[i];
+            if ((arg == "--seed" || arg == "--max-iter" || arg == "--tol" || arg == "--threads" ||
+                 arg == "--input" || arg == "--output" || arg == "--batch-size" || arg == "--epochs" || arg == "--refine" || arg == "--sweep" ||
+                 arg == "--silhouette-sample" || arg == "--neighbors") && i + 1 < argc) {
+                std::string value = argv[++i];
+                if (arg == "--seed") seed = std::stoull(value);
+                else if (arg == "--max-iter") max_iter = std::stoi(value);
+                else if (arg == "--tol") tol = std::stod(value);
+                else if (arg == "--threads") threads = std::stoi(value);
+                else if (arg == "--input") features_path = value;
+                else if (arg == "--output") output_path = value;
+                else if (arg == "--batch-size") batch_size = std::stoll(value);
+                else if (arg == "--silhouette-sample") silhouette_sample = std::stoll(value);
+                else if (arg == "--neighbors") neighbors = std::stoi(value);
+                else if (arg == "--refine") refine = std::stoi(value);
+                else if (arg == "--sweep") {
+                    const size_t colon = value.find(':');
+                    if (colon == std::string::npos) throw std::invalid_argument("--sweep expects MIN:MAX");
+                    k_min = std::stoi(value.substr(0, colon));
+                    k_max = std::stoi(value.substr(colon + 1));
+                }
+                else epochs = std::stoi(value);
+            } else if (arg == "--minibatch") {
+                minibatch = true;
+            } else if (!arg.empty() && arg[0] != '-') {
+                k = std::stoi(arg);
+            } else {
+                usage(argv[0]);
+                return 1;
+            }
         }
+    } catch (const std::exception&) {
+        usage(argv[0]);
+        return 1;
+    }
+    if (k <= 0) {
+        std::cerr << "k must be positive\n";
+        return 1;
+    }
+    if (max_iter <= 0 || tol < 0.0 || threads <= 0 || batch_size <= 0 || epochs <= 0 || silhouette_sample <= 0) {
+        std::cerr << "max-iter, threads, batch-size, epochs and silhouette-sample must be positive and tol non-negative\n";
+        return 1;
+    }
+    const bool sweep = k_max > 0;
+    if (sweep && (k_min < 2 || k_max < k_min)) {
+        std::cerr << "--sweep needs 2 <= MIN <= MAX\n";
+        return 1;
+    }
+    if ((sweep ? 1 : 0) + (minibatch ? 1 : 0) + (neighbors != 0 ? 1 : 0) > 1) {
+        std::cerr << "--sweep, --minibatch and --neighbors cannot be combined\n";
+        return 1;
+    }
+    if (neighbors < 0) {
+        std::cerr << "--neighbors must be positive\n";
+        return 1;
+    }
+    if (refine < 0) {
+        std::cerr << "--refine must not be negative\n";
+        return 1;
     }
-    const int iterations = 20;
 
-    std::filesystem::path features_path = resolve_data_path("features_for_clustering.csv");
+    if (features_path.empty()) {
+        features_path = resolve_data_path("features_for_clustering.bin");
+        if (!std::filesystem::exists(features_path)) {
+            features_path = resolve_data_path("features_for_clustering.csv");
+        }
+    }
     if (!std::filesystem::exists(features_path)) {
-        std::cerr << "Could not find features CSV at " << features_path << "\n";
+        std::cerr << "Could not find features at " << features_path << "\n";
         return 1;
     }
+    if (output_path.empty() && neighbors > 0) {
+        output_path = resolve_data_path("similar_games.csv");
+    } else if (output_path.empty()) {
+        output_path = resolve_data_path(is_binary_path(features_path) ? "cluster_labels.bin" : "cluster_output.csv");
+    }
 
-    auto points = read_csv(features_path);
-    if (points.empty()) {
+    if (minibatch) {
+        if (!is_binary_path(features_path)) {
+            std::cerr << "--minibatch needs a binary (.bin) feature file\n";
+            return 1;
+        }
+        try {
+            PhaseTimer timer;
+            FeatureReader reader(features_path);
+            if (reader.rows() == 0) {
+                std::cerr << "No data points found.\n";
+                return 1;
+            }
+            std::vector<double> centroids;
+            KMeansStats stats = run_minibatch(
+                reader, centroids, k, seed, static_cast<size_t>(batch_size), epochs, threads
+            );
+            timer.report("fit", reader.rows());
+            const int refine_passes = refine_minibatch(
+                reader, centroids, static_cast<size_t>(batch_size), refine, tol, threads, stats
+            );
+            timer.report("refine", reader.rows());
+            stats.inertia = write_minibatch_labels(reader, centroids, static_cast<size_t>(batch_size), threads, output_path);
+            timer.report("write", reader.rows());
+            std::cout << "Points: " << reader.rows() << "\n";
+            std::cout << "Features per point: " << reader.dim() << "\n";
+            std::cout << "Clusters: " << k << "\n";
+            std::cout << "Seed: " << seed << "\n";
+            std::cout << "Threads: " << threads << "\n";
+            std::cout << "Mode: mini-batch (batch size " << batch_size << ")\n";
+            std::cout << "Batches: " << stats.iterations
+                      << (stats.converged ? " (converged)" : " (epoch limit reached)") << "\n";
+            std::cout << "Refinement passes: " << refine_passes << "\n";
+            std::cout << "Inertia: " << stats.inertia << "\n";
+            print_peak_rss();
+            std::cout << "Wrote clusters to: " << output_path << "\n";
+        } catch (const std::exception& e) {
+            std::cerr << e.what() << "\n";
+            return 1;
+        }
+        return 0;
+    }
+
+    PhaseTimer timer;
+    Dataset data;
+    try {
+        data = read_features(features_path);
+    } catch (const std::exception& e) {
+        std::cerr << e.what() << "\n";
+        return 1;
+    }
+    if (data.rows == 0) {
         std::cerr << "No data points found.\n";
         return 1;
     }
-    size_t dim = points.front().features.size();
+    timer.report("load", data.rows);
 
-    auto centroids = initialize_centroids(points, k);
+    if (neighbors > 0) {
+        const size_t k_nn = std::min(static_cast<size_t>(neighbors), data.rows - 1);
+        std::vector<std::int64_t> self(data.rows);
+        std::iota(self.begin(), self.end(), std::int64_t{0});
+        std::vector<std::int64_t> found(data.rows * k_nn);
+        std::vector<double> distances(data.rows * k_nn);
+        if (k_nn > 0) {
+            KDTree tree(data);
+            timer.report("build_index", data.rows);
+            query_neighbors(tree, data.features, data.rows, data.dim, self.data(), data.rows, k_nn, threads,
+                            found.data(), distances.data());
+            timer.report("query", data.rows);
+        }
 
-    for (int iter = 0; iter < iterations; ++iter) {
-        assign_clusters(points, centroids);
-        centroids = update_centroids(points, k, dim);
+        std::ofstream out(output_path);
+        if (!out.is_open()) {
+            std::cerr << "Failed to write: " << output_path << "\n";
+            return 1;
+        }
+        out << "game_id,neighbor_id,rank,distance\n";
+        out.precision(17);
+        for (size_t i = 0; i < data.rows; ++i) {
+            for (size_t r = 0; r < k_nn; ++r) {
+                out << data.ids[i] << "," << data.ids[found[i * k_nn + r]] << "," << r + 1 << ","
+                    << distances[i * k_nn + r] << "\n";
+            }
+        }
+        out.close();
+        timer.report("write", data.rows * k_nn);
+        std::cout << "Points: " << data.rows << "\n";
+        std::cout << "Features per point: " << data.dim << "\n";
+        std::cout << "Threads: " << threads << "\n";
+        std::cout << "Mode: nearest neighbours (KD-tree, " << k_nn << " per game)\n";
+        print_peak_rss();
+        std::cout << "Wrote neighbours to: " << output_path << "\n";
+        return 0;
     }
 
-    std::filesystem::path output_path = resolve_data_path("cluster_output.csv");
-    write_clusters(points, output_path);
+    if (sweep) {
+        std::vector<SweepResult> results;
+        try {
+            results = run_sweep(data, k_min, k_max, seed, max_iter, tol, threads, static_cast<size_t>(silhouette_sample));
+        } catch (const std::exception& e) {
+            std::cerr << e.what() << "\n";
+            return 1;
+        }
+        timer.report("sweep", data.rows);
+        const SweepResult& best = best_by_silhouette(results);
+        write_clusters(data, best.labels, output_path);
+        timer.report("write", data.rows);
 
-    std::cout << "Points: " << points.size() << "\n";
-    std::cout << "Features per point: " << dim << "\n";
+        std::cout << "Points: " << data.rows << "\n";
+        std::cout << "Features per point: " << data.dim << "\n";
+        std::cout << "Seed: " << seed << "\n";
+        std::cout << "Threads: " << threads << "\n";
+        std::cout << "Mode: k sweep " << k_min << ".." << k_max << " (silhouette on "
+                  << std::min(data.rows, static_cast<size_t>(silhouette_sample)) << " sampled rows)\n";
+        for (const auto& r : results) {
+            std::cout << "k=" << r.k << ": inertia " << r.stats.inertia << ", silhouette " << r.silhouette
+                      << ", Davies-Bouldin " << r.davies_bouldin << ", iterations " << r.stats.iterations
+                      << (r.stats.converged ? " (converged)" : " (max-iter reached)") << "\n";
+            std::cout << "  sizes:";
+            for (auto size : r.sizes) std::cout << " " << size;
+            std::cout << "\n";
+            for (int c = 0; c < r.k; ++c) {
+                std::cout << "  centroid " << c << " (scaled):";
+                for (size_t j = 0; j < data.dim; ++j) std::cout << " " << r.centroids[c * data.dim + j];
+                std::cout << "\n";
+            }
+        }
+        std::cout << "Chosen k: " << best.k << " (highest silhouette)\n";
+        std::cout << "Inertia: " << best.stats.inertia << "\n";
+        print_peak_rss();
+        std::cout << "Wrote clusters to: " << output_path << "\n";
+        return 0;
+    }
+
+    std::vector<double> centroids = initialize_centroids(data, k, seed, threads);
+    timer.report("seed", data.rows);
+    std::vector<int> labels;
+    KMeansStats stats = run_kmeans(data, centroids, labels, max_iter, tol, threads);
+    timer.report("fit", data.rows);
+
+    write_clusters(data, labels, output_path);
+    timer.report("write", data.rows);
+
+    const std::uint64_t saved = stats.lloyd_evals > stats.distance_evals ? stats.lloyd_evals - stats.distance_evals : 0;
+    std::cout << "Points: " << data.rows << "\n";
+    std::cout << "Features per point: " << data.dim << "\n";
     std::cout << "Clusters: " << k << "\n";
-    std::cout << "Iterations: " << iterations << "\n";
+    std::cout << "Seed: " << seed << "\n";
+    std::cout << "Threads: " << threads << "\n";
+    std::cout << "Iterations: " << stats.iterations
+              << (stats.converged ? " (converged)" : " (max-iter reached)") << "\n";
+    std::cout << "Inertia: " << stats.inertia << "\n";
+    std::cout << "Distance evaluations: " << stats.distance_evals << " of " << stats.lloyd_evals
+              << " for plain Lloyd (" << saved << " saved, "
+              << (stats.lloyd_evals ? 100.0 * saved / stats.lloyd_evals : 0.0) << "%)\n";
+    print_peak_rss();
     std::cout << "Wrote clusters to: " << output_path << "\n";
 
     return 0;
 }
+
+#endif  // KMEANS_LIBRARY
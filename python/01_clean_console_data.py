@@ -1,6 +1,7 @@
 """01_clean_console_data.py
 
-Cleans data/Console_Data.csv and writes data/clean_console_data.csv.
+Cleans data/Console_Data.csv and writes data/clean_console_data.csv (or the
+.parquet/.feather equivalent, see storage.py).
 
 Operations:
 - rename columns to snake_case
@@ -9,11 +10,26 @@ Operations:
 - add global_sales as sum of sales columns
 - drop rows missing name or genre
 - print raw and cleaned shapes
+
+With --chunksize N the file is cleaned in batches of N rows and the output is
+appended batch by batch, so memory stays bounded by the batch size. A first
+pass over the file works out which columns are entirely empty and the dtype
+each column gets in a whole-file read, so the streamed output is identical to
+the in-memory one.
+
+The file's delimiter, encoding, quoting and trailing empty columns are
+sniffed once (see ingest.py) and printed; both paths parse with them.
 """
 from pathlib import Path
+from typing import Optional
+import argparse
 import re
 import pandas as pd
 
+from ingest import Dialect, read_raw, sniff
+from instrumentation import record_rows, stage_main, step
+from storage import TableWriter, write_table
+
 
 def to_snake(name: str) -> str:
     """Convert a column name to snake_case."""
@@ -24,20 +40,8 @@ def to_snake(name: str) -> str:
     return s.strip("_").lower()
 
 
-def main() -> None:
-    repo_root = Path(__file__).resolve().parent.parent
-    data_dir = repo_root / "data"
-
-    console_in = data_dir / "Console_Data.csv"
-    console_out = data_dir / "clean_console_data.csv"
-
-    if not console_in.exists():
-        raise FileNotFoundError(f"Console data file not found: {console_in}")
-
-    # read (source is tab-delimited with trailing empty columns)
-    raw_df = pd.read_csv(console_in, sep="\t").dropna(axis=1, how="all")
-    print(f"Raw shape: {raw_df.shape}")
-
+def clean_frame(raw_df: pd.DataFrame) -> pd.DataFrame:
+    """Apply the row-wise cleaning steps to a raw frame (or batch of rows)."""
     # rename columns to snake_case
     df = raw_df.rename(columns={c: to_snake(c) for c in raw_df.columns})
 
@@ -62,12 +66,106 @@ def main() -> None:
     if req:
         df = df.dropna(subset=req)
 
-    print(f"Cleaned shape: {df.shape}")
+    return df
+
+
+def scan_columns(path: Path, dialect: Dialect, chunksize: int) -> dict:
+    """First streaming pass: the dtype of every column that holds any value.
+
+    Columns that are empty throughout the file are left out, mirroring
+    dropna(axis=1, how="all") on the whole file. Dtypes are unified across
+    batches the way a whole-file read would infer them.
+    """
+    kinds: dict = {}
+    has_null: dict = {}
+    for chunk in read_raw(path, dialect, chunksize=chunksize):
+        for col in chunk.columns:
+            values = chunk[col]
+            nulls = values.isna()
+            has_null[col] = has_null.get(col, False) or bool(nulls.any())
+            kinds.setdefault(col, set())
+            if not nulls.all():
+                kinds[col].add(values.dtype.kind)
+
+    dtypes = {}
+    for col, seen in kinds.items():
+        if not seen:
+            continue
+        if seen == {"i"} and not has_null[col]:
+            dtypes[col] = "int64"
+        elif seen <= {"i", "f"}:
+            dtypes[col] = "float64"
+        elif seen == {"b"} and not has_null[col]:
+            dtypes[col] = "bool"
+        else:
+            dtypes[col] = "object"
+    return dtypes
+
+
+def clean_streaming(path: Path, dialect: Dialect, data_dir: Path, chunksize: int) -> tuple:
+    """Clean ``path`` batch by batch, appending to clean_console_data.
+
+    Returns (raw shape, cleaned row count, output path).
+    """
+    with step("scan_columns"):
+        dtypes = scan_columns(path, dialect, chunksize)
+    raw_rows = 0
+    with step("clean_batches") as s, TableWriter(data_dir, "clean_console_data") as writer:
+        reader = read_raw(path, dialect, usecols=list(dtypes), dtype=dtypes, chunksize=chunksize)
+        for chunk in reader:
+            raw_rows += len(chunk)
+            writer.write(clean_frame(chunk))
+    s.rows_in, s.rows_out = raw_rows, writer.rows
+    return (raw_rows, len(dtypes)), writer.rows, writer.path
+
+
+@stage_main
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Clean data/Console_Data.csv.")
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="stream the file in batches of this many rows (default: load it whole)",
+    )
+    args = parser.parse_args(argv)
+
+    repo_root = Path(__file__).resolve().parent.parent
+    data_dir = repo_root / "data"
+
+    console_in = data_dir / "Console_Data.csv"
+
+    if not console_in.exists():
+        raise FileNotFoundError(f"Console data file not found: {console_in}")
 
     # ensure data directory exists
     data_dir.mkdir(parents=True, exist_ok=True)
 
-    df.to_csv(console_out, index=False)
+    dialect = sniff(console_in)
+    print(f"Dialect: {dialect.describe()}")
+
+    if args.chunksize:
+        raw_shape, cleaned_rows, console_out = clean_streaming(console_in, dialect, data_dir, args.chunksize)
+        record_rows(raw_shape[0], cleaned_rows)
+        print(f"Raw shape: {raw_shape}")
+        print(f"Cleaned rows: {cleaned_rows} (streamed in batches of {args.chunksize})")
+        print(f"Wrote cleaned console data to: {console_out}")
+        return
+
+    with step("read") as s:
+        raw_df = read_raw(console_in, dialect).dropna(axis=1, how="all")
+        s.rows_out = len(raw_df)
+    print(f"Raw shape: {raw_df.shape}")
+
+    with step("clean", rows_in=len(raw_df)) as s:
+        df = clean_frame(raw_df)
+        s.rows_out = len(df)
+
+    print(f"Cleaned shape: {df.shape}")
+
+    with step("write", rows_in=len(df)):
+        console_out = write_table(df, data_dir, "clean_console_data")
+    record_rows(len(raw_df), len(df))
     print(f"Wrote cleaned console data to: {console_out}")
 
 
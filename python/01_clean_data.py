@@ -6,12 +6,18 @@ Loads and cleans console and population CSVs and writes cleaned CSVs.
   drop rows missing name or genre.
 - Population: reshape from wide to long with columns: country_name, country_code, year, population.
 
+Both files are read through ingest.read_raw(), with the delimiter, encoding and quoting
+sniffed once and printed, and parsed a single time.
+
 Saves outputs to data/clean_console_data.csv and data/clean_population_data.csv
 """
 from pathlib import Path
 import re
 import pandas as pd
 
+from ingest import Dialect, read_raw, sniff
+from instrumentation import record_rows, stage_main, step
+
 
 def to_snake(name: str) -> str:
     """Convert a column name to snake_case."""
@@ -25,8 +31,8 @@ def to_snake(name: str) -> str:
     return s
 
 
-def clean_console_data(path: Path) -> pd.DataFrame:
-    df = pd.read_csv(path)
+def clean_console_data(path: Path, dialect: Dialect) -> pd.DataFrame:
+    df = read_raw(path, dialect)
 
     # rename columns to snake_case
     df = df.rename(columns={col: to_snake(col) for col in df.columns})
@@ -49,27 +55,9 @@ def clean_console_data(path: Path) -> pd.DataFrame:
     return df
 
 
-def clean_population_data(path: Path) -> pd.DataFrame:
-    import csv
-
-    # try several reasonable parsing modes until one succeeds
-    parse_attempts = [('\t', csv.QUOTE_MINIMAL), ('\t', csv.QUOTE_NONE), (',', csv.QUOTE_MINIMAL)]
-    df = None
-    for sep, quoting in parse_attempts:
-        try:
-            df = pd.read_csv(path, sep=sep, engine="python", encoding='utf-8-sig', quoting=quoting)
-            break
-        except Exception:
-            df = None
-            continue
-    if df is None:
-        # last-resort: read whole file and split on whitespace-like tabs
-        text = Path(path).read_text(encoding='utf-8-sig')
-        # replace Windows line endings
-        text = text.replace('\r\n', '\n').replace('\r', '\n')
-        # build dataframe from lines splitting on tabs
-        rows = [line.split('\t') for line in text.split('\n') if line.strip()]
-        df = pd.DataFrame(rows[1:], columns=rows[0])
+def clean_population_data(path: Path, dialect: Dialect) -> pd.DataFrame:
+    # one parse with the sniffed delimiter, encoding and quoting
+    df = read_raw(path, dialect)
 
     # normalize column names: strip and remove surrounding quotes
     df.columns = [str(c).strip().strip('"').strip("'") for c in df.columns]
@@ -114,6 +102,7 @@ def clean_population_data(path: Path) -> pd.DataFrame:
     return pop
 
 
+@stage_main
 def main() -> None:
     base = Path(__file__).resolve().parent.parent
     data_dir = base / "data"
@@ -129,14 +118,25 @@ def main() -> None:
     if not population_in.exists():
         raise FileNotFoundError(f"Population data file not found: {population_in}")
 
-    console_df = clean_console_data(console_in)
-    population_df = clean_population_data(population_in)
+    console_dialect = sniff(console_in)
+    print(f"Console dialect: {console_dialect.describe()}")
+    population_dialect = sniff(population_in)
+    print(f"Population dialect: {population_dialect.describe()}")
+
+    with step("clean_console") as s:
+        console_df = clean_console_data(console_in, console_dialect)
+        s.rows_out = len(console_df)
+    with step("clean_population") as s:
+        population_df = clean_population_data(population_in, population_dialect)
+        s.rows_out = len(population_df)
 
     # ensure data directory exists
     data_dir.mkdir(parents=True, exist_ok=True)
 
-    console_df.to_csv(console_out, index=False)
-    population_df.to_csv(population_out, index=False)
+    with step("write", rows_in=len(console_df) + len(population_df)):
+        console_df.to_csv(console_out, index=False)
+        population_df.to_csv(population_out, index=False)
+    record_rows(rows_out=len(console_df) + len(population_df))
 
     print(f"Wrote cleaned console data to: {console_out}")
     print(f"Wrote cleaned population data to: {population_out}")
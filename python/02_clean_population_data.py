@@ -1,43 +1,55 @@
 """02_clean_population_data.py
 
-Convert wide Population.csv into a long, tidy table.
+Convert wide Population.csv into a long, tidy table. The file is parsed once
+with the dialect sniffed by ingest.py, which is printed.
 """
 from pathlib import Path
 import pandas as pd
 
+from ingest import read_raw, sniff
+from instrumentation import record_rows, stage_main, step
+from storage import write_table
 
+
+@stage_main
 def main() -> None:
     repo_root = Path(__file__).resolve().parent.parent
     data_dir = repo_root / "data"
 
     population_in = data_dir / "Population.csv"
-    population_out = data_dir / "clean_population_data.csv"
 
     if not population_in.exists():
         raise FileNotFoundError(f"Population data file not found: {population_in}")
 
-    # Source file is tab-delimited.
-    df = pd.read_csv(population_in, sep="\t")
-
-    long_df = df.melt(
-        id_vars=["Country Name", "Country Code"],
-        var_name="year",
-        value_name="population",
-    )
-
-    long_df = long_df.rename(
-        columns={
-            "Country Name": "country_name",
-            "Country Code": "country_code",
-        }
-    )
-
-    long_df["year"] = pd.to_numeric(long_df["year"], errors="coerce").astype("Int64")
-    long_df["population"] = pd.to_numeric(long_df["population"], errors="coerce")
-
-    long_df = long_df.dropna(subset=["population"])
-
-    long_df.to_csv(population_out, index=False)
+    dialect = sniff(population_in)
+    print(f"Dialect: {dialect.describe()}")
+    with step("read") as s:
+        df = read_raw(population_in, dialect)
+        s.rows_out = len(df)
+
+    with step("melt", rows_in=len(df)) as s:
+        long_df = df.melt(
+            id_vars=["Country Name", "Country Code"],
+            var_name="year",
+            value_name="population",
+        )
+
+        long_df = long_df.rename(
+            columns={
+                "Country Name": "country_name",
+                "Country Code": "country_code",
+            }
+        )
+
+        long_df["year"] = pd.to_numeric(long_df["year"], errors="coerce").astype("Int64")
+        long_df["population"] = pd.to_numeric(long_df["population"], errors="coerce")
+
+        long_df = long_df.dropna(subset=["population"])
+        s.rows_out = len(long_df)
+
+    with step("write", rows_in=len(long_df)):
+        population_out = write_table(long_df, data_dir, "clean_population_data")
+    record_rows(len(df), len(long_df))
     print(f"Wrote cleaned population data to: {population_out}")
 
 
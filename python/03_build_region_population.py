@@ -1,103 +1,107 @@
 """03_build_region_population.py
 
-Aggregate yearly population by broad regions: North America, Europe, Japan, Other.
+Aggregate yearly population by region for every region scheme in
+data/region_schemes.csv (scheme, country_code, region):
+- vendor: North America, Europe, Japan, Other, the regions of the console
+  sales data, written to region_population_by_year for stages 04 and 05
+- un_m49: UN M49 continents
+- sales_territories: NA, LATAM, EMEA, Japan, APAC
+Every other scheme is written to region_population_<scheme>, one
+<region>_population column per region in the order the file lists them.
+
+A country_code of "*" names the region for countries the scheme does not list
+(the vendor scheme's "other"). Without one, unlisted codes are left out, which
+keeps the World Bank aggregates (WLD, EUU, ...) from being counted twice.
+
+The population rows are read and summed once, into a country x year matrix;
+each scheme is then an integer lookup from country to region over that matrix,
+so adding a scheme does not add a pass over the data.
 """
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
+from instrumentation import stage_main, step
+from storage import read_table, write_table
 
+VENDOR_SCHEME = "vendor"
+DEFAULT_COUNTRY = "*"
+
+
+def normalize_codes(codes: pd.Series) -> pd.Series:
+    return codes.astype(str).str.strip().str.upper()
+
+
+def load_schemes(path: Path) -> pd.DataFrame:
+    if not path.exists():
+        raise FileNotFoundError(f"Region schemes not found: {path}")
+    schemes = pd.read_csv(path, dtype=str, keep_default_na=False)
+    schemes["country_code"] = normalize_codes(schemes["country_code"])
+    duplicated = schemes.duplicated(["scheme", "country_code"])
+    if duplicated.any():
+        first = schemes[duplicated].iloc[0]
+        raise RuntimeError(f"Country {first['country_code']} is mapped twice in region scheme {first['scheme']}")
+    return schemes
+
+
+def country_year_totals(df: pd.DataFrame) -> tuple:
+    """(country codes, years, countries x years population matrix) in one pass."""
+    countries = pd.Categorical(normalize_codes(df["country_code"]))
+    year_index, years = pd.factorize(df["year"], sort=True)
+    n_countries, n_years = len(countries.categories), len(years)
+    totals = np.bincount(
+        countries.codes.astype(np.int64) * n_years + year_index,
+        weights=df["population"].to_numpy(dtype=np.float64),
+        minlength=n_countries * n_years,
+    ).reshape(n_countries, n_years)
+    return countries.categories, years, totals
+
+
+def roll_up(mapping: pd.DataFrame, countries: pd.Index, years, totals: np.ndarray) -> pd.DataFrame:
+    """year plus one <region>_population column per region of one scheme."""
+    regions = list(dict.fromkeys(mapping["region"]))
+    region_ids = mapping["region"].map({r: i for i, r in enumerate(regions)}).to_numpy()
+    default = region_ids[(mapping["country_code"] == DEFAULT_COUNTRY).to_numpy()]
+
+    lookup = np.full(len(countries), default[0] if len(default) else -1, dtype=np.int64)
+    positions = countries.get_indexer(mapping["country_code"])
+    listed = positions >= 0
+    lookup[positions[listed]] = region_ids[listed]
+
+    by_region = np.zeros((len(regions), len(years)))
+    included = lookup >= 0
+    np.add.at(by_region, lookup[included], totals[included])
+
+    out = pd.DataFrame(by_region.T, columns=[f"{r}_population" for r in regions])
+    out.insert(0, "year", years)
+    return out
+
+
+@stage_main
 def main() -> None:
     repo_root = Path(__file__).resolve().parent.parent
     data_dir = repo_root / "data"
 
-    population_in = data_dir / "clean_population_data.csv"
-    population_out = data_dir / "region_population_by_year.csv"
-
-    if not population_in.exists():
-        raise FileNotFoundError(f"Clean population file not found: {population_in}")
-
-    df = pd.read_csv(population_in)
-
-    # Define regions as ISO country-code sets. Any country not in these sets
-    # will roll up into "Other".
-    north_america = {"USA", "US", "CAN", "MEX"}
-    europe = {
-        "GBR",
-        "DEU",
-        "FRA",
-        "ESP",
-        "ITA",
-        "NLD",
-        "BEL",
-        "CHE",
-        "AUT",
-        "SWE",
-        "NOR",
-        "DNK",
-        "FIN",
-        "IRL",
-        "PRT",
-        "GRC",
-        "POL",
-        "CZE",
-        "HUN",
-        "ROU",
-        "BGR",
-        "SVK",
-        "SVN",
-        "HRV",
-        "EST",
-        "LVA",
-        "LTU",
-        "UKR",
-        "RUS",
-        "TUR",
-    }
-    japan = {"JPN"}
-
-    def normalize_code(code: str) -> str:
-        return str(code).strip().upper()
-
-    def to_region(code: str) -> str:
-        c = normalize_code(code)
-        if c in north_america:
-            return "na"
-        if c in europe:
-            return "eu"
-        if c in japan:
-            return "jp"
-        return "other"
-
-    df["year"] = pd.to_numeric(df["year"], errors="coerce").astype("Int64")
-    df["population"] = pd.to_numeric(df["population"], errors="coerce")
-    df = df.dropna(subset=["year", "population"])
-
-    df["region"] = df["country_code"].map(to_region)
-
-    grouped = (
-        df.groupby(["year", "region"], as_index=False)["population"]
-        .sum()
-        .pivot(index="year", columns="region", values="population")
-        .fillna(0)
-    )
-
-    final = (
-        grouped.reindex(columns=["na", "eu", "jp", "other"], fill_value=0)
-        .reset_index()
-        .rename(
-            columns={
-                "year": "year",
-                "na": "na_population",
-                "eu": "eu_population",
-                "jp": "jp_population",
-                "other": "other_population",
-            }
-        )
-        .sort_values("year")
-    )
-
-    final.to_csv(population_out, index=False)
-    print(f"Wrote region population totals to: {population_out}")
+    schemes = load_schemes(data_dir / "region_schemes.csv")
+    if VENDOR_SCHEME not in set(schemes["scheme"]):
+        raise RuntimeError(f"Region scheme {VENDOR_SCHEME!r} missing from {data_dir / 'region_schemes.csv'}")
+
+    with step("read") as s:
+        df = read_table(data_dir, "clean_population_data", columns=["country_code", "year", "population"])
+        df["year"] = pd.to_numeric(df["year"], errors="coerce").astype("Int64")
+        df["population"] = pd.to_numeric(df["population"], errors="coerce")
+        df = df.dropna(subset=["year", "population"])
+        s.rows_out = len(df)
+
+    with step("country_year_totals", rows_in=len(df)):
+        countries, years, totals = country_year_totals(df)
+    for scheme, mapping in schemes.groupby("scheme", sort=False):
+        stem = "region_population_by_year" if scheme == VENDOR_SCHEME else f"region_population_{scheme}"
+        with step(f"roll_up.{scheme}", rows_in=len(countries)) as s:
+            out = roll_up(mapping, countries, years, totals)
+            population_out = write_table(out, data_dir, stem)
+            s.rows_out = len(out)
+        print(f"Wrote {scheme} region population totals to: {population_out}")
 
 
 if __name__ == "__main__":
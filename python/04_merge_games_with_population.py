@@ -5,22 +5,19 @@ Merge console sales data with regional population by release year.
 from pathlib import Path
 import pandas as pd
 
+from instrumentation import record_rows, stage_main, step
+from storage import read_table, write_table
 
+
+@stage_main
 def main() -> None:
     repo_root = Path(__file__).resolve().parent.parent
     data_dir = repo_root / "data"
 
-    console_path = data_dir / "clean_console_data.csv"
-    population_path = data_dir / "region_population_by_year.csv"
-    output_path = data_dir / "merged_games_population.csv"
-
-    if not console_path.exists():
-        raise FileNotFoundError(f"Console data not found: {console_path}")
-    if not population_path.exists():
-        raise FileNotFoundError(f"Population data not found: {population_path}")
-
-    console_df = pd.read_csv(console_path)
-    population_df = pd.read_csv(population_path)
+    with step("read") as s:
+        console_df = read_table(data_dir, "clean_console_data")
+        population_df = read_table(data_dir, "region_population_by_year")
+        s.rows_out = len(console_df) + len(population_df)
 
     console_df["year_of_release"] = pd.to_numeric(
         console_df["year_of_release"], errors="coerce"
@@ -29,12 +26,14 @@ def main() -> None:
         "Int64"
     )
 
-    merged = console_df.merge(
-        population_df,
-        left_on="year_of_release",
-        right_on="year",
-        how="inner",
-    )
+    with step("merge", rows_in=len(console_df)) as s:
+        merged = console_df.merge(
+            population_df,
+            left_on="year_of_release",
+            right_on="year",
+            how="inner",
+        )
+        s.rows_out = len(merged)
 
     merged = merged.drop(columns=["year"]).rename(columns={"year_of_release": "year"})
 
@@ -61,7 +60,9 @@ def main() -> None:
     remaining_cols = [c for c in merged.columns if c not in column_order]
     merged = merged[column_order + remaining_cols]
 
-    merged.to_csv(output_path, index=False)
+    with step("write", rows_in=len(merged)):
+        output_path = write_table(merged, data_dir, "merged_games_population")
+    record_rows(len(console_df), len(merged))
 
     print(merged.head())
     print(f"Merged shape: {merged.shape}")
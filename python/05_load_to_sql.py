@@ -1,134 +1,362 @@
 """05_load_to_sql.py
 
-Create SQLite database and load cleaned datasets into normalized tables.
+Create SQLite database and load cleaned datasets into a star schema: one
+integer-keyed dimension table per platform, genre, publisher and rating, a
+dim_year table of regional population, and a narrow fact_sales table with one
+row per game (see sql/schema.sql). The string columns are dictionary-encoded
+here with pd.factorize, so each distinct value is looked up once per load
+rather than once per row; values not seen before get the next free key.
+
+By default the load is an incremental upsert keyed on the natural key
+(name, platform, year): new games are inserted, fact rows whose values
+changed are updated, and everything else (including rows absent from
+this load, the clusters table and dimension keys) is left alone. Per-table
+inserted/updated/unchanged counts are printed. --rebuild drops and recreates
+the warehouse tables first, as the loader used to on every run.
+
+Rows of the input that share a natural key collapse to the one with the
+largest global_sales (the later row on a tie). Each such key is printed as
+a warning and the number of keys is reported with the fact_sales counts.
+
+Either way the load runs as a single transaction. Incoming rows go into a
+temporary staging table and each target is written with one UPDATE ... FROM
+for changed rows and one INSERT ... SELECT for new keys, matched through the
+natural-key index inside SQLite rather than row by row. See
+benchmarks/bench_load_to_sql.py for timings against the previous row-by-row
+loader and the wide tables it wrote.
 """
 from pathlib import Path
+import argparse
 import sqlite3
+import numpy as np
 import pandas as pd
 
+from instrumentation import record_rows, stage_main, step
+from sales_cube import build_cube, cube_is_empty
+from storage import read_table
+from warehouse import bump_data_version, data_version
+
+GAME_KEY = ["name", "platform", "year"]
+GAME_ATTRIBUTES = ["genre", "publisher", "critic_score", "user_score", "rating"]
+SALES_MEASURES = ["na_sales", "eu_sales", "jp_sales", "other_sales", "global_sales"]
+POPULATION_COLUMNS = ["na_population", "eu_population", "jp_population", "other_population"]
+
+# String columns stored as integer keys into dim_<column>.
+DIMENSIONS = ["platform", "genre", "publisher", "rating"]
+FACT_KEY = ["name", "platform_id", "year"]
+FACT_VALUES = ["genre_id", "publisher_id", "rating_id", "critic_score", "user_score"] + SALES_MEASURES
+
+# Drop order for --rebuild (views first, then children before parents).
+# games, sales and region_population are views over the star schema, or tables
+# in a warehouse loaded before it.
+WAREHOUSE_TABLES = (
+    "games",
+    "sales",
+    "region_population",
+    "similar_games",
+    "cluster_centroids",
+    "cluster_metrics",
+    "cluster_inputs",
+    "pairwise_tests",
+    "sales_cube",
+    "clusters",
+    "fact_sales",
+    "dim_year",
+    "dim_platform",
+    "dim_genre",
+    "dim_publisher",
+    "dim_rating",
+)
+
+# A rebuild can always be redone from the intermediates, so durability is
+# traded for speed: no on-disk rollback journal, no fsync, a 64 MiB page cache.
+BULK_LOAD_PRAGMAS = (
+    "PRAGMA journal_mode = MEMORY",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA temp_store = MEMORY",
+)
+# An upsert changes history that may not be reloadable, so keep the journal.
+UPSERT_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+def apply_pragmas(conn: sqlite3.Connection, pragmas: tuple) -> None:
+    for pragma in pragmas:
+        conn.execute(pragma)
+
+
+def to_rows(df: pd.DataFrame) -> list:
+    """Rows as tuples of plain Python values for executemany.
+
+    Columns are converted whole with tolist(). NumPy float NaN can be passed
+    through as-is because SQLite stores NaN as NULL; other missing markers
+    (pd.NA, NaN in object columns) become None.
+    """
+    columns = []
+    for _, col in df.items():
+        if isinstance(col.dtype, np.dtype) and col.dtype.kind in "biuf":
+            columns.append(col.tolist())
+        else:
+            columns.append(col.astype(object).where(col.notna(), None).tolist())
+    return list(zip(*columns))
+
+
+def needs_rebuild(conn: sqlite3.Connection) -> bool:
+    """True for a warehouse created before the star schema (games is a table)."""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'games'").fetchone()
+    return row is not None and row[0] == "table"
+
+
+def load_schema(conn: sqlite3.Connection, schema_path: Path, rebuild: bool) -> None:
+    """Run schema.sql inside a transaction that stays open for the data load."""
+    drops = ""
+    if rebuild:
+        types = dict(conn.execute("SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view')"))
+        drops = "".join(f"DROP {types[t].upper()} {t};\n" for t in WAREHOUSE_TABLES if t in types)
+    conn.executescript("BEGIN;\n" + drops + schema_path.read_text())
+
+
+def stage_frame(conn: sqlite3.Connection, name: str, df: pd.DataFrame) -> None:
+    """Copy a DataFrame into a temporary staging table."""
+    conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+    conn.execute(f"CREATE TEMP TABLE {name} ({', '.join(df.columns)})")
+    placeholders = ", ".join("?" for _ in df.columns)
+    conn.executemany(f"INSERT INTO temp.{name} VALUES ({placeholders})", to_rows(df))
+
+
+def changed(columns: list, target: str, source: str) -> str:
+    """SQL predicate: any of ``columns`` differs between two aliases (NULL-safe)."""
+    return " OR ".join(f"{target}.{c} IS NOT {source}.{c}" for c in columns)
+
+
+def matches(columns: list, target: str, source: str) -> str:
+    return " AND ".join(f"{target}.{c} = {source}.{c}" for c in columns)
+
+
+def upsert(
+    conn: sqlite3.Connection,
+    table: str,
+    key: list,
+    values: list,
+    source_sql: str,
+    staged: int,
+) -> dict:
+    """Update changed rows of ``table`` and insert new ones from ``source_sql``.
+
+    ``source_sql`` selects the key and value columns of the incoming rows. The
+    update only touches rows whose values differ, and new keys are inserted
+    with a plain INSERT so AUTOINCREMENT ids are not consumed by existing rows.
+    """
+    conn.execute(f"CREATE TEMP VIEW incoming AS {source_sql}")
+    try:
+        updated = conn.execute(
+            f"""
+            UPDATE {table} SET {', '.join(f'{c} = src.{c}' for c in values)}
+            FROM temp.incoming src
+            WHERE {matches(key, table, 'src')} AND ({changed(values, table, 'src')})
+            """
+        ).rowcount
+        inserted = conn.execute(
+            f"""
+            INSERT INTO {table} ({', '.join(key + values)})
+            SELECT {', '.join(key + values)} FROM temp.incoming src
+            WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {matches(key, 't', 'src')})
+            """
+        ).rowcount
+    finally:
+        conn.execute("DROP VIEW temp.incoming")
+    return {"inserted": inserted, "updated": updated, "unchanged": staged - inserted - updated}
 
-def load_schema(conn: sqlite3.Connection, schema_path: Path) -> None:
-    schema_sql = schema_path.read_text()
-    conn.executescript(schema_sql)
 
+def encode_dimension(conn: sqlite3.Connection, name: str, values: pd.Series) -> tuple:
+    """Keys of ``values`` in dim_<name> (Int64, missing stays missing) and the number of new keys.
 
-def insert_games(conn: sqlite3.Connection, games_df: pd.DataFrame) -> None:
-    records = games_df.to_records(index=False)
+    Distinct values are found with one pd.factorize pass and looked up against
+    the stored dimension; only values not stored yet are inserted.
+    """
+    codes, uniques = pd.factorize(values)
+    stored = pd.read_sql_query(f"SELECT {name}_id, {name} FROM dim_{name}", conn)
+    positions = pd.Index(stored[name]).get_indexer(uniques)
+    new = positions < 0
+    keys = np.empty(len(uniques), dtype=np.int64)
+    keys[~new] = stored[f"{name}_id"].to_numpy(dtype=np.int64)[positions[~new]]
+    next_key = int(stored[f"{name}_id"].max()) + 1 if len(stored) else 1
+    keys[new] = np.arange(next_key, next_key + new.sum())
     conn.executemany(
-        """
-        INSERT INTO games (name, platform, year, genre, publisher, critic_score, user_score, rating)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        records,
+        f"INSERT INTO dim_{name} ({name}_id, {name}) VALUES (?, ?)",
+        zip(keys[new].tolist(), uniques[new].tolist()),
     )
+    encoded = pd.array(keys, dtype="Int64").take(codes, allow_fill=True)
+    return encoded, int(new.sum())
 
 
-def insert_sales(conn: sqlite3.Connection, sales_df: pd.DataFrame, game_id_lookup: dict) -> None:
-    def row_to_tuple(row):
-        key = (row["name"], row["platform"], row["year"])
-        game_id = game_id_lookup.get(key)
-        if game_id is None:
-            return None
-        return (
-            game_id,
-            row["na_sales"],
-            row["eu_sales"],
-            row["jp_sales"],
-            row["other_sales"],
-            row["global_sales"],
-        )
+def encode_games(conn: sqlite3.Connection, games_df: pd.DataFrame) -> tuple:
+    """games_df with DIMENSIONS replaced by <dimension>_id keys, and per-dimension counts."""
+    encoded = games_df.drop(columns=DIMENSIONS)
+    counts = {}
+    for name in DIMENSIONS:
+        encoded[f"{name}_id"], inserted = encode_dimension(conn, name, games_df[name])
+        distinct = games_df[name].nunique()
+        counts[f"dim_{name}"] = {"inserted": inserted, "updated": 0, "unchanged": distinct - inserted}
+    return encoded[FACT_KEY + FACT_VALUES], counts
 
-    tuples = [t for t in (row_to_tuple(row) for _, row in sales_df.iterrows()) if t]
-    conn.executemany(
-        """
-        INSERT INTO sales (game_id, na_sales, eu_sales, jp_sales, other_sales, global_sales)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """,
-        tuples,
+
+def upsert_facts(conn: sqlite3.Connection, staged: int) -> dict:
+    return upsert(
+        conn,
+        "fact_sales",
+        FACT_KEY,
+        FACT_VALUES,
+        f"SELECT {', '.join(FACT_KEY + FACT_VALUES)} FROM temp.stage_facts",
+        staged,
     )
 
 
-def insert_region_population(conn: sqlite3.Connection, region_df: pd.DataFrame) -> None:
-    conn.executemany(
-        """
-        INSERT INTO region_population (year, na_population, eu_population, jp_population, other_population)
-        VALUES (?, ?, ?, ?, ?)
-        """,
-        region_df.to_records(index=False),
+def upsert_region_population(conn: sqlite3.Connection, staged: int) -> dict:
+    return upsert(
+        conn,
+        "dim_year",
+        ["year"],
+        POPULATION_COLUMNS,
+        f"SELECT year, {', '.join(POPULATION_COLUMNS)} FROM temp.stage_region_population",
+        staged,
     )
 
 
+def prepare_games(merged_df: pd.DataFrame) -> tuple:
+    """One row per natural key, and the rows that shared a key with another.
+
+    Rows sharing a key collapse to the one with the largest global_sales (the
+    later one in the file on a tie), so a partial re-listing of a game cannot
+    replace its full sales row. Returns (games, duplicate rows).
+    """
+    keyed = merged_df.dropna(subset=GAME_KEY)[GAME_KEY + GAME_ATTRIBUTES + SALES_MEASURES]
+    ranked = keyed.sort_values("global_sales", kind="stable", na_position="first")
+    games = ranked.drop_duplicates(subset=GAME_KEY, keep="last").sort_index()
+    return games, keyed[keyed.duplicated(subset=GAME_KEY, keep=False)]
+
+
+def warn_duplicates(duplicates: pd.DataFrame) -> int:
+    """Print one warning per natural key that had several rows; returns the key count."""
+    groups = duplicates.groupby(GAME_KEY, sort=False)["global_sales"]
+    for (name, platform, year), sales in groups:
+        dropped = ", ".join(f"{v:.0f}" for v in sales.drop(sales.idxmax()))
+        print(
+            f"Warning: {len(sales)} rows for {name} / {platform} / {year}; "
+            f"kept global_sales={sales.max():.0f}, dropped {dropped}"
+        )
+    return groups.ngroups
+
+
+def load_warehouse(
+    conn: sqlite3.Connection,
+    schema_path: Path,
+    merged_df: pd.DataFrame,
+    region_df: pd.DataFrame,
+    rebuild: bool = False,
+) -> dict:
+    """Upsert dimensions, facts and region population in one transaction, then ANALYZE.
+
+    The sales cube is rebuilt in the same transaction whenever the load changed
+    anything.
+
+    Returns {table: {"inserted": n, "updated": n, "unchanged": n}}; the
+    fact_sales entry also has "collapsed", the number of natural keys that
+    had duplicate rows (see prepare_games).
+    """
+    if not rebuild and needs_rebuild(conn):
+        print("Existing warehouse predates the star schema; rebuilding it.")
+        rebuild = True
+    apply_pragmas(conn, BULK_LOAD_PRAGMAS if rebuild else UPSERT_PRAGMAS)
+    games_df, duplicates = prepare_games(merged_df)
+    collapsed = warn_duplicates(duplicates)
+    region_df = region_df.dropna(subset=["year"])[["year"] + POPULATION_COLUMNS]
+
+    load_schema(conn, schema_path, rebuild)
+    try:
+        with step("encode_games", rows_in=len(games_df)) as s:
+            facts_df, counts = encode_games(conn, games_df)
+            s.rows_out = len(facts_df)
+        with step("stage", rows_in=len(facts_df) + len(region_df)):
+            stage_frame(conn, "stage_facts", facts_df)
+            stage_frame(conn, "stage_region_population", region_df)
+        with step("upsert_facts", rows_in=len(facts_df)) as s:
+            counts["fact_sales"] = upsert_facts(conn, len(facts_df))
+            counts["fact_sales"]["collapsed"] = collapsed
+            s.rows_out = counts["fact_sales"]["inserted"] + counts["fact_sales"]["updated"]
+        with step("upsert_dim_year", rows_in=len(region_df)) as s:
+            counts["dim_year"] = upsert_region_population(conn, len(region_df))
+            s.rows_out = counts["dim_year"]["inserted"] + counts["dim_year"]["updated"]
+        changed_rows = any(c["inserted"] or c["updated"] for c in counts.values())
+        if rebuild or changed_rows or cube_is_empty(conn):
+            with step("build_cube") as s:
+                s.rows_out = build_cube(conn)
+            bump_data_version(conn)
+        elif data_version(conn) is None:
+            bump_data_version(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    with step("commit"):
+        conn.commit()
+    # Refresh planner statistics so the KPI queries pick the covering indexes.
+    with step("analyze"):
+        conn.execute("ANALYZE")
+    return counts
+
+
+@stage_main
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Load the cleaned datasets into data/games.db.")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="drop and recreate the warehouse tables (including clusters) before loading",
+    )
+    args = parser.parse_args()
+
     repo_root = Path(__file__).resolve().parent.parent
     data_dir = repo_root / "data"
     sql_dir = repo_root / "sql"
 
     db_path = data_dir / "games.db"
     schema_path = sql_dir / "schema.sql"
-    merged_path = data_dir / "merged_games_population.csv"
-    region_path = data_dir / "region_population_by_year.csv"
 
     if not schema_path.exists():
         raise FileNotFoundError(f"Schema file not found: {schema_path}")
-    if not merged_path.exists():
-        raise FileNotFoundError(f"Merged data not found: {merged_path}")
-    if not region_path.exists():
-        raise FileNotFoundError(f"Region population data not found: {region_path}")
 
     data_dir.mkdir(parents=True, exist_ok=True)
 
-    merged_df = pd.read_csv(merged_path)
-    # Ensure key types are consistent.
-    merged_df["year"] = pd.to_numeric(merged_df["year"], errors="coerce").astype("Int64")
-
-    games_columns = [
-        "name",
-        "platform",
-        "year",
-        "genre",
-        "publisher",
-        "critic_score",
-        "user_score",
-        "rating",
-    ]
-    sales_columns = [
-        "name",
-        "platform",
-        "year",
-        "na_sales",
-        "eu_sales",
-        "jp_sales",
-        "other_sales",
-        "global_sales",
-    ]
-
-    games_df = merged_df[games_columns].drop_duplicates()
-    sales_df = merged_df[sales_columns]
-
-    region_df = pd.read_csv(region_path)
-    region_df["year"] = pd.to_numeric(region_df["year"], errors="coerce").astype("Int64")
-
-    with sqlite3.connect(db_path) as conn:
-        load_schema(conn, schema_path)
-
-        insert_games(conn, games_df)
+    with step("read") as s:
+        # Only the columns loaded into the warehouse are read.
+        merged_df = read_table(
+            data_dir,
+            "merged_games_population",
+            columns=GAME_KEY + GAME_ATTRIBUTES + SALES_MEASURES,
+        )
+        # Ensure key types are consistent.
+        merged_df["year"] = pd.to_numeric(merged_df["year"], errors="coerce").astype("Int64")
 
-        # Build lookup from (name, platform, year) to game_id for foreign keys.
-        cursor = conn.execute("SELECT id, name, platform, year FROM games")
-        game_id_lookup = {
-            (row[1], row[2], row[3]): row[0]
-            for row in cursor.fetchall()
-        }
+        region_df = read_table(data_dir, "region_population_by_year")
+        region_df["year"] = pd.to_numeric(region_df["year"], errors="coerce").astype("Int64")
+        s.rows_out = len(merged_df) + len(region_df)
 
-        insert_sales(conn, sales_df, game_id_lookup)
-        insert_region_population(conn, region_df)
-        conn.commit()
+    with sqlite3.connect(db_path) as conn:
+        counts = load_warehouse(conn, schema_path, merged_df, region_df, rebuild=args.rebuild)
+        record_rows(len(merged_df), sum(c["inserted"] + c["updated"] for c in counts.values()))
 
-        for table in ("games", "sales", "region_population", "clusters"):
+        for table, c in counts.items():
+            collapsed = f", {c['collapsed']} duplicated key(s) collapsed" if "collapsed" in c else ""
+            print(f"{table}: {c['inserted']} inserted, {c['updated']} updated, {c['unchanged']} unchanged{collapsed}")
+        for table in ("fact_sales", "dim_year", "clusters", "sales_cube"):
             count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
             print(f"{table}: {count} rows")
 
-    print(f"Database created at: {db_path}")
+    print(f"Database loaded at: {db_path}")
 
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 """06_eda_and_kpis.py
 
 Run quick EDA/KPIs from the SQLite database and produce plots.
-- Pulls aggregates via SQL (by year, by genre, top genres)
+- Rolls up the precomputed sales cube (by year, by genre, top genres)
 - Saves regional time-series and genre bar charts to reports/
 - Prints a short KPI summary to stdout
 """
@@ -18,10 +18,8 @@ import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 
-
-def query_to_df(conn: sqlite3.Connection, sql: str) -> pd.DataFrame:
-    """Execute a SQL query and return a DataFrame."""
-    return pd.read_sql_query(sql, conn)
+from instrumentation import stage_main, step
+from sales_cube import SalesCube
 
 
 def plot_sales_over_time(df: pd.DataFrame, output_path: Path) -> None:
@@ -53,6 +51,7 @@ def plot_genre_sales(df: pd.DataFrame, output_path: Path) -> None:
     plt.close()
 
 
+@stage_main
 def main() -> None:
     repo_root = Path(__file__).resolve().parent.parent
     data_dir = repo_root / "data"
@@ -63,62 +62,24 @@ def main() -> None:
     if not db_path.exists():
         raise FileNotFoundError(f"Database not found: {db_path}")
 
-    with sqlite3.connect(db_path) as conn:
-        # Aggregate regional totals per year for the time-series chart.
-        sales_by_year = query_to_df(
-            conn,
-            """
-            SELECT
-                g.year,
-                SUM(s.na_sales) AS na_sales,
-                SUM(s.eu_sales) AS eu_sales,
-                SUM(s.jp_sales) AS jp_sales,
-                SUM(s.other_sales) AS other_sales,
-                SUM(s.global_sales) AS global_sales
-            FROM sales s
-            JOIN games g ON g.id = s.game_id
-            GROUP BY g.year
-            ORDER BY g.year
-            """,
-        )
+    with step("load_cube") as s, sqlite3.connect(db_path) as conn:
+        cube = SalesCube.load(conn)
+        s.rows_out = len(cube.cells)
 
-        # Aggregate sales by genre for the grouped bar chart.
-        sales_by_genre = query_to_df(
-            conn,
-            """
-            SELECT
-                g.genre,
-                SUM(s.na_sales) AS na_sales,
-                SUM(s.eu_sales) AS eu_sales,
-                SUM(s.jp_sales) AS jp_sales,
-                SUM(s.other_sales) AS other_sales,
-                SUM(s.global_sales) AS global_sales
-            FROM sales s
-            JOIN games g ON g.id = s.game_id
-            GROUP BY g.genre
-            ORDER BY global_sales DESC
-            """,
-        )
+    # Aggregate regional totals per year for the time-series chart.
+    sales_by_year = cube.totals("year").sort_values("year", ignore_index=True)
 
-        # Top 10 genres globally for quick KPI reference.
-        top_genres = query_to_df(
-            conn,
-            """
-            SELECT
-                g.genre,
-                SUM(s.global_sales) AS global_sales
-            FROM sales s
-            JOIN games g ON g.id = s.game_id
-            GROUP BY g.genre
-            ORDER BY global_sales DESC
-            LIMIT 10
-            """,
-        )
+    # Aggregate sales by genre for the grouped bar chart.
+    sales_by_genre = cube.totals("genre").sort_values("global_sales", ascending=False, ignore_index=True)
 
-    plot_sales_over_time(sales_by_year, reports_dir / "sales_by_region_over_time.png")
-    plot_genre_sales(
-        sales_by_genre, reports_dir / "genre_sales_by_region.png"
-    )
+    # Top 10 genres globally for quick KPI reference.
+    top_genres = sales_by_genre.head(10)[["genre", "global_sales"]]
+
+    with step("plot"):
+        plot_sales_over_time(sales_by_year, reports_dir / "sales_by_region_over_time.png")
+        plot_genre_sales(
+            sales_by_genre, reports_dir / "genre_sales_by_region.png"
+        )
 
     # Simple KPI summary.
     top_genre = top_genres.iloc[0] if not top_genres.empty else None
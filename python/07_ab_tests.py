@@ -1,43 +1,158 @@
 """07_ab_tests.py
 
 Run simple A/B (genre) tests on global sales and summarize ESRB rating averages.
+
+Both come from the precomputed sales cube (sales_cube.py): Welch's t-test
+needs only each group's count, mean and standard deviation, which the cube
+provides without reading per-game rows.
+
+--all-pairs DIM [DIM ...] additionally tests every pair of groups of each
+dimension (genre, platform, rating, ...) at once: one cube roll-up gives each
+group's n, mean and variance, and Welch's t, degrees of freedom and p-values
+for all pairs are computed as NumPy arrays. p-values are adjusted for multiple
+comparisons (--correction holm or bh), ranked, written to the
+pairwise_tests table and to reports/pairwise_<dim>_tests.csv.
 """
 from pathlib import Path
+import argparse
 import sqlite3
 import numpy as np
 import pandas as pd
 from scipy import stats
 
+from instrumentation import stage_main, step
+from sales_cube import SalesCube
 
-def fetch_genre_sales(conn: sqlite3.Connection, genre: str) -> pd.Series:
-    sql = """
-        SELECT s.global_sales
-        FROM sales s
-        JOIN games g ON g.id = s.game_id
-        WHERE g.genre = ?
-    """
-    df = pd.read_sql_query(sql, conn, params=(genre,))
-    return df["global_sales"].dropna()
+
+def genre_sales_stats(cube: SalesCube, genre: str) -> pd.Series:
+    """n, mean and std of per-game global sales in one genre."""
+    rolled = cube.rollup(where={"genre": genre}, regions=["global"])
+    if rolled.empty:
+        return pd.Series({"n": 0, "mean": float("nan"), "std": float("nan")})
+    return rolled.iloc[0][["n", "mean", "std"]]
 
 
 def two_sample_test(a: pd.Series, b: pd.Series) -> tuple:
     # Welch's t-test handles unequal variances and sample sizes.
-    t_stat, p_val = stats.ttest_ind(a, b, equal_var=False)
+    t_stat, p_val = stats.ttest_ind_from_stats(
+        a["mean"], a["std"], a["n"], b["mean"], b["std"], b["n"], equal_var=False
+    )
     return t_stat, p_val
 
 
-def rating_genre_summary(conn: sqlite3.Connection) -> pd.DataFrame:
-    sql = """
-        SELECT g.rating, g.genre, AVG(s.global_sales) AS avg_global_sales, COUNT(*) AS n
-        FROM sales s
-        JOIN games g ON g.id = s.game_id
-        GROUP BY g.rating, g.genre
-        ORDER BY avg_global_sales DESC
-    """
-    return pd.read_sql_query(sql, conn)
+def rating_genre_summary(cube: SalesCube) -> pd.DataFrame:
+    rolled = cube.rollup(["rating", "genre"], regions=["global"])
+    summary = rolled.rename(columns={"mean": "avg_global_sales"})[["rating", "genre", "avg_global_sales", "n"]]
+    return summary.sort_values("avg_global_sales", ascending=False, ignore_index=True)
+
+
+def group_stats(cube: SalesCube, dimension: str) -> pd.DataFrame:
+    """n, mean and var of global sales per group; groups with n < 2 are dropped."""
+    rolled = cube.rollup([dimension], regions=["global"]).dropna(subset=[dimension])
+    rolled = rolled[rolled["n"] >= 2].sort_values(dimension, ignore_index=True)
+    return rolled[[dimension, "n", "mean", "var"]]
+
+
+def welch_all_pairs(groups: pd.DataFrame, dimension: str) -> pd.DataFrame:
+    """Welch's t-test for every pair of rows of ``groups`` (see group_stats)."""
+    i, j = np.triu_indices(len(groups), k=1)
+    n = groups["n"].to_numpy(dtype=float)
+    mean = groups["mean"].to_numpy()
+    var = groups["var"].to_numpy()
+
+    se2_a, se2_b = var[i] / n[i], var[j] / n[j]
+    se2 = se2_a + se2_b
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_stat = (mean[i] - mean[j]) / np.sqrt(se2)
+        # Welch-Satterthwaite degrees of freedom.
+        df = se2**2 / (se2_a**2 / (n[i] - 1) + se2_b**2 / (n[j] - 1))
+    p_value = 2 * stats.t.sf(np.abs(t_stat), df)
+
+    labels = groups[dimension].map(group_label).to_numpy()
+    return pd.DataFrame(
+        {
+            "dimension": dimension,
+            "group_a": labels[i],
+            "group_b": labels[j],
+            "n_a": n[i].astype("int64"),
+            "n_b": n[j].astype("int64"),
+            "mean_a": mean[i],
+            "mean_b": mean[j],
+            "t_stat": t_stat,
+            "df": df,
+            "p_value": p_value,
+        }
+    )
+
 
+def group_label(value) -> str:
+    # Years come back as floats when the column has gaps.
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
 
+
+def adjust_pvalues(p_values: np.ndarray, method: str) -> np.ndarray:
+    """Holm (family-wise error) or Benjamini-Hochberg (false discovery rate) adjustment.
+
+    Undefined p-values (NaN, e.g. two zero-variance groups) count as 1.
+    """
+    p = np.nan_to_num(np.asarray(p_values, dtype=float), nan=1.0)
+    m = len(p)
+    if m == 0:
+        return p
+    order = np.argsort(p, kind="stable")
+    ranked = p[order]
+    if method == "holm":
+        adjusted = np.maximum.accumulate((m - np.arange(m)) * ranked)
+    elif method == "bh":
+        adjusted = np.minimum.accumulate((m / np.arange(1, m + 1) * ranked)[::-1])[::-1]
+    else:
+        raise ValueError(f"Unknown correction method: {method}")
+    out = np.empty(m)
+    out[order] = np.minimum(adjusted, 1.0)
+    return out
+
+
+def pairwise_tests(cube: SalesCube, dimension: str, correction: str, alpha: float) -> pd.DataFrame:
+    """Ranked all-pairs Welch tests for one dimension."""
+    results = welch_all_pairs(group_stats(cube, dimension), dimension)
+    results["correction"] = correction
+    results["p_adjusted"] = adjust_pvalues(results["p_value"].to_numpy(), correction)
+    results["significant"] = results["p_adjusted"] < alpha
+    results = results.assign(abs_t=results["t_stat"].abs())
+    results = results.sort_values(["p_adjusted", "abs_t"], ascending=[True, False], ignore_index=True)
+    results.insert(0, "rank", np.arange(1, len(results) + 1))
+    return results.drop(columns="abs_t")
+
+
+def write_pairwise(conn: sqlite3.Connection, results: pd.DataFrame, dimension: str) -> None:
+    """Replace the stored results for one dimension."""
+    columns = list(results.columns)
+    rows = results.astype(object).where(results.notna(), None).itertuples(index=False, name=None)
+    with conn:
+        conn.execute("DELETE FROM pairwise_tests WHERE dimension = ?", (dimension,))
+        conn.executemany(
+            f"INSERT INTO pairwise_tests ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+            rows,
+        )
+
+
+@stage_main
 def main() -> None:
+    parser = argparse.ArgumentParser(description="A/B tests on global sales.")
+    parser.add_argument(
+        "--all-pairs",
+        nargs="+",
+        default=[],
+        metavar="DIM",
+        choices=["genre", "platform", "rating", "publisher", "year"],
+        help="test every pair of groups of these dimensions",
+    )
+    parser.add_argument("--correction", choices=["holm", "bh"], default="holm")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    args = parser.parse_args()
+
     repo_root = Path(__file__).resolve().parent.parent
     data_dir = repo_root / "data"
     reports_dir = repo_root / "reports"
@@ -55,22 +170,40 @@ def main() -> None:
     lines = []
 
     with sqlite3.connect(db_path) as conn:
+        with step("load_cube") as s:
+            cube = SalesCube.load(conn)
+            s.rows_out = len(cube.cells)
+        for dimension in args.all_pairs:
+            with step(f"all_pairs.{dimension}") as s:
+                results = pairwise_tests(cube, dimension, args.correction, args.alpha)
+                write_pairwise(conn, results, dimension)
+                s.rows_out = len(results)
+            pairwise_path = reports_dir / f"pairwise_{dimension}_tests.csv"
+            results.to_csv(pairwise_path, index=False)
+            print(
+                f"{dimension}: {int(results['significant'].sum())} of {len(results)} pairs significant "
+                f"({args.correction}, alpha={args.alpha}); wrote {pairwise_path}"
+            )
+
+    with step("comparisons"):
         for g1, g2 in comparisons:
-            sales1 = fetch_genre_sales(conn, g1)
-            sales2 = fetch_genre_sales(conn, g2)
+            sales1 = genre_sales_stats(cube, g1)
+            sales2 = genre_sales_stats(cube, g2)
 
-            if sales1.empty or sales2.empty:
+            if sales1["n"] == 0 or sales2["n"] == 0:
                 lines.append(f"{g1} vs {g2}: insufficient data\n")
                 continue
 
             t_stat, p_val = two_sample_test(sales1, sales2)
             lines.append(
                 f"{g1} vs {g2}: t={t_stat:.4f}, p={p_val:.4e}, "
-                f"mean1={sales1.mean():.2f}, mean2={sales2.mean():.2f}, "
-                f"n1={len(sales1)}, n2={len(sales2)}\n"
+                f"mean1={sales1['mean']:.2f}, mean2={sales2['mean']:.2f}, "
+                f"n1={sales1['n']}, n2={sales2['n']}\n"
             )
 
-        rating_summary = rating_genre_summary(conn)
+    with step("rating_genre_summary") as s:
+        rating_summary = rating_genre_summary(cube)
+        s.rows_out = len(rating_summary)
 
     summary_path = reports_dir / "ab_test_summary.txt"
     rating_head = rating_summary.head() if not rating_summary.empty else rating_summary
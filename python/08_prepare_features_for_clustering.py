@@ -1,14 +1,66 @@
 """08_prepare_features_for_clustering.py
 
 Extract game features and scale them for clustering.
+
+The scaled matrix is written as data/features_for_clustering.bin, the binary
+format the C++ engine memory-maps (see feature_io.py). --csv also writes the
+CSV version for inspection or older engine builds.
+
+load_feature_frame(), fit_scaler() and scale_features() are also used by
+09_integrate_cpp_clusters.py to cluster in-process without the files and to
+report centroids in original units.
 """
 from pathlib import Path
+from typing import Optional
+import argparse
 import sqlite3
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
 
+from feature_io import write_features
+from instrumentation import record_rows, stage_main, step
+from warehouse import load_query
+
+FEATURE_COLUMNS = [
+    "critic_score",
+    "user_score",
+    "na_sales",
+    "eu_sales",
+    "jp_sales",
+    "other_sales",
+    "global_sales",
+]
+
+
+def load_feature_frame(conn: sqlite3.Connection) -> pd.DataFrame:
+    """game_id + raw FEATURE_COLUMNS for every game with all features present."""
+    df = pd.read_sql_query(load_query("clustering_features"), conn)
+    # Drop rows with missing core features.
+    return df.dropna(subset=FEATURE_COLUMNS)
+
+
+def fit_scaler(df: pd.DataFrame) -> StandardScaler:
+    return StandardScaler().fit(df[FEATURE_COLUMNS])
 
+
+def scale_features(df: pd.DataFrame, scaler: Optional[StandardScaler] = None) -> pd.DataFrame:
+    """game_id + FEATURE_COLUMNS standardized to zero mean and unit variance.
+
+    With a fitted scaler, its mean and scale are used instead of df's own.
+    """
+    scaler = scaler or fit_scaler(df)
+    scaled = scaler.transform(df[FEATURE_COLUMNS])
+    scaled_df = pd.DataFrame(scaled, columns=FEATURE_COLUMNS)
+    scaled_df.insert(0, "game_id", df["game_id"].values)
+    return scaled_df
+
+
+@stage_main
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Scale clustering features for the C++ engine.")
+    parser.add_argument("--csv", action="store_true", help="also write data/features_for_clustering.csv")
+    args = parser.parse_args()
+
     repo_root = Path(__file__).resolve().parent.parent
     data_dir = repo_root / "data"
     reports_dir = repo_root / "reports"
@@ -19,59 +71,26 @@ def main() -> None:
     if not db_path.exists():
         raise FileNotFoundError(f"Database not found: {db_path}")
 
-    output_path = data_dir / "features_for_clustering.csv"
-
-    with sqlite3.connect(db_path) as conn:
-        df = pd.read_sql_query(
-            """
-            SELECT
-                g.id AS game_id,
-                g.critic_score,
-                g.user_score,
-                s.na_sales,
-                s.eu_sales,
-                s.jp_sales,
-                s.other_sales,
-                s.global_sales
-            FROM games g
-            JOIN sales s ON s.game_id = g.id
-            """,
-            conn,
-        )
+    output_path = data_dir / "features_for_clustering.bin"
+    csv_path = data_dir / "features_for_clustering.csv"
 
-    # Drop rows with missing core features.
-    df = df.dropna(
-        subset=[
-            "critic_score",
-            "user_score",
-            "na_sales",
-            "eu_sales",
-            "jp_sales",
-            "other_sales",
-            "global_sales",
-        ]
-    )
-
-    feature_cols = [
-        "critic_score",
-        "user_score",
-        "na_sales",
-        "eu_sales",
-        "jp_sales",
-        "other_sales",
-        "global_sales",
-    ]
-
-    scaler = StandardScaler()
-    scaled = scaler.fit_transform(df[feature_cols])
-    scaled_df = pd.DataFrame(scaled, columns=feature_cols)
-    scaled_df.insert(0, "game_id", df["game_id"].values)
+    with step("load_features") as s, sqlite3.connect(db_path) as conn:
+        features_df = load_feature_frame(conn)
+        s.rows_out = len(features_df)
+    with step("scale", rows_in=len(features_df)):
+        scaled_df = scale_features(features_df)
 
-    scaled_df.to_csv(output_path, index=False)
+    with step("write", rows_in=len(scaled_df)):
+        write_features(output_path, scaled_df[FEATURE_COLUMNS].to_numpy(), scaled_df["game_id"].to_numpy())
+        if args.csv:
+            scaled_df.to_csv(csv_path, index=False)
+    record_rows(len(features_df), len(scaled_df))
 
     print(f"Features shape: {scaled_df.shape}")
     print(scaled_df.head())
     print(f"Wrote features to: {output_path}")
+    if args.csv:
+        print(f"Wrote CSV copy to: {csv_path}")
 
 
 if __name__ == "__main__":
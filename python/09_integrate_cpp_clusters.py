@@ -1,25 +1,76 @@
 """09_integrate_cpp_clusters.py
 
 Run the C++ clustering engine and persist cluster assignments into SQLite.
+
+By default the engine runs in-process through its shared library
+(kmeans_engine.py, build with `make -C cpp`): features are taken straight from
+the warehouse with stage 08's functions and handed to the engine as a NumPy
+array, with no files or subprocess in between. --subprocess runs the
+cluster_engine executable on data/features_for_clustering.bin (written by
+08_prepare_features_for_clustering.py) instead.
+
+--k, --seed, --max-iter, --tol and --threads are passed through to the engine
+(k-means++ seeding, iterate until centroids move less than tol; the thread
+count does not change the result).
+
+--k-range MIN MAX fits every k in the range in one engine call (in parallel
+across k) and keeps the one with the highest silhouette. For every k fitted
+the inertia, sampled silhouette and Davies-Bouldin index go to the
+cluster_metrics table; the chosen model's cluster sizes and centroids, in
+original feature units, go to cluster_centroids. --subprocess fits one k; its
+inertia goes to cluster_metrics (silhouette and Davies-Bouldin stay empty),
+and the centroids are worked out from the engine's labels.
+
+Every run also saves the scaler and centroids as a new cluster model version
+(cluster_model.py) unless they equal the latest version's, and only the
+newest --keep-models versions are kept. --subprocess runs save one too, so
+--predict and --warm-start always follow the ids last written. --predict
+skips clustering: it
+loads the latest model (or --model-version) and assigns only games that have
+no cluster yet, so new releases cost O(new rows) instead of a full re-cluster.
+
+Cluster ids are kept stable across runs: new centroids are matched one-to-one
+to the previous model's (Hungarian algorithm) and renumbered to follow them.
+--warm-start continues from the latest model instead of seeding afresh: games
+whose features are unchanged since they were clustered (cluster_inputs
+hashes) keep their cluster, new or changed ones go to the nearest centroid,
+and only if that moves a centroid more than --drift-threshold do full
+iterations run. Only rows whose cluster_id actually changed are written.
 """
 from pathlib import Path
+from typing import Optional
+import argparse
 import os
 import subprocess
 import sqlite3
+import numpy as np
 import pandas as pd
 
+import kmeans_engine
+from cluster_model import (
+    MODEL_RETENTION,
+    ClusterModel,
+    feature_hashes,
+    latest_version,
+    load_model,
+    match_cluster_ids,
+    save_model,
+)
+from feature_io import read_labels
+from instrumentation import engine_steps, record_rows, stage_main, step
+from stage_import import import_stage
+from warehouse import bump_data_version, load_query
 
-def run_cluster_engine(repo_root: Path) -> None:
+
+def run_cluster_engine(repo_root: Path, engine_args: list) -> None:
     # Pick binary name based on platform.
     exe = Path("cpp") / ("cluster_engine.exe" if os.name == "nt" else "cluster_engine")
     exe_path = repo_root / exe
     if not exe_path.exists():
-        raise FileNotFoundError(
-            f"Cluster engine not found at {exe_path}. Compile it with: cd cpp && g++ -std=c++17 clustering.cpp -o cluster_engine"
-        )
+        raise FileNotFoundError(f"Cluster engine not found at {exe_path}. Compile it with: make -C cpp")
 
     result = subprocess.run(
-        [str(exe_path)],
+        [str(exe_path), *engine_args],
         cwd=repo_root,
         capture_output=True,
         text=True,
@@ -29,48 +80,427 @@ def run_cluster_engine(repo_root: Path) -> None:
         raise RuntimeError(
             f"Cluster engine failed (code {result.returncode}). Stdout: {result.stdout} Stderr: {result.stderr}"
         )
-    if result.stdout:
-        print(result.stdout.strip())
+    stdout = engine_steps(result.stdout)
+    if stdout:
+        print(stdout.strip())
     if result.stderr:
         print(result.stderr.strip())
 
 
-def load_clusters_csv(path: Path) -> pd.DataFrame:
+def load_clusters(path: Path) -> pd.DataFrame:
+    """game_id/cluster_id from the engine's binary label file."""
     if not path.exists():
-        raise FileNotFoundError(f"cluster_output.csv not found at {path}")
-    df = pd.read_csv(path)
-    if not {"game_id", "cluster_id"}.issubset(df.columns):
-        raise ValueError("cluster_output.csv must contain game_id and cluster_id columns")
+        raise FileNotFoundError(f"Cluster labels not found at {path}")
+    ids, labels = read_labels(path)
+    return pd.DataFrame({"game_id": ids, "cluster_id": labels})
+
+
+def metrics_frame(results: list, chosen: kmeans_engine.SweepResult) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "k": [r.k for r in results],
+            "inertia": [r.inertia for r in results],
+            "silhouette": [r.silhouette for r in results],
+            "davies_bouldin": [r.davies_bouldin for r in results],
+            "iterations": [r.iterations for r in results],
+            "chosen": [int(r is chosen) for r in results],
+        }
+    )
+
+
+def centroid_frame(model: ClusterModel, sizes: np.ndarray) -> pd.DataFrame:
+    """cluster_id, size and the centroid in original feature units, per cluster."""
+    df = pd.DataFrame(model.centroids_in_original_units(), columns=model.features)
+    df.insert(0, "size", sizes)
+    df.insert(0, "cluster_id", np.arange(model.k))
     return df
 
 
-def upsert_clusters(conn: sqlite3.Connection, clusters_df: pd.DataFrame) -> int:
-    rows = list(clusters_df[["game_id", "cluster_id"]].itertuples(index=False, name=None))
+def apply_cluster_ids(result: kmeans_engine.SweepResult, new_ids: np.ndarray) -> None:
+    """Renumber a result's clusters in place: cluster c becomes new_ids[c]."""
+    result.labels = new_ids[result.labels].astype(np.int32)
+    centroids = np.empty_like(result.centroids)
+    centroids[new_ids] = result.centroids
+    result.centroids = centroids
+    sizes = np.empty_like(result.sizes)
+    sizes[new_ids] = result.sizes
+    result.sizes = sizes
+
+
+def previous_model(conn: sqlite3.Connection, features: list) -> Optional[ClusterModel]:
+    """Latest saved model over the same features, if any."""
+    if latest_version(conn) is None:
+        return None
+    model = load_model(conn)
+    return model if model.features == list(features) else None
+
+
+def print_result(result: kmeans_engine.SweepResult, centroids_df: pd.DataFrame, args: argparse.Namespace) -> None:
+    print(f"Clusters: {result.k}")
+    print(f"Iterations: {result.iterations} ({'converged' if result.converged else 'max-iter reached'})")
+    print(f"Inertia: {result.inertia:.6g}")
+    print(f"Silhouette: {result.silhouette:.4f} (on up to {args.silhouette_sample} rows)")
+    print(f"Davies-Bouldin: {result.davies_bouldin:.4f}")
+    if result.lloyd_evals:
+        saved = max(result.lloyd_evals - result.distance_evals, 0)
+        print(
+            f"Distance evaluations: {result.distance_evals} of {result.lloyd_evals} for plain Lloyd "
+            f"({saved} saved, {100 * saved / result.lloyd_evals:.1f}%)"
+        )
+    else:
+        print(f"Distance evaluations: {result.distance_evals}")
+    print("Cluster sizes and centroids (original units):")
+    print(centroids_df.to_string(index=False))
+
+
+def clusters_frame(raw_df: pd.DataFrame, labels: np.ndarray, features: list) -> pd.DataFrame:
+    """game_id, cluster_id and the features_hash the assignment was made from."""
+    return pd.DataFrame(
+        {
+            "game_id": raw_df["game_id"].to_numpy(),
+            "cluster_id": labels,
+            "features_hash": feature_hashes(raw_df, features),
+        }
+    )
+
+
+def cluster_in_process(db_path: Path, args: argparse.Namespace) -> tuple:
+    """Scale features from the warehouse and cluster them through the shared library.
+
+    Cluster ids are matched to the previous model's (if any). Returns
+    (clusters, metrics, centroids) frames and the model for the chosen k.
+    """
+    features = import_stage("08_prepare_features_for_clustering")
+    with step("load_features") as s, sqlite3.connect(db_path) as conn:
+        raw_df = features.load_feature_frame(conn)
+        previous = previous_model(conn, features.FEATURE_COLUMNS)
+        s.rows_out = len(raw_df)
+    if raw_df.empty:
+        raise RuntimeError("No games with complete clustering features.")
+    with step("scale", rows_in=len(raw_df)):
+        scaler = features.fit_scaler(raw_df)
+        scaled_df = features.scale_features(raw_df, scaler)
+
+    k_min, k_max = args.k_range or (args.k, args.k)
+    with step("sweep", rows_in=len(scaled_df)):
+        results = kmeans_engine.sweep(
+            scaled_df[features.FEATURE_COLUMNS].to_numpy(),
+            k_min,
+            k_max,
+            seed=args.seed,
+            max_iter=args.max_iter,
+            tol=args.tol,
+            threads=args.threads,
+            silhouette_sample=args.silhouette_sample,
+        )
+    result = kmeans_engine.best_by_silhouette(results)
+    model = ClusterModel.from_scaler(scaler, result.centroids, features.FEATURE_COLUMNS)
+    if previous is not None:
+        # Compare centroids in the previous model's scaled units.
+        in_previous_units = (model.centroids_in_original_units() - previous.mean) / previous.scale
+        apply_cluster_ids(result, match_cluster_ids(in_previous_units, previous.centroids))
+        model.centroids = result.centroids
+    metrics_df = metrics_frame(results, result)
+    centroids_df = centroid_frame(model, result.sizes)
+
+    print(f"Points: {len(scaled_df)}")
+    print(f"Features per point: {len(features.FEATURE_COLUMNS)}")
+    if args.k_range:
+        print(metrics_df.to_string(index=False))
+        print(f"Chosen k: {result.k} (highest silhouette)")
+    if previous is not None:
+        print(f"Cluster ids matched to model version {previous.version}")
+    print_result(result, centroids_df, args)
+    return clusters_frame(raw_df, result.labels, features.FEATURE_COLUMNS), metrics_df, centroids_df, model
+
+
+def cluster_warm_start(db_path: Path, args: argparse.Namespace) -> tuple:
+    """Re-cluster from the latest saved model, reassigning only new or changed games.
+
+    Features are scaled with the model's own scaler so its centroids stay
+    comparable. Returns the same frames and model as cluster_in_process().
+    """
+    features = import_stage("08_prepare_features_for_clustering")
+    with step("load_features") as s, sqlite3.connect(db_path) as conn:
+        previous = load_model(conn)
+        raw_df = features.load_feature_frame(conn)
+        stored = pd.read_sql_query(
+            "SELECT c.game_id, c.cluster_id, i.features_hash "
+            "FROM clusters c JOIN cluster_inputs i ON i.game_id = c.game_id",
+            conn,
+        )
+        s.rows_out = len(raw_df)
+    if raw_df.empty:
+        raise RuntimeError("No games with complete clustering features.")
+
+    # A game keeps its label only if its features hash the same as when it got it.
+    current = clusters_frame(raw_df, np.full(len(raw_df), -1, dtype=np.int32), previous.features)
+    known = current[["game_id", "features_hash"]].merge(stored, on=["game_id", "features_hash"], how="left")
+    labels = pd.to_numeric(known["cluster_id"]).fillna(-1).to_numpy(dtype=np.int32)
+
+    with step("warm_start", rows_in=len(raw_df)) as s:
+        result = kmeans_engine.warm_start(
+            previous.transform(raw_df),
+            previous.centroids,
+            labels,
+            max_iter=args.max_iter,
+            tol=args.tol,
+            drift_threshold=args.drift_threshold,
+            threads=args.threads,
+            silhouette_sample=args.silhouette_sample,
+            seed=args.seed,
+        )
+        s.rows_out = result.reassigned
+    if result.full_run:
+        apply_cluster_ids(result, match_cluster_ids(result.centroids, previous.centroids))
+    model = ClusterModel(
+        features=previous.features, mean=previous.mean, scale=previous.scale, centroids=result.centroids
+    )
+    metrics_df = metrics_frame([result], result)
+    centroids_df = centroid_frame(model, result.sizes)
+
+    print(f"Points: {len(raw_df)}")
+    print(f"Warm start from model version {previous.version}: {result.reassigned} new or changed games assigned")
+    print(f"Largest centroid move: {result.drift:.4g} (threshold {args.drift_threshold:g})")
+    if result.full_run:
+        print("Drift above threshold: ran full iterations on every game")
+    else:
+        print("Drift within threshold: other games kept their clusters")
+    print_result(result, centroids_df, args)
+    return clusters_frame(raw_df, result.labels, previous.features), metrics_df, centroids_df, model
+
+
+def cluster_with_executable(
+    repo_root: Path, db_path: Path, features_path: Path, labels_path: Path, args: argparse.Namespace
+) -> tuple:
+    """Cluster stage 08's feature file with cpp/cluster_engine.
+
+    The engine returns only labels, so the scaler is refitted on the
+    warehouse features (as stage 08 fits it) and the centroids are the mean
+    scaled features of each cluster. Cluster ids are then matched to the
+    previous model's, as in cluster_in_process(), whose return value this
+    mirrors.
+    """
+    if not features_path.exists():
+        raise FileNotFoundError(f"Features not found: {features_path}. Run 08_prepare_features_for_clustering.py first.")
+    with step("engine"):
+        run_cluster_engine(
+            repo_root,
+            [
+                str(args.k),
+                "--seed", str(args.seed),
+                "--max-iter", str(args.max_iter),
+                "--tol", repr(args.tol),
+                "--threads", str(args.threads),
+                "--input", str(features_path),
+                "--output", str(labels_path),
+            ],
+        )
+    labels_df = load_clusters(labels_path)
+
+    features = import_stage("08_prepare_features_for_clustering")
+    with step("load_features") as s, sqlite3.connect(db_path) as conn:
+        raw_df = features.load_feature_frame(conn)
+        previous = previous_model(conn, features.FEATURE_COLUMNS)
+        s.rows_out = len(raw_df)
+    raw_df = raw_df.merge(labels_df, on="game_id", how="inner")
+    if len(raw_df) != len(labels_df):
+        raise RuntimeError(
+            f"{features_path} does not match the warehouse. Run 08_prepare_features_for_clustering.py first."
+        )
+    scaler = features.fit_scaler(raw_df)
+    X = features.scale_features(raw_df, scaler)[features.FEATURE_COLUMNS].to_numpy()
+    labels = raw_df["cluster_id"].to_numpy(dtype=np.int32)
+    sizes = np.bincount(labels, minlength=args.k)
+    sums = np.zeros((len(sizes), X.shape[1]))
+    np.add.at(sums, labels, X)
+    model = ClusterModel.from_scaler(scaler, sums / np.maximum(sizes, 1)[:, None], features.FEATURE_COLUMNS)
+    if previous is not None:
+        in_previous_units = (model.centroids_in_original_units() - previous.mean) / previous.scale
+        new_ids = match_cluster_ids(in_previous_units, previous.centroids)
+        labels = new_ids[labels].astype(np.int32)
+        model.centroids[new_ids] = model.centroids.copy()
+        sizes[new_ids] = sizes.copy()
+        print(f"Cluster ids matched to model version {previous.version}")
+    inertia = float(((X - model.centroids[labels]) ** 2).sum())
+    metrics_df = pd.DataFrame(
+        {
+            "k": [model.k],
+            "inertia": [inertia],
+            "silhouette": [np.nan],
+            "davies_bouldin": [np.nan],
+            "iterations": [None],
+            "chosen": [1],
+        }
+    )
+    centroids_df = centroid_frame(model, sizes)
+    print(f"Inertia: {inertia:.6g}")
+    print("Cluster sizes and centroids (original units):")
+    print(centroids_df.to_string(index=False))
+    return clusters_frame(raw_df, labels, features.FEATURE_COLUMNS), metrics_df, centroids_df, model
+
+
+def predict_new_games(conn: sqlite3.Connection, version: Optional[int]) -> pd.DataFrame:
+    """Cluster ids for games without one, from a saved model."""
+    model = load_model(conn, version)
+    raw_df = pd.read_sql_query(load_query("unclustered_features"), conn).dropna(subset=model.features)
+    print(f"Cluster model version {model.version} (k={model.k})")
+    print(f"New games with complete features: {len(raw_df)}")
+    return clusters_frame(raw_df, model.predict(raw_df), model.features)
+
+
+def upsert_changed(conn: sqlite3.Connection, table: str, column: str, df: pd.DataFrame) -> int:
+    """INSERT OR REPLACE the (game_id, column) rows of df that are missing from
+    table or differ from it; returns how many were written."""
+    stored = pd.read_sql_query(f"SELECT game_id, {column} AS stored FROM {table}", conn)
+    merged = df[["game_id", column]].merge(stored.astype({"stored": "Int64"}), on="game_id", how="left")
+    changed = merged[(merged[column] != merged["stored"]).fillna(True).astype(bool)]
     conn.executemany(
-        "INSERT OR REPLACE INTO clusters (game_id, cluster_id) VALUES (?, ?)",
-        rows,
+        f"INSERT OR REPLACE INTO {table} (game_id, {column}) VALUES (?, ?)",
+        changed[["game_id", column]].astype(object).itertuples(index=False, name=None),
     )
-    return len(rows)
+    return len(changed)
 
 
+def upsert_clusters(conn: sqlite3.Connection, clusters_df: pd.DataFrame) -> int:
+    """Write only assignments that are new or changed; returns how many."""
+    count = upsert_changed(conn, "clusters", "cluster_id", clusters_df)
+    if count:
+        bump_data_version(conn)
+    return count
+
+
+def record_inputs(conn: sqlite3.Connection, clusters_df: pd.DataFrame) -> None:
+    """Remember the features hash behind each assignment for --warm-start."""
+    upsert_changed(conn, "cluster_inputs", "features_hash", clusters_df)
+
+
+def write_cluster_metrics(conn: sqlite3.Connection, metrics_df: Optional[pd.DataFrame], centroids_df: Optional[pd.DataFrame]) -> None:
+    """Replace cluster_metrics and cluster_centroids; None leaves them empty."""
+    conn.execute("DELETE FROM cluster_metrics")
+    conn.execute("DELETE FROM cluster_centroids")
+    for table, df in (("cluster_metrics", metrics_df), ("cluster_centroids", centroids_df)):
+        if df is None:
+            continue
+        columns = ", ".join(df.columns)
+        placeholders = ", ".join("?" for _ in df.columns)
+        conn.executemany(
+            f"INSERT INTO {table} ({columns}) VALUES ({placeholders})",
+            df.astype(object).itertuples(index=False, name=None),
+        )
+
+
+@stage_main
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Cluster games with the C++ engine and store the assignments.")
+    parser.add_argument("--k", type=int, default=5, help="number of clusters")
+    parser.add_argument(
+        "--k-range",
+        type=int,
+        nargs=2,
+        metavar=("MIN", "MAX"),
+        help="fit every k from MIN to MAX and keep the one with the highest silhouette",
+    )
+    parser.add_argument(
+        "--silhouette-sample",
+        type=int,
+        default=kmeans_engine.SILHOUETTE_SAMPLE,
+        help="rows the silhouette is computed on",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="k-means++ seed")
+    parser.add_argument("--max-iter", type=int, default=300)
+    parser.add_argument("--tol", type=float, default=1e-6, help="stop when no centroid moves further than this")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--subprocess",
+        action="store_true",
+        help="run cpp/cluster_engine on data/features_for_clustering.bin instead of the shared library",
+    )
+    parser.add_argument(
+        "--predict",
+        action="store_true",
+        help="assign only games without a cluster using a saved model, no re-clustering",
+    )
+    parser.add_argument("--model-version", type=int, help="model used by --predict (default: latest)")
+    parser.add_argument(
+        "--warm-start",
+        action="store_true",
+        help="continue from the latest saved model, reassigning only new or changed games",
+    )
+    parser.add_argument(
+        "--keep-models",
+        type=int,
+        default=MODEL_RETENTION,
+        help="saved model versions to keep; older ones are deleted",
+    )
+    parser.add_argument(
+        "--drift-threshold",
+        type=float,
+        default=0.05,
+        help="with --warm-start, run full iterations if a centroid moves further than this (scaled units)",
+    )
+    args = parser.parse_args()
+    if args.keep_models < 1:
+        parser.error("--keep-models must be at least 1")
+    if args.subprocess and (args.k_range or args.warm_start):
+        parser.error("--k-range and --warm-start need the in-process engine (drop --subprocess)")
+    if args.warm_start and args.k_range:
+        parser.error("--warm-start keeps the saved model's k; drop --k-range")
+
     repo_root = Path(__file__).resolve().parent.parent
     data_dir = repo_root / "data"
     db_path = data_dir / "games.db"
-    output_csv = data_dir / "cluster_output.csv"
 
     if not db_path.exists():
         raise FileNotFoundError(f"Database not found: {db_path}")
 
-    run_cluster_engine(repo_root)
+    if args.predict:
+        with sqlite3.connect(db_path) as conn:
+            with step("predict") as s:
+                clusters_df = predict_new_games(conn, args.model_version)
+                s.rows_out = len(clusters_df)
+            with step("upsert_clusters", rows_in=len(clusters_df)) as s:
+                count = upsert_clusters(conn, clusters_df)
+                record_inputs(conn, clusters_df)
+                conn.commit()
+                s.rows_out = count
+        print(f"Wrote {count} cluster assignments into clusters table.")
+        return
 
-    clusters_df = load_clusters_csv(output_csv)
+    if args.subprocess:
+        clusters_df, metrics_df, centroids_df, model = cluster_with_executable(
+            repo_root, db_path, data_dir / "features_for_clustering.bin", data_dir / "cluster_labels.bin", args
+        )
+    elif args.warm_start:
+        clusters_df, metrics_df, centroids_df, model = cluster_warm_start(db_path, args)
+    else:
+        clusters_df, metrics_df, centroids_df, model = cluster_in_process(db_path, args)
 
     with sqlite3.connect(db_path) as conn:
-        count = upsert_clusters(conn, clusters_df)
+        with step("upsert_clusters", rows_in=len(clusters_df)) as s:
+            count = upsert_clusters(conn, clusters_df)
+            record_inputs(conn, clusters_df)
+            s.rows_out = count
+        write_cluster_metrics(conn, metrics_df, centroids_df)
+        chosen = metrics_df[metrics_df["chosen"] == 1].iloc[0]
+        latest = latest_version(conn)
+        version = save_model(
+            conn,
+            model,
+            keep=args.keep_models,
+            seed=None if args.warm_start else args.seed,
+            inertia=float(chosen["inertia"]),
+            silhouette=float(chosen["silhouette"]),
+            davies_bouldin=float(chosen["davies_bouldin"]),
+        )
+        if version == latest:
+            print(f"Cluster model unchanged; still version {version}")
+        else:
+            print(f"Saved cluster model version {version}")
         conn.commit()
 
-    print(f"Wrote {count} cluster assignments into clusters table.")
+    record_rows(len(clusters_df), count)
+    print(f"Wrote {count} changed cluster assignments into clusters table ({len(clusters_df) - count} unchanged).")
 
 
 if __name__ == "__main__":
@@ -1,13 +1,181 @@
 """10_export_for_tableau.py
 
 Export a flattened table for Tableau analysis.
+
+Rows are streamed from a SQLite cursor EXPORT_BATCH_ROWS at a time and
+written as CSV, so memory use does not grow with the warehouse.
+
+--partitioned writes one CSV per year (per year and platform with
+--by-platform) under tableau/games_for_tableau/, e.g. year=2005.csv or
+year=2005/platform=PS3.csv, which Tableau can read back as a wildcard union.
+A manifest.json next to the partitions records each one's row count and
+SHA-256, plus the warehouse data_version it was exported from:
+- if data_version has not changed since the last export, nothing is read;
+- otherwise each partition's rows are hashed from the cursor and only
+  partitions whose hash differs (or whose file is missing) are rewritten,
+  through a temporary file that replaces the old one;
+- partitions that no longer have rows are deleted.
+
+Usage (from repo root):
+    python python/10_export_for_tableau.py                                # tableau/games_for_tableau.csv
+    python python/10_export_for_tableau.py --partitioned                  # changed year partitions only
+    python python/10_export_for_tableau.py --partitioned --by-platform
+    python python/10_export_for_tableau.py --partitioned --force          # rewrite every partition
 """
 from pathlib import Path
+from typing import Callable
+import argparse
+import csv
+import hashlib
+import io
+import json
+import re
 import sqlite3
-import pandas as pd
+
+from instrumentation import record_rows, stage_main, step
+from warehouse import data_version, load_query, missing_tables
+
+# Rows fetched and encoded per step; peak memory follows this, not the
+# table size (about 50 MiB for the whole process at 10k rows).
+EXPORT_BATCH_ROWS = 10_000
+MANIFEST_NAME = "manifest.json"
+
+# Star schema tables read by sql/queries/tableau_export.sql.
+EXPORT_TABLES = ["fact_sales", "dim_platform", "dim_genre", "dim_publisher", "dim_rating", "dim_year", "clusters"]
+
+
+def stream_rows(cursor: sqlite3.Cursor, sink: Callable, batch_rows: int = EXPORT_BATCH_ROWS) -> int:
+    """Encode a cursor's rows as CSV (header first) and pass each batch's bytes to sink.
+
+    Values are written as SQLite returns them: NULL as an empty field, REAL
+    with Python's shortest round-trip repr. Returns the row count.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow([column[0] for column in cursor.description])
+    count = 0
+    while True:
+        batch = cursor.fetchmany(batch_rows)
+        writer.writerows(batch)
+        sink(buffer.getvalue().encode())
+        buffer.seek(0)
+        buffer.truncate()
+        if not batch:
+            return count
+        count += len(batch)
+
+
+def export_csv(conn: sqlite3.Connection, sql: str, path: Path, params: tuple = (), batch_rows: int = EXPORT_BATCH_ROWS) -> int:
+    """Stream the rows of sql into path through a temporary file; returns the row count."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        count = stream_rows(conn.execute(sql, params), f.write, batch_rows)
+    tmp.replace(path)
+    return count
+
+
+def partition_digest(conn: sqlite3.Connection, sql: str, params: tuple, batch_rows: int) -> tuple:
+    """(SHA-256 of the partition's CSV bytes, row count) without writing anything."""
+    h = hashlib.sha256()
+    count = stream_rows(conn.execute(sql, params), h.update, batch_rows)
+    return h.hexdigest(), count
+
+
+def partition_path(columns: list, values: tuple) -> str:
+    """Relative file of one partition, e.g. year=2005/platform=PS3.csv."""
+    parts = []
+    for column, value in zip(columns, values):
+        label = "null" if value is None else re.sub(r"[^\w.-]", "_", str(value))
+        parts.append(f"{column}={label}")
+    return "/".join(parts) + ".csv"
 
 
+def load_manifest(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_manifest(path: Path, manifest: dict) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    tmp.replace(path)
+
+
+def export_partitions(
+    conn: sqlite3.Connection,
+    out_dir: Path,
+    columns: list,
+    force: bool = False,
+    batch_rows: int = EXPORT_BATCH_ROWS,
+) -> dict:
+    """Bring the partitioned export in out_dir up to date.
+
+    Returns {"written": n, "unchanged": n, "deleted": n, "rows": n}; rows
+    counts the rows of written partitions only.
+    """
+    export_sql = load_query("tableau_export")
+    manifest_path = out_dir / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+    version = data_version(conn)
+    layout = {"columns": columns, "query": hashlib.sha256(export_sql.encode()).hexdigest()}
+    if manifest.get("layout") != layout:
+        force = True
+    previous = {} if force else manifest.get("partitions", {})
+    stats = {"written": 0, "unchanged": 0, "deleted": 0, "rows": 0}
+
+    if (
+        not force
+        and version is not None
+        and manifest.get("data_version") == version
+        and all((out_dir / p).exists() for p in previous)
+    ):
+        stats["unchanged"] = len(previous)
+        return stats
+
+    key_list = ", ".join(columns)
+    keys = conn.execute(f"SELECT DISTINCT {key_list} FROM ({export_sql}) ORDER BY {key_list}").fetchall()
+    partition_sql = f"SELECT * FROM ({export_sql}) WHERE {' AND '.join(f'{c} IS ?' for c in columns)}"
+
+    partitions = {}
+    for values in keys:
+        rel = partition_path(columns, values)
+        path = out_dir / rel
+        digest, count = partition_digest(conn, partition_sql, values, batch_rows)
+        if previous.get(rel, {}).get("sha256") == digest and path.exists():
+            stats["unchanged"] += 1
+        else:
+            export_csv(conn, partition_sql, path, values, batch_rows)
+            stats["written"] += 1
+            stats["rows"] += count
+        partitions[rel] = {"rows": count, "sha256": digest}
+
+    for rel in set(manifest.get("partitions", {})) - set(partitions):
+        path = out_dir / rel
+        if path.exists():
+            path.unlink()
+            stats["deleted"] += 1
+            if path.parent != out_dir and not any(path.parent.iterdir()):
+                path.parent.rmdir()
+
+    save_manifest(manifest_path, {"layout": layout, "data_version": version, "partitions": partitions})
+    return stats
+
+
+@stage_main
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Export the flattened warehouse for Tableau.")
+    parser.add_argument("--partitioned", action="store_true", help="one CSV per year, rewriting changed ones only")
+    parser.add_argument("--by-platform", action="store_true", help="with --partitioned, one CSV per year and platform")
+    parser.add_argument("--force", action="store_true", help="with --partitioned, rewrite every partition")
+    parser.add_argument("--batch-rows", type=int, default=EXPORT_BATCH_ROWS, help="rows fetched per batch")
+    args = parser.parse_args()
+    if (args.by_platform or args.force) and not args.partitioned:
+        parser.error("--by-platform and --force require --partitioned")
+    if args.batch_rows <= 0:
+        parser.error("--batch-rows must be positive")
+
     repo_root = Path(__file__).resolve().parent.parent
     data_dir = repo_root / "data"
     tableau_dir = repo_root / "tableau"
@@ -18,41 +186,29 @@ def main() -> None:
         raise FileNotFoundError(f"Database not found: {db_path}")
 
     with sqlite3.connect(db_path) as conn:
-        df = pd.read_sql_query(
-            """
-            SELECT
-                g.id AS game_id,
-                g.name,
-                g.platform,
-                g.year,
-                g.genre,
-                g.publisher,
-                g.rating,
-                g.critic_score,
-                g.user_score,
-                s.na_sales,
-                s.eu_sales,
-                s.jp_sales,
-                s.other_sales,
-                s.global_sales,
-                rp.na_population,
-                rp.eu_population,
-                rp.jp_population,
-                rp.other_population,
-                c.cluster_id
-            FROM games g
-            JOIN sales s ON s.game_id = g.id
-            LEFT JOIN region_population rp ON rp.year = g.year
-            LEFT JOIN clusters c ON c.game_id = g.id
-            """,
-            conn,
-        )
-
-    output_path = tableau_dir / "games_for_tableau.csv"
-    df.to_csv(output_path, index=False)
+        missing = missing_tables(conn, EXPORT_TABLES)
+        if missing:
+            raise RuntimeError(f"{', '.join(missing)} table(s) not found in {db_path}; run 05_load_to_sql.py first")
+        if args.partitioned:
+            out_dir = tableau_dir / "games_for_tableau"
+            columns = ["year", "platform"] if args.by_platform else ["year"]
+            with step("export_partitions"):
+                stats = export_partitions(conn, out_dir, columns, args.force, args.batch_rows)
+                record_rows(rows_out=stats["rows"])
+            print(f"Exported Tableau partitions to: {out_dir}")
+            print(
+                f"Partitions: {stats['written']} written ({stats['rows']} rows), "
+                f"{stats['unchanged']} unchanged, {stats['deleted']} deleted"
+            )
+            return
+
+        output_path = tableau_dir / "games_for_tableau.csv"
+        with step("export_csv"):
+            count = export_csv(conn, load_query("tableau_export"), output_path, batch_rows=args.batch_rows)
+            record_rows(rows_out=count)
 
     print(f"Exported Tableau dataset to: {output_path}")
-    print(f"Shape: {df.shape}")
+    print(f"Rows: {count}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,237 @@
+"""bench_load_to_sql.py
+
+Time a full (--rebuild) load with 05_load_to_sql.py against the previous row-by-row
+loader (iterrows + per-row dict lookup of game_id, default PRAGMAs), which
+wrote the wide games/sales/region_population tables the star schema replaced
+(LEGACY_SCHEMA, with the indexes they had).
+
+The merged intermediate is replicated --scale times, with a copy number
+appended to each name so every copy is a distinct game. Each implementation
+loads into a fresh temporary database. For both layouts the benchmark also
+reports the size of the game, sales and population tables with their indexes
+(from SQLite's dbstat table; sales_cube, which only the bulk loader builds,
+is left out) and the time of the KPI aggregates: LEGACY_KPI_QUERIES on the
+wide tables against the same queries in sql/queries/ on the star schema.
+
+Usage (from repo root):
+    python python/benchmarks/bench_load_to_sql.py --scale 1 10 50
+"""
+from pathlib import Path
+import argparse
+import sqlite3
+import sys
+import tempfile
+import time
+import pandas as pd
+
+PYTHON_DIR = Path(__file__).resolve().parent.parent
+REPO_ROOT = PYTHON_DIR.parent
+sys.path.insert(0, str(PYTHON_DIR))
+
+from stage_import import import_stage  # noqa: E402
+from storage import read_table  # noqa: E402
+
+from warehouse import load_query  # noqa: E402
+
+loader = import_stage("05_load_to_sql")
+
+LEGACY_SCHEMA = """
+CREATE TABLE games (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    platform TEXT,
+    year INTEGER,
+    genre TEXT,
+    publisher TEXT,
+    critic_score REAL,
+    user_score REAL,
+    rating TEXT
+);
+CREATE INDEX ix_games_year ON games (year);
+CREATE INDEX ix_games_genre ON games (genre);
+CREATE INDEX ix_games_rating_genre ON games (rating, genre);
+CREATE TABLE sales (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    game_id INTEGER,
+    na_sales REAL,
+    eu_sales REAL,
+    jp_sales REAL,
+    other_sales REAL,
+    global_sales REAL
+);
+CREATE INDEX ix_sales_game_measures
+    ON sales (game_id, na_sales, eu_sales, jp_sales, other_sales, global_sales);
+CREATE TABLE region_population (
+    year INTEGER PRIMARY KEY,
+    na_population REAL,
+    eu_population REAL,
+    jp_population REAL,
+    other_population REAL
+);
+"""
+
+# Natural-key indexes the wide warehouse carried once the bulk loader existed.
+# The row-by-row loader predates them, so they are added after its timed load,
+# only to compare storage with the same indexes on both layouts.
+LEGACY_KEY_INDEXES = """
+CREATE INDEX ix_games_natural_key ON games (name, platform, year);
+CREATE INDEX ix_sales_game_id ON sales (game_id);
+"""
+
+# The KPI aggregates as they were written against the wide tables.
+LEGACY_KPI_QUERIES = {
+    "sales_by_year": """
+        SELECT g.year, SUM(s.na_sales), SUM(s.eu_sales), SUM(s.jp_sales), SUM(s.other_sales),
+               SUM(s.global_sales) AS global_sales
+        FROM sales s JOIN games g ON g.id = s.game_id
+        GROUP BY g.year ORDER BY g.year
+    """,
+    "sales_by_genre": """
+        SELECT g.genre, SUM(s.na_sales), SUM(s.eu_sales), SUM(s.jp_sales), SUM(s.other_sales),
+               SUM(s.global_sales) AS global_sales
+        FROM sales s JOIN games g ON g.id = s.game_id
+        GROUP BY g.genre ORDER BY global_sales DESC
+    """,
+    "rating_genre_summary": """
+        SELECT g.rating, g.genre, AVG(s.global_sales) AS avg_global_sales, COUNT(*) AS n
+        FROM sales s JOIN games g ON g.id = s.game_id
+        GROUP BY g.rating, g.genre ORDER BY avg_global_sales DESC
+    """,
+}
+
+
+def rowwise_load(conn, schema_path, merged_df, region_df) -> None:
+    """The loader as it was before the bulk-load path, for comparison.
+
+    Values are converted to plain Python objects on the way in; everything
+    else (iterrows, dict lookup, default PRAGMAs) is unchanged.
+    """
+    games_df = merged_df[loader.GAME_KEY + loader.GAME_ATTRIBUTES].drop_duplicates()
+    sales_df = merged_df[loader.GAME_KEY + loader.SALES_MEASURES]
+    # The old schema had no natural-key indexes (and allowed duplicate keys).
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany(
+        """
+        INSERT INTO games (name, platform, year, genre, publisher, critic_score, user_score, rating)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        loader.to_rows(games_df),
+    )
+    cursor = conn.execute("SELECT id, name, platform, year FROM games")
+    game_id_lookup = {(row[1], row[2], row[3]): row[0] for row in cursor.fetchall()}
+
+    def row_to_tuple(row):
+        game_id = game_id_lookup.get((row["name"], row["platform"], row["year"]))
+        if game_id is None:
+            return None
+        return (
+            game_id,
+            float(row["na_sales"]),
+            float(row["eu_sales"]),
+            float(row["jp_sales"]),
+            float(row["other_sales"]),
+            float(row["global_sales"]),
+        )
+
+    tuples = [t for t in (row_to_tuple(row) for _, row in sales_df.iterrows()) if t]
+    conn.executemany(
+        """
+        INSERT INTO sales (game_id, na_sales, eu_sales, jp_sales, other_sales, global_sales)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        tuples,
+    )
+    conn.executemany(
+        """
+        INSERT INTO region_population (year, na_population, eu_population, jp_population, other_population)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        loader.to_rows(region_df),
+    )
+    conn.commit()
+
+
+def bulk_load(conn, schema_path, merged_df, region_df) -> None:
+    loader.load_warehouse(conn, schema_path, merged_df, region_df, rebuild=True)
+
+
+def replicate(merged_df: pd.DataFrame, scale: int) -> pd.DataFrame:
+    if scale == 1:
+        return merged_df
+    copies = []
+    for i in range(scale):
+        copy = merged_df.copy()
+        copy["name"] = copy["name"] + f" #{i}"
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def storage_mib(conn) -> float:
+    """Pages used by everything but sales_cube, in MiB (NaN without dbstat)."""
+    try:
+        size = conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name != 'sales_cube'").fetchone()[0]
+    except sqlite3.OperationalError:
+        return float("nan")
+    return size / 2**20
+
+
+def time_kpis(conn, queries: dict, repeats: int = 3) -> float:
+    """Best-of-``repeats`` seconds to run every KPI query once."""
+    conn.execute("ANALYZE")
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for sql in queries.values():
+            conn.execute(sql).fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_load(load_fn, schema_path: Path, merged_df, region_df, kpi_queries: dict, extra_indexes: str = "") -> tuple:
+    """(load seconds, sales rows, storage MiB, KPI seconds) for one loader."""
+    with tempfile.TemporaryDirectory() as tmp:
+        with sqlite3.connect(Path(tmp) / "bench.db") as conn:
+            start = time.perf_counter()
+            load_fn(conn, schema_path, merged_df, region_df)
+            elapsed = time.perf_counter() - start
+            conn.executescript(extra_indexes)
+            sales_rows = conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+            size = storage_mib(conn)
+            kpi_seconds = time_kpis(conn, kpi_queries)
+    return elapsed, sales_rows, size, kpi_seconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10])
+    args = parser.parse_args()
+
+    data_dir = REPO_ROOT / "data"
+    schema_path = REPO_ROOT / "sql" / "schema.sql"
+    columns = loader.GAME_KEY + loader.GAME_ATTRIBUTES + loader.SALES_MEASURES
+    merged_df = read_table(data_dir, "merged_games_population", columns=columns)
+    merged_df["year"] = pd.to_numeric(merged_df["year"], errors="coerce").astype("Int64")
+    region_df = read_table(data_dir, "region_population_by_year")
+
+    star_queries = {name: load_query(name) for name in LEGACY_KPI_QUERIES}
+    print(
+        f"{'rows':>10} {'row-by-row (s)':>15} {'bulk (s)':>10} {'speedup':>8}"
+        f" {'wide MiB':>9} {'star MiB':>9} {'wide KPI (ms)':>14} {'star KPI (ms)':>14}"
+    )
+    for scale in args.scale:
+        df = replicate(merged_df, scale)
+        old_s, old_rows, old_mib, old_kpi = time_load(
+            rowwise_load, schema_path, df, region_df, LEGACY_KPI_QUERIES, LEGACY_KEY_INDEXES
+        )
+        new_s, new_rows, new_mib, new_kpi = time_load(bulk_load, schema_path, df, region_df, star_queries)
+        # The bulk loader keeps one row per (name, platform, year) key.
+        if abs(old_rows - new_rows) > scale:
+            raise RuntimeError(f"Loaders disagree at scale {scale}: {old_rows} vs {new_rows} sales rows")
+        print(
+            f"{len(df):>10} {old_s:>15.3f} {new_s:>10.3f} {old_s / new_s:>7.1f}x"
+            f" {old_mib:>9.2f} {new_mib:>9.2f} {old_kpi * 1000:>14.1f} {new_kpi * 1000:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""bench_pipeline.py
+
+Time the pipeline stages and the C++ engine on synthetic data at --scale
+times the real size (see synthetic_data.py), and check them against a saved
+baseline.
+
+Each scale runs in a scratch copy of the repo (python/, sql/, cpp/ and
+data/region_schemes.csv) whose data/ holds the generated Console_Data.csv
+and Population.csv, so the real data/ and games.db are never touched. The
+stages run through pipeline.py --force --jobs 1, one at a time, so a stage's
+timing does not depend on which stages ran beside it. Per stage, the wall time is the
+runner's (interpreter start and imports included), and CPU time and peak RSS
+come from the stage's instrumentation record in the run report. Afterwards
+the engine runs full k-means and --minibatch on stage 08's features, each in
+its own process. Each pipeline's output is logged to
+reports/benchmarks/bench_pipeline_x<scale>.log.
+
+Results go to reports/benchmarks/bench_pipeline.json. --save-baseline also
+stores them as the baseline. Otherwise the run fails when any stage is more
+than --threshold (default 25%) and at least --min-seconds (default 0.5 s)
+slower than in the baseline at the same scale. The second condition keeps
+noise in sub-second stages from failing the run. Timings only compare on one
+machine, so save a baseline there before changing code.
+
+Usage (from repo root, after make -C cpp):
+    python python/benchmarks/bench_pipeline.py --scale 1 100 --save-baseline
+    python python/benchmarks/bench_pipeline.py --scale 1 100     # fails on regressions
+"""
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PYTHON_DIR = Path(__file__).resolve().parent.parent
+REPO_ROOT = PYTHON_DIR.parent
+sys.path.insert(0, str(PYTHON_DIR))
+
+from instrumentation import ENGINE_METRICS_PREFIX  # noqa: E402
+from pipeline import ENGINE_LIBRARY  # noqa: E402
+from storage import intermediate_format  # noqa: E402
+from synthetic_data import generate  # noqa: E402
+
+BENCH_DIR = REPO_ROOT / "reports" / "benchmarks"
+RESULTS_PATH = BENCH_DIR / "bench_pipeline.json"
+BASELINE_PATH = BENCH_DIR / "bench_pipeline_baseline.json"
+ENGINE = Path("cpp") / ("cluster_engine.exe" if os.name == "nt" else "cluster_engine")
+
+
+def scale_key(scale: float) -> str:
+    return f"{scale:g}"
+
+
+def make_sandbox(root: Path) -> None:
+    shutil.copytree(PYTHON_DIR, root / "python", ignore=shutil.ignore_patterns("__pycache__"))
+    shutil.copytree(REPO_ROOT / "sql", root / "sql")
+    shutil.copytree(REPO_ROOT / "cpp", root / "cpp")
+    (root / "data").mkdir()
+    shutil.copy2(REPO_ROOT / "data" / "region_schemes.csv", root / "data")
+
+
+def run_pipeline(root: Path, log_path: Path) -> dict:
+    """{stage: metrics} of one forced pipeline run in root."""
+    report_path = root / "reports" / "run_report.json"
+    with open(log_path, "w") as log:
+        result = subprocess.run(
+            [sys.executable, str(root / "python" / "pipeline.py"), "--force", "--jobs", "1", "--report", str(report_path)],
+            cwd=root,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            check=False,
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"Pipeline failed (code {result.returncode}); see {log_path}")
+    stages = {}
+    for entry in json.loads(report_path.read_text())["stages"]:
+        metrics = entry.get("metrics", {})
+        stages[entry["name"]] = {
+            "wall_seconds": entry["wall_seconds"],
+            "cpu_seconds": metrics.get("cpu_seconds"),
+            "peak_rss_mib": metrics.get("peak_rss_mib"),
+            "rows_in": metrics.get("rows_in"),
+            "rows_out": metrics.get("rows_out"),
+        }
+    return stages
+
+
+def run_engine(root: Path, args: list) -> dict:
+    """Wall time of one engine process, with CPU time and peak RSS from its METRICS lines."""
+    start = time.perf_counter()
+    result = subprocess.run([str(root / ENGINE), *args], cwd=root, capture_output=True, text=True, check=False)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Engine failed (code {result.returncode}): {result.stdout} {result.stderr}")
+    phases = [
+        json.loads(line[len(ENGINE_METRICS_PREFIX) :])
+        for line in result.stdout.splitlines()
+        if line.startswith(ENGINE_METRICS_PREFIX)
+    ]
+    peaks = [p["peak_rss_mib"] for p in phases if p.get("peak_rss_mib") is not None]
+    return {
+        "wall_seconds": wall,
+        "cpu_seconds": sum(p["cpu_seconds"] for p in phases),
+        "peak_rss_mib": max(peaks) if peaks else None,
+        "rows_in": phases[0]["rows"] if phases else None,
+        "rows_out": None,
+    }
+
+
+def bench_scale(scale: float, seed: int, work_dir: Path) -> dict:
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        root = Path(tmp)
+        make_sandbox(root)
+        start = time.perf_counter()
+        rows = generate(root / "data", scale, seed)
+        generate_seconds = time.perf_counter() - start
+        stages = run_pipeline(root, BENCH_DIR / f"bench_pipeline_x{scale_key(scale)}.log")
+        engine_args = ["5", "--input", "data/features_for_clustering.bin", "--output", "data/bench_labels.bin"]
+        stages["engine.full"] = run_engine(root, engine_args)
+        stages["engine.minibatch"] = run_engine(root, engine_args + ["--minibatch"])
+    return {"rows": rows["Console_Data.csv"], "generate_seconds": generate_seconds, "stages": stages}
+
+
+def regressions(current: dict, baseline: dict, threshold: float, min_seconds: float) -> list:
+    found = []
+    for key, result in current["scales"].items():
+        base = baseline.get("scales", {}).get(key)
+        if base is None:
+            continue
+        for name, metrics in result["stages"].items():
+            before = base["stages"].get(name, {}).get("wall_seconds")
+            after = metrics["wall_seconds"]
+            if before and after > before * (1 + threshold) and after - before >= min_seconds:
+                found.append(f"{name} at {key}x: {before:.2f} s -> {after:.2f} s ({after / before - 1:+.0%})")
+    return found
+
+
+def print_table(results: dict, baseline: dict) -> None:
+    print(f"{'scale':>6} {'rows':>10} {'stage':<36} {'wall (s)':>9} {'cpu (s)':>8} {'peak RSS (MiB)':>15} {'baseline':>9} {'change':>7}")
+    for key, result in results["scales"].items():
+        base = baseline.get("scales", {}).get(key, {}).get("stages", {})
+        for name, m in result["stages"].items():
+            before = base.get(name, {}).get("wall_seconds")
+            cpu = f"{m['cpu_seconds']:.2f}" if m["cpu_seconds"] is not None else "-"
+            rss = f"{m['peak_rss_mib']:.1f}" if m["peak_rss_mib"] is not None else "-"
+            change = f"{m['wall_seconds'] / before - 1:+.0%}" if before else ""
+            before_text = f"{before:.2f}" if before else ""
+            print(
+                f"{key:>6} {result['rows']:>10} {name:<36} {m['wall_seconds']:>9.2f} {cpu:>8} {rss:>15} "
+                f"{before_text:>9} {change:>7}"
+            )
+
+
+def write_json(path: Path, data: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, indent=2))
+    tmp.replace(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--scale", type=float, nargs="+", default=[1, 10])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threshold", type=float, default=0.25, help="max relative slowdown of a stage")
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="ignore slowdowns smaller than this")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--work-dir", type=Path, default=None, help="where to create the scratch repos")
+    args = parser.parse_args()
+    if min(args.scale) < 1:
+        parser.error("--scale values must be at least 1")
+
+    for path in (REPO_ROOT / ENGINE, REPO_ROOT / ENGINE_LIBRARY):
+        if not path.exists():
+            raise FileNotFoundError(f"{path} not found. Compile the engine with: make -C cpp")
+    BENCH_DIR.mkdir(parents=True, exist_ok=True)
+
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": platform.platform(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "intermediate_format": intermediate_format(),
+        "scales": {},
+    }
+    for scale in args.scale:
+        print(f"Running scale {scale:g}x ...")
+        results["scales"][scale_key(scale)] = bench_scale(scale, args.seed, args.work_dir)
+    write_json(RESULTS_PATH, results)
+
+    baseline = {}
+    if args.baseline.exists() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("machine") != results["machine"] or baseline.get("cpus") != results["cpus"]:
+            print(f"Warning: baseline was recorded on {baseline.get('machine')} ({baseline.get('cpus')} CPUs)")
+    print_table(results, baseline)
+    print(f"Wrote results to: {RESULTS_PATH}")
+
+    if args.save_baseline:
+        write_json(args.baseline, results)
+        print(f"Saved baseline to: {args.baseline}")
+        return
+    if not baseline:
+        print(f"No baseline at {args.baseline}; rerun with --save-baseline to record one.")
+        return
+    found = regressions(results, baseline, args.threshold, args.min_seconds)
+    if found:
+        raise RuntimeError(f"{len(found)} stage(s) regressed beyond {args.threshold:.0%}:\n" + "\n".join(found))
+    print(f"No stage regressed beyond {args.threshold:.0%} of the baseline.")
+
+
+if __name__ == "__main__":
+    main()
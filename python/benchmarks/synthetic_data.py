@@ -0,0 +1,211 @@
+"""synthetic_data.py
+
+Write Console_Data.csv and Population.csv at --scale times the size of the real
+files in data/, for benchmarking the pipeline at sizes the repo has no data for.
+
+The output is built from copies of the real rows, so categorical values
+(platform, genre, publisher, rating, developer, year) keep the real
+distributions and cardinalities, and missing values stay missing at the real
+rates. Copy 0 is the real file byte for byte. Later copies differ from it:
+- their names get a " #<copy>" suffix, so (name, platform, year) stays
+  unique per game;
+- sales and counts are multiplied by lognormal noise (sd 0.25 in log space)
+  and rounded to the real file's granularity (1000 units for sales). Zeros
+  stay zero, so the skew and the share of games with no sales in a region
+  are kept;
+- scores move by N(0, 0.3), clipped to 0-10 and rounded to one decimal.
+A fractional --scale ends with a random subset of one more copy.
+
+The raw format is kept as well: tab-delimited, the header copied verbatim
+(including its trailing empty columns), LF line endings, and no newline after
+the last row if the source has none.
+
+Population.csv gets one row per country per copy, all under the real country
+code (so the region schemes of stage 03 still apply). Each copy carries
+1/scale of the country's population with lognormal noise (sd 0.05), so the
+regional totals stay close to the real ones.
+
+Rows are generated and written GENERATE_CHUNK_ROWS at a time, so memory does
+not grow with --scale.
+
+Usage (from repo root):
+    python python/benchmarks/synthetic_data.py --scale 100 --out /tmp/synthetic/data
+"""
+from pathlib import Path
+import argparse
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parent.parent.parent
+DATA_DIR = REPO_ROOT / "data"
+
+GENERATE_CHUNK_ROWS = 250_000
+SALES_JITTER = 0.25
+SCORE_JITTER = 0.3
+POPULATION_JITTER = 0.05
+
+
+def read_raw(path: Path) -> tuple:
+    """(header line, body bytes ending in a newline, whether the file ends in one, frame)."""
+    if not path.exists():
+        raise FileNotFoundError(f"Source file not found: {path}")
+    raw = path.read_bytes()
+    header, _, body = raw.partition(b"\n")
+    final_newline = raw.endswith(b"\n")
+    if body and not final_newline:
+        body += b"\n"
+    # Only empty cells are missing, as in the cleaning stages' view of the file.
+    df = pd.read_csv(path, sep="\t", keep_default_na=False, na_values=[""])
+    return header, body, final_newline, df
+
+
+def integral_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Float columns holding only whole numbers (ints with gaps) as Int64, so they print as ints."""
+    out = df.copy()
+    for col in out.columns:
+        values = out[col]
+        if values.dtype.kind == "f" and values.notna().any() and (values.dropna() % 1 == 0).all():
+            out[col] = values.astype("Int64")
+    return out
+
+
+def granularity(values: pd.Series) -> int:
+    """Greatest common divisor of the positive values (1 for non-integers)."""
+    positive = values.dropna()
+    positive = positive[positive > 0]
+    if positive.empty or (positive % 1 != 0).any():
+        return 1
+    return max(int(np.gcd.reduce(positive.to_numpy(dtype=np.int64))), 1)
+
+
+def copy_plan(n: int, scale: float, rng: np.random.Generator) -> list:
+    """[(copy number, source row positions)], copy 0 first and complete."""
+    total = round(n * scale)
+    plan = [(c, np.arange(n)) for c in range(total // n)]
+    rest = total % n
+    if rest:
+        plan.append((total // n, np.sort(rng.choice(n, rest, replace=False))))
+    return plan
+
+
+def chunks(plan: list, n: int) -> list:
+    """Group consecutive copies into chunks of about GENERATE_CHUNK_ROWS rows."""
+    per_chunk = max(1, GENERATE_CHUNK_ROWS // max(n, 1))
+    return [plan[i : i + per_chunk] for i in range(0, len(plan), per_chunk)]
+
+
+def jitter_console(df: pd.DataFrame, copies: np.ndarray, rng: np.random.Generator, steps: dict) -> pd.DataFrame:
+    """Copies of df's rows (copy number per row in copies) with names, sales and scores varied."""
+    out = df.copy()
+    out["name"] = out["name"].astype(str) + " #" + copies.astype(str)
+    for col in out.columns:
+        if col.endswith("_sales") or col.endswith("_count"):
+            values = out[col].astype("float64")
+            step = steps[col]
+            noisy = values * rng.lognormal(0.0, SALES_JITTER, len(out))
+            rounded = np.round(noisy / step) * step
+            # Non-zero values stay non-zero, zeros stay zero.
+            out[col] = np.where(values > 0, np.maximum(rounded, step), values)
+        elif col.endswith("_score"):
+            values = out[col].astype("float64")
+            noisy = np.clip(values + rng.normal(0.0, SCORE_JITTER, len(out)), 0.0, 10.0)
+            out[col] = np.round(noisy, 1)
+    return integral_columns(out)
+
+
+def write_frame(f, df: pd.DataFrame) -> None:
+    f.write(df.to_csv(sep="\t", header=False, index=False, lineterminator="\n", float_format="%.10g").encode())
+
+
+def finish(f, final_newline: bool) -> None:
+    """Drop the last newline if the source file has none."""
+    if not final_newline and f.tell() > 0:
+        f.seek(-1, 2)
+        f.truncate()
+
+
+def generate_console(source: Path, out: Path, scale: float, seed: int = 0) -> int:
+    """Write out as a scale-times copy of the console file; returns its row count."""
+    header, body, final_newline, df = read_raw(source)
+    rng = np.random.default_rng(seed)
+    steps = {c: granularity(df[c]) for c in df.columns if c.endswith("_sales") or c.endswith("_count")}
+    plan = copy_plan(len(df), scale, rng)
+    rows = 0
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "wb") as f:
+        f.write(header + b"\n")
+        for chunk in chunks(plan, len(df)):
+            if chunk[0][0] == 0:
+                f.write(body)
+                rows += len(df)
+                chunk = chunk[1:]
+            if not chunk:
+                continue
+            positions = np.concatenate([p for _, p in chunk])
+            copies = np.concatenate([np.full(len(p), c) for c, p in chunk])
+            frame = df.iloc[positions].reset_index(drop=True)
+            write_frame(f, jitter_console(frame, copies, rng, steps))
+            rows += len(frame)
+        finish(f, final_newline)
+    return rows
+
+
+def generate_population(source: Path, out: Path, scale: float, seed: int = 0) -> int:
+    """Write out with about scale rows per country; returns its row count."""
+    header, body, final_newline, df = read_raw(source)
+    rng = np.random.default_rng(seed + 1)
+    plan = copy_plan(len(df), scale, rng)
+    rows = 0
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "wb") as f:
+        f.write(header + b"\n")
+        if len(plan) == 1 and len(plan[0][1]) == len(df):
+            f.write(body)
+            rows = len(df)
+        else:
+            name_col = df.columns[0]
+            value_cols = list(df.columns[2:])
+            for chunk in chunks(plan, len(df)):
+                positions = np.concatenate([p for _, p in chunk])
+                copies = np.concatenate([np.full(len(p), c) for c, p in chunk])
+                frame = df.iloc[positions].reset_index(drop=True)
+                frame[name_col] = np.where(
+                    copies == 0, frame[name_col].astype(str), frame[name_col].astype(str) + " #" + copies.astype(str)
+                )
+                noise = rng.lognormal(0.0, POPULATION_JITTER, (len(frame), len(value_cols)))
+                values = frame[value_cols].to_numpy(dtype=np.float64) * noise / scale
+                frame[value_cols] = pd.DataFrame(np.round(values), columns=value_cols).astype("Int64")
+                write_frame(f, frame)
+                rows += len(frame)
+        finish(f, final_newline)
+    return rows
+
+
+def generate(out_dir: Path, scale: float, seed: int = 0, source_dir: Path = DATA_DIR) -> dict:
+    """Write Console_Data.csv and Population.csv into out_dir; returns their row counts."""
+    if scale < 1:
+        raise ValueError("scale must be at least 1")
+    return {
+        "Console_Data.csv": generate_console(source_dir / "Console_Data.csv", out_dir / "Console_Data.csv", scale, seed),
+        "Population.csv": generate_population(source_dir / "Population.csv", out_dir / "Population.csv", scale, seed),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("--scale", type=float, default=1.0, help="output size relative to the real files (>= 1)")
+    parser.add_argument("--out", type=Path, required=True, help="directory to write the two files into")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source", type=Path, default=DATA_DIR, help="directory holding the real files")
+    args = parser.parse_args()
+    if args.scale < 1:
+        parser.error("--scale must be at least 1")
+    if args.out.resolve() == args.source.resolve():
+        parser.error("--out must not be the source directory")
+
+    for name, rows in generate(args.out, args.scale, args.seed, args.source).items():
+        print(f"Wrote {rows} rows to: {args.out / name}")
+
+
+if __name__ == "__main__":
+    main()
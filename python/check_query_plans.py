@@ -0,0 +1,105 @@
+"""check_query_plans.py
+
+Query-plan regression check for the analytical queries in sql/queries/.
+
+Every query is run through EXPLAIN QUERY PLAN against a fresh database built
+from sql/schema.sql and, if it exists, the loaded warehouse (data/games.db,
+which 05_load_to_sql.py has ANALYZEd). A query fails when:
+- an index named in its "-- uses-index:" header is not used (a|b accepts
+  either index), or
+- the plan contains a bare table scan (SCAN <table> without an index) of a
+  table not listed in its "-- allow-full-scan:" header, or
+- the plan uses no index at all, unless every table it reads is listed in
+  "-- allow-full-scan:".
+
+Exits non-zero on any failure, so it can gate schema and query edits:
+    python python/check_query_plans.py
+"""
+from pathlib import Path
+from typing import Optional
+import argparse
+import re
+import sqlite3
+import sys
+
+from warehouse import DB_PATH, SCHEMA_PATH, load_query, query_directives, query_names
+
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|GROUP\b|ORDER\b|LEFT\b|JOIN\b|LIMIT\b)(\w+))?", re.I)
+_BARE_SCAN = re.compile(r"^SCAN (\w+)$")
+_INDEX_USE = re.compile(r"USING (?:COVERING )?INDEX (\w+)|USING INTEGER PRIMARY KEY")
+
+
+def table_aliases(sql: str) -> dict:
+    """alias -> table for every FROM/JOIN reference in a query."""
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        aliases[alias or table] = table
+    return aliases
+
+
+def explain(conn: sqlite3.Connection, sql: str) -> list:
+    params = [None] * sql.count("?")
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_plan(sql: str, plan: list) -> list:
+    """Problems found in one query's plan (empty list if it passes)."""
+    directives = query_directives(sql)
+    aliases = table_aliases(sql)
+    used = {m.group(1) for step in plan for m in _INDEX_USE.finditer(step) if m.group(1)}
+    problems = []
+
+    for expected in directives["uses-index"]:
+        options = expected.split("|")
+        if not used.intersection(options):
+            problems.append(f"expected index {expected} is not used")
+
+    for step in plan:
+        match = _BARE_SCAN.match(step)
+        if match:
+            table = aliases.get(match.group(1), match.group(1))
+            if table not in directives["allow-full-scan"]:
+                problems.append(f"full table scan of {table}")
+
+    scans_allowed = set(aliases.values()) <= set(directives["allow-full-scan"])
+    if not scans_allowed and not any(_INDEX_USE.search(step) for step in plan):
+        problems.append("no index used")
+    return problems
+
+
+def check_database(conn: sqlite3.Connection, label: str) -> int:
+    failures = 0
+    print(f"== {label}")
+    for name in query_names():
+        sql = load_query(name)
+        plan = explain(conn, sql)
+        problems = check_plan(sql, plan)
+        status = "FAIL" if problems else "ok"
+        print(f"{status:4} {name}: {' | '.join(plan)}")
+        for problem in problems:
+            print(f"     - {problem}")
+        failures += bool(problems)
+    return failures
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Check that shipped queries use indexes.")
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="loaded warehouse to check as well")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    with sqlite3.connect(":memory:") as conn:
+        conn.executescript(SCHEMA_PATH.read_text())
+        failures += check_database(conn, "fresh schema")
+    if args.db.exists():
+        with sqlite3.connect(f"file:{args.db}?mode=ro", uri=True) as conn:
+            failures += check_database(conn, str(args.db))
+
+    if failures:
+        print(f"{failures} query plan check(s) failed.")
+        sys.exit(1)
+    print("All query plans use indexes.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""cluster_model.py
+
+Versioned cluster models: the StandardScaler mean/scale fitted on the
+clustering features (08_prepare_features_for_clustering.py) and the k-means
+centroids in scaled units (09_integrate_cpp_clusters.py), stored in the
+cluster_models, cluster_model_features and cluster_model_centroids tables.
+
+A saved model assigns new games without re-scaling or re-clustering the
+catalog: predict() scales only the given rows with the stored scaler and
+labels them with the nearest centroid, PREDICT_BATCH_ROWS rows at a time.
+09_integrate_cpp_clusters.py --predict does this for every game that has no
+cluster yet.
+
+save_model() adds a version only when the model differs from the latest one,
+so a no-op rerun (e.g. a warm start with nothing new) adds nothing, and it
+keeps only the newest MODEL_RETENTION versions.
+
+match_cluster_ids() keeps cluster ids stable from one model to the next, and
+feature_hashes() fingerprints each game's features so a warm-started run
+(09 --warm-start) can tell which games changed since they were clustered.
+
+Usage:
+    from cluster_model import load_model
+    model = load_model(conn)            # latest version, or load_model(conn, 3)
+    labels = model.predict(raw_df)      # raw_df holds model.features columns
+    python python/cluster_model.py      # list saved versions
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+import sqlite3
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+
+from warehouse import DB_PATH
+
+# Rows scaled and assigned per step of predict(); bounds the k x rows
+# distance matrix.
+PREDICT_BATCH_ROWS = 65_536
+
+# Saved model versions kept; older ones are deleted when a new one is saved.
+MODEL_RETENTION = 20
+
+
+@dataclass
+class ClusterModel:
+    features: list
+    mean: np.ndarray  # per feature, original units
+    scale: np.ndarray  # per feature, original units
+    centroids: np.ndarray  # k x len(features), scaled units
+    version: Optional[int] = None
+
+    @classmethod
+    def from_scaler(cls, scaler, centroids: np.ndarray, features: list) -> "ClusterModel":
+        return cls(
+            features=list(features),
+            mean=np.array(scaler.mean_, dtype=np.float64),
+            scale=np.array(scaler.scale_, dtype=np.float64),
+            centroids=np.array(centroids, dtype=np.float64),
+        )
+
+    @property
+    def k(self) -> int:
+        return len(self.centroids)
+
+    def transform(self, raw_df: pd.DataFrame) -> np.ndarray:
+        """Scale raw feature rows the way the model's training data was scaled."""
+        return (raw_df[self.features].to_numpy(dtype=np.float64) - self.mean) / self.scale
+
+    def predict(self, raw_df: pd.DataFrame, batch_rows: int = PREDICT_BATCH_ROWS) -> np.ndarray:
+        """Nearest-centroid cluster id (int32) of every row of raw_df."""
+        X = self.transform(raw_df)
+        labels = np.empty(len(X), dtype=np.int32)
+        for begin in range(0, len(X), batch_rows):
+            batch = X[begin : begin + batch_rows]
+            distances = ((batch[:, None, :] - self.centroids[None, :, :]) ** 2).sum(axis=2)
+            labels[begin : begin + len(batch)] = distances.argmin(axis=1)
+        return labels
+
+    def centroids_in_original_units(self) -> np.ndarray:
+        return self.centroids * self.scale + self.mean
+
+    def same_as(self, other: "ClusterModel") -> bool:
+        """Whether other has the same features, scaler and centroids (up to float noise)."""
+        return (
+            self.features == other.features
+            and self.centroids.shape == other.centroids.shape
+            and np.allclose(self.mean, other.mean, rtol=1e-12, atol=0.0)
+            and np.allclose(self.scale, other.scale, rtol=1e-12, atol=0.0)
+            and np.allclose(self.centroids, other.centroids, rtol=1e-9, atol=1e-12)
+        )
+
+
+def match_cluster_ids(centroids: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    """New id for each row of centroids so ids follow the previous model's.
+
+    Clusters are paired one-to-one with previous centroids at minimum total
+    distance (Hungarian algorithm, both in the same scaled units). A cluster
+    takes its partner's id if that id is below k; any others take the unused
+    ids in order, so ids stay 0..k-1 when k changes.
+    """
+    k = len(centroids)
+    cost = np.sqrt(((centroids[:, None, :] - previous[None, :, :]) ** 2).sum(axis=2))
+    new_ids = np.full(k, -1, dtype=np.int64)
+    for row, col in zip(*linear_sum_assignment(cost)):
+        if col < k:
+            new_ids[row] = col
+    unused = iter(sorted(set(range(k)) - set(new_ids[new_ids >= 0].tolist())))
+    for row in range(k):
+        if new_ids[row] < 0:
+            new_ids[row] = next(unused)
+    return new_ids
+
+
+def feature_hashes(raw_df: pd.DataFrame, features: list) -> np.ndarray:
+    """64-bit hash of each row's feature values, as int64 for SQLite."""
+    return pd.util.hash_pandas_object(raw_df[features], index=False).to_numpy().view(np.int64)
+
+
+def save_model(conn: sqlite3.Connection, model: ClusterModel, keep: int = MODEL_RETENTION, **metrics) -> int:
+    """Store model as a new version (metrics: seed, inertia, silhouette, davies_bouldin).
+
+    If the latest version is the same model, nothing is stored and its
+    version is returned. Either way, versions older than the newest keep are
+    deleted.
+    """
+    latest = latest_version(conn)
+    if latest is not None and model.same_as(load_model(conn, latest)):
+        prune_models(conn, keep)
+        model.version = latest
+        return latest
+    cursor = conn.execute(
+        "INSERT INTO cluster_models (created_at, k, seed, inertia, silhouette, davies_bouldin) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            model.k,
+            metrics.get("seed"),
+            metrics.get("inertia"),
+            metrics.get("silhouette"),
+            metrics.get("davies_bouldin"),
+        ),
+    )
+    version = cursor.lastrowid
+    conn.executemany(
+        "INSERT INTO cluster_model_features (version, position, feature, mean, scale) VALUES (?, ?, ?, ?, ?)",
+        [(version, i, name, float(model.mean[i]), float(model.scale[i])) for i, name in enumerate(model.features)],
+    )
+    conn.executemany(
+        "INSERT INTO cluster_model_centroids (version, cluster_id, position, value) VALUES (?, ?, ?, ?)",
+        [
+            (version, c, i, float(model.centroids[c, i]))
+            for c in range(model.k)
+            for i in range(len(model.features))
+        ],
+    )
+    prune_models(conn, keep)
+    model.version = version
+    return version
+
+
+def prune_models(conn: sqlite3.Connection, keep: int = MODEL_RETENTION) -> int:
+    """Delete all but the newest keep model versions; returns how many were deleted."""
+    old = [
+        row[0]
+        for row in conn.execute("SELECT version FROM cluster_models ORDER BY version DESC LIMIT -1 OFFSET ?", (keep,))
+    ]
+    for table in ("cluster_model_centroids", "cluster_model_features", "cluster_models"):
+        conn.executemany(f"DELETE FROM {table} WHERE version = ?", [(v,) for v in old])
+    return len(old)
+
+
+def latest_version(conn: sqlite3.Connection) -> Optional[int]:
+    return conn.execute("SELECT MAX(version) FROM cluster_models").fetchone()[0]
+
+
+def load_model(conn: sqlite3.Connection, version: Optional[int] = None) -> ClusterModel:
+    """The given model version, or the latest one."""
+    if version is None:
+        version = latest_version(conn)
+        if version is None:
+            raise RuntimeError("No saved cluster model. Run 09_integrate_cpp_clusters.py first.")
+    row = conn.execute("SELECT k FROM cluster_models WHERE version = ?", (version,)).fetchone()
+    if row is None:
+        raise RuntimeError(f"Cluster model version {version} not found")
+    k = row[0]
+
+    features = conn.execute(
+        "SELECT feature, mean, scale FROM cluster_model_features WHERE version = ? ORDER BY position",
+        (version,),
+    ).fetchall()
+    values = conn.execute(
+        "SELECT value FROM cluster_model_centroids WHERE version = ? ORDER BY cluster_id, position",
+        (version,),
+    ).fetchall()
+    if len(values) != k * len(features):
+        raise RuntimeError(f"Cluster model version {version} is incomplete")
+    return ClusterModel(
+        features=[f[0] for f in features],
+        mean=np.array([f[1] for f in features], dtype=np.float64),
+        scale=np.array([f[2] for f in features], dtype=np.float64),
+        centroids=np.array([v[0] for v in values], dtype=np.float64).reshape(k, len(features)),
+        version=version,
+    )
+
+
+def list_models(conn: sqlite3.Connection) -> pd.DataFrame:
+    return pd.read_sql_query("SELECT * FROM cluster_models ORDER BY version", conn)
+
+
+def main() -> None:
+    if not DB_PATH.exists():
+        raise FileNotFoundError(f"Database not found: {DB_PATH}")
+    with sqlite3.connect(DB_PATH) as conn:
+        models = list_models(conn)
+    if models.empty:
+        print("No saved cluster models.")
+    else:
+        print(models.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
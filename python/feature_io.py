@@ -0,0 +1,97 @@
+"""feature_io.py
+
+Binary matrix files exchanged with the C++ clustering engine.
+
+Layout (little-endian), shared by cpp/clustering.cpp:
+    offset 0   magic      4 bytes   b"GFM1" (features) or b"GCL1" (cluster labels)
+    offset 4   dtype      uint32    1 = float64, 2 = float32, 3 = int32
+    offset 8   rows       uint64
+    offset 16  dim        uint64
+    offset 24  reserved   uint64    0
+    offset 32  matrix     rows x dim values of dtype, row-major
+               padding    zero bytes up to a multiple of 8
+               ids        rows x int64 (game_id)
+
+A label file is the same with dim = 1 and int32 labels as the matrix. Reading
+memory-maps the file, so nothing is parsed or copied until the arrays are used.
+"""
+from pathlib import Path
+import struct
+import numpy as np
+
+FEATURES_MAGIC = b"GFM1"
+LABELS_MAGIC = b"GCL1"
+
+HEADER = struct.Struct("<4sIQQQ")
+DTYPES = {1: np.dtype("<f8"), 2: np.dtype("<f4"), 3: np.dtype("<i4")}
+DTYPE_CODES = {dtype: code for code, dtype in DTYPES.items()}
+ID_DTYPE = np.dtype("<i8")
+
+
+def _ids_offset(rows: int, dim: int, dtype: np.dtype) -> int:
+    matrix_bytes = rows * dim * dtype.itemsize
+    return HEADER.size + (matrix_bytes + 7) // 8 * 8
+
+
+def write_matrix(path: Path, magic: bytes, matrix: np.ndarray, ids: np.ndarray) -> None:
+    matrix = np.asarray(matrix)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(-1, 1)
+    dtype = matrix.dtype.newbyteorder("<")
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported matrix dtype: {matrix.dtype}")
+    rows, dim = matrix.shape
+    ids = np.asarray(ids, dtype=ID_DTYPE)
+    if len(ids) != rows:
+        raise ValueError(f"Expected {rows} ids, got {len(ids)}")
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(magic, DTYPE_CODES[dtype], rows, dim, 0))
+        np.ascontiguousarray(matrix, dtype=dtype).tofile(f)
+        f.write(b"\0" * (_ids_offset(rows, dim, dtype) - f.tell()))
+        ids.tofile(f)
+
+
+def read_matrix(path: Path, magic: bytes) -> tuple:
+    """(ids, matrix) as read-only memory-mapped arrays."""
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"Matrix file not found: {path}")
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"Truncated matrix file: {path}")
+    file_magic, code, rows, dim, _ = HEADER.unpack(header)
+    if file_magic != magic:
+        raise ValueError(f"{path} is not a {magic.decode()} file (magic {file_magic!r})")
+    if code not in DTYPES:
+        raise ValueError(f"Unsupported dtype code {code} in {path}")
+    dtype = DTYPES[code]
+
+    offset = _ids_offset(rows, dim, dtype)
+    expected = offset + rows * ID_DTYPE.itemsize
+    if path.stat().st_size < expected:
+        raise ValueError(f"Truncated matrix file: {path} ({path.stat().st_size} of {expected} bytes)")
+    if rows == 0:
+        return np.empty(0, dtype=ID_DTYPE), np.empty((0, dim), dtype=dtype)
+    matrix = np.memmap(path, dtype=dtype, mode="r", offset=HEADER.size, shape=(rows, dim))
+    ids = np.memmap(path, dtype=ID_DTYPE, mode="r", offset=offset, shape=(rows,))
+    return ids, matrix
+
+
+def write_features(path: Path, features: np.ndarray, ids: np.ndarray) -> None:
+    write_matrix(path, FEATURES_MAGIC, features, ids)
+
+
+def read_features(path: Path) -> tuple:
+    return read_matrix(path, FEATURES_MAGIC)
+
+
+def write_labels(path: Path, labels: np.ndarray, ids: np.ndarray) -> None:
+    write_matrix(path, LABELS_MAGIC, np.asarray(labels, dtype="<i4"), ids)
+
+
+def read_labels(path: Path) -> tuple:
+    """(ids, labels) with labels as a 1-D int32 array."""
+    ids, labels = read_matrix(path, LABELS_MAGIC)
+    return ids, labels[:, 0]
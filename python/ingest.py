@@ -0,0 +1,175 @@
+"""ingest.py
+
+Read the raw vendor files (data/Console_Data.csv, data/Population.csv) in a
+single parse.
+
+sniff() reads the first SNIFF_BYTES of a file and works out:
+- the encoding: a UTF-8 or UTF-16 byte order mark, else UTF-8 if the sample
+  decodes, else Latin-1;
+- the delimiter: whichever of tab, comma, semicolon and pipe splits the
+  sample lines into the most consistent number of fields (more than one);
+- the quoting: CSV quoting (QUOTE_MINIMAL, pandas' default), unless a
+  sample field opens a quote that it never closes. Then quotes are ordinary
+  characters (QUOTE_NONE), so a stray inch mark in a title cannot swallow
+  the rest of the file;
+- trailing empty columns: unnamed header columns at the end that are empty in
+  every sample row, such as the seven empty tab columns of Console_Data.csv;
+- the line ending, for the report.
+
+read_raw() then parses the whole file once with pandas' C parser using that
+dialect (whole, or in chunks with chunksize=). The sample may not be
+representative, so every parsed frame or chunk is checked against it: the
+trailing columns are dropped only if they are empty throughout, and under
+QUOTE_NONE a field quoted from end to end is an error. Either raises
+RuntimeError rather than losing or mangling data. The pyarrow engine is not
+used: it cannot stream chunks and infers some dtypes differently, which
+would change the cleaned outputs.
+
+Usage:
+    from ingest import read_raw, sniff
+    dialect = sniff(path)
+    print(dialect.describe())
+    df = read_raw(path, dialect)
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+import codecs
+import csv
+import pandas as pd
+
+SNIFF_BYTES = 64 * 1024
+DELIMITERS = ("\t", ",", ";", "|")
+DELIMITER_NAMES = {"\t": "tab", ",": "comma", ";": "semicolon", "|": "pipe"}
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+@dataclass(frozen=True)
+class Dialect:
+    delimiter: str
+    encoding: str
+    quoting: int  # csv.QUOTE_MINIMAL or csv.QUOTE_NONE
+    columns: int  # header columns, trailing empty ones included
+    trailing_empty: int
+    line_ending: str
+
+    def read_csv_options(self) -> dict:
+        return {
+            "sep": self.delimiter,
+            "encoding": self.encoding,
+            "quoting": self.quoting,
+            "engine": "c",
+        }
+
+    def describe(self) -> str:
+        quoting = "CSV quoting" if self.quoting == csv.QUOTE_MINIMAL else "quoting off (stray quote)"
+        trailing = f", {self.trailing_empty} empty trailing columns skipped" if self.trailing_empty else ""
+        ending = "CRLF" if self.line_ending == "\r\n" else "LF"
+        return (
+            f"{DELIMITER_NAMES.get(self.delimiter, repr(self.delimiter))}-delimited, {self.encoding}, {quoting}, "
+            f"{self.columns - self.trailing_empty} columns{trailing}, {ending} line endings"
+        )
+
+
+def decode_sample(sample: bytes, truncated: bool) -> tuple:
+    """(text, encoding) of the first bytes of a file."""
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return sample.decode(encoding, errors="ignore"), encoding
+    # A truncated sample may end inside a multi-byte character.
+    for cut in range(4 if truncated else 1):
+        try:
+            return sample[: len(sample) - cut].decode("utf-8"), "utf-8"
+        except UnicodeDecodeError:
+            continue
+    return sample.decode("latin-1"), "latin-1"
+
+
+def delimiter_score(lines: list, delimiter: str) -> tuple:
+    """(splits into several fields, share of lines with the usual field count, that count)."""
+    counts = [len(row) for row in csv.reader(lines, delimiter=delimiter)]
+    usual = max(set(counts), key=counts.count)
+    return usual > 1, counts.count(usual) / len(counts), usual
+
+
+def has_stray_quote(lines: list, delimiter: str) -> bool:
+    """Whether a field opens a double quote that it does not close."""
+    return any(
+        field.startswith('"') and (len(field) < 2 or not field.endswith('"'))
+        for line in lines
+        for field in line.split(delimiter)
+    )
+
+
+def sniff(path: Path, sample_bytes: int = SNIFF_BYTES) -> Dialect:
+    """The dialect of a delimited text file, from its first sample_bytes."""
+    if not path.exists():
+        raise FileNotFoundError(f"Raw file not found: {path}")
+    with open(path, "rb") as f:
+        sample = f.read(sample_bytes)
+    truncated = len(sample) == sample_bytes
+    text, encoding = decode_sample(sample, truncated)
+    line_ending = "\r\n" if "\r\n" in text else "\n"
+    lines = text.splitlines()
+    if truncated and len(lines) > 1:
+        lines = lines[:-1]  # the last line may be cut off
+    if not lines:
+        raise RuntimeError(f"Raw file is empty: {path}")
+
+    delimiter = max(DELIMITERS, key=lambda d: delimiter_score(lines, d))
+    quoting = csv.QUOTE_NONE if has_stray_quote(lines, delimiter) else csv.QUOTE_MINIMAL
+    rows = list(csv.reader(lines, delimiter=delimiter, quoting=quoting))
+    header = rows[0]
+    trailing = 0
+    for position in range(len(header) - 1, 0, -1):
+        if header[position].strip() or any(len(row) > position and row[position].strip() for row in rows[1:]):
+            break
+        trailing += 1
+    return Dialect(delimiter, encoding, quoting, len(header), trailing, line_ending)
+
+
+def check_frame(df: pd.DataFrame, dialect: Dialect, path: Path) -> pd.DataFrame:
+    """df without the dialect's trailing empty columns, after checking the sample held for it."""
+    keep = dialect.columns - dialect.trailing_empty
+    if df.shape[1] > keep:
+        trailing = df.iloc[:, keep:]
+        filled = trailing.notna().any()
+        if filled.any():
+            column = filled.idxmax()
+            value = trailing[column].dropna().iloc[0]
+            raise RuntimeError(
+                f"{path}: column {df.columns.get_loc(column) + 1} is empty in the first {SNIFF_BYTES} bytes "
+                f"but holds {value!r} further on; sniff a larger sample"
+            )
+        df = df.iloc[:, :keep]
+    if dialect.quoting == csv.QUOTE_NONE:
+        for column in df.columns[df.dtypes == object]:
+            text = df[column].dropna().astype(str)
+            quoted = text[(text.str.len() > 1) & text.str.startswith('"') & text.str.endswith('"')]
+            if not quoted.empty:
+                raise RuntimeError(
+                    f"{path}: field {quoted.iloc[0]!r} is quoted, but the first {SNIFF_BYTES} bytes "
+                    f"have a stray quote, so quoting is off; fix the stray quote"
+                )
+    return df
+
+
+def read_raw(path: Path, dialect: Optional[Dialect] = None, **read_csv_kwargs):
+    """Parse a raw file once with its sniffed dialect.
+
+    Extra keyword arguments go to pd.read_csv and override the dialect's
+    (e.g. usecols= by name, dtype=, chunksize=, which returns an iterator of
+    checked chunks). Frames read with usecols= are returned unchecked, as
+    the caller chose the columns.
+    """
+    dialect = dialect or sniff(path)
+    parsed = pd.read_csv(path, **{**dialect.read_csv_options(), **read_csv_kwargs})
+    if "usecols" in read_csv_kwargs:
+        return parsed
+    if read_csv_kwargs.get("chunksize"):
+        return (check_frame(chunk, dialect, path) for chunk in parsed)
+    return check_frame(parsed, dialect, path)
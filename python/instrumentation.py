@@ -0,0 +1,251 @@
+"""instrumentation.py
+
+Wall time, CPU time, peak RSS and row counts of pipeline stages and the steps
+inside them.
+
+A stage script decorates its main() with @stage_main and wraps its main steps
+in step(), which nest:
+
+    @stage_main
+    def main() -> None:
+        with step("read") as s:
+            df = read_table(...)
+            s.rows_out = len(df)
+        with step("upsert_facts", rows_in=len(df)):
+            ...
+
+Every step records wall and CPU seconds (CPU of all the process's threads),
+the process's peak RSS when the step ended and how much the step raised it,
+rows in/out and rows per second (rows_out, else rows_in, per wall second).
+Outside a @stage_main run, steps are measured and then dropped, so library
+code can use them unconditionally.
+
+Nothing is printed. Two environment variables switch on the outputs:
+- STAGE_REPORT=path: when main() returns or raises, the stage's record
+  (steps included) is written there as JSON. pipeline.py sets it for every
+  stage it runs and collects the records into reports/run_report.json.
+- STAGE_PROFILE=path: main() runs under cProfile. The stats are dumped to
+  path (python -m pstats path, or snakeviz) and folded stacks to
+  path.folded, for flamegraph.pl or speedscope.
+
+The C++ engine prints a "METRICS {...}" JSON line at the end of each phase;
+engine_steps() adds those phases as steps of the calling stage, since a
+subprocess's CPU time and memory are not the caller's.
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGE_REPORT_ENV = "STAGE_REPORT"
+STAGE_PROFILE_ENV = "STAGE_PROFILE"
+ENGINE_METRICS_PREFIX = "METRICS "
+
+# Call paths worth less than this many seconds are left out of the folded
+# stacks, which bounds their size for large call graphs.
+FOLDED_MIN_SECONDS = 1e-4
+
+
+def peak_rss_mib() -> Optional[float]:
+    """Peak resident set size of this process so far in MiB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KiB elsewhere.
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+@dataclass
+class Step:
+    name: str
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_mib: Optional[float] = None
+    rss_growth_mib: Optional[float] = None
+    status: str = "ok"
+    steps: list = field(default_factory=list)
+
+    @property
+    def rows_per_sec(self) -> Optional[float]:
+        rows = self.rows_out if self.rows_out is not None else self.rows_in
+        if rows is None or self.wall_seconds <= 0:
+            return None
+        return rows / self.wall_seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "status": self.status,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "peak_rss_mib": self.peak_rss_mib,
+            "rss_growth_mib": self.rss_growth_mib,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_per_sec": self.rows_per_sec,
+            "steps": [s.to_dict() for s in self.steps],
+        }
+
+
+# Open steps, outermost first.
+_active: list = []
+
+
+def _failed(exc: BaseException) -> bool:
+    return not (isinstance(exc, SystemExit) and not exc.code)
+
+
+@contextlib.contextmanager
+def step(name: str, rows_in: Optional[int] = None) -> Iterator[Step]:
+    """Measure the enclosed block as a step of the innermost open step."""
+    record = Step(name, rows_in=rows_in)
+    if _active:
+        _active[-1].steps.append(record)
+    _active.append(record)
+    rss_before = peak_rss_mib()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield record
+    except BaseException as exc:
+        if _failed(exc):
+            record.status = "failed"
+        raise
+    finally:
+        record.wall_seconds = time.perf_counter() - wall
+        record.cpu_seconds = time.process_time() - cpu
+        record.peak_rss_mib = peak_rss_mib()
+        if rss_before is not None:
+            record.rss_growth_mib = record.peak_rss_mib - rss_before
+        _active.pop()
+
+
+def record_rows(rows_in: Optional[int] = None, rows_out: Optional[int] = None) -> None:
+    """Set the row counts of the innermost open step (the stage itself at top level)."""
+    if not _active:
+        return
+    if rows_in is not None:
+        _active[-1].rows_in = rows_in
+    if rows_out is not None:
+        _active[-1].rows_out = rows_out
+
+
+def engine_steps(stdout: str) -> str:
+    """Record the engine's METRICS lines as steps; returns stdout without them."""
+    kept = []
+    for line in stdout.splitlines():
+        if not line.startswith(ENGINE_METRICS_PREFIX):
+            kept.append(line)
+            continue
+        metrics = json.loads(line[len(ENGINE_METRICS_PREFIX) :])
+        if _active:
+            _active[-1].steps.append(
+                Step(
+                    f"engine.{metrics['phase']}",
+                    rows_in=metrics.get("rows"),
+                    wall_seconds=metrics["wall_seconds"],
+                    cpu_seconds=metrics["cpu_seconds"],
+                    peak_rss_mib=metrics.get("peak_rss_mib"),
+                )
+            )
+    return "\n".join(kept)
+
+
+def _label(func: tuple) -> str:
+    filename, line, name = func
+    if filename == "~":  # built-in
+        return name
+    return f"{Path(filename).name}:{line}:{name}"
+
+
+def folded_stacks(stats: pstats.Stats) -> dict:
+    """Seconds of self time per call path ("a;b;c"), estimated from cProfile's call graph.
+
+    cProfile keeps caller -> callee edges rather than whole stacks, so a
+    function's time is split between the paths that reach it in proportion
+    to each incoming edge's cumulative time, as flameprof and gprof2dot do.
+    """
+    entries = stats.stats
+    callees: dict = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, {})[func] = edge[3]
+    folded: dict = {}
+
+    def walk(func: tuple, path: tuple, on_path: frozenset, seconds: float) -> None:
+        total = entries[func][3]
+        if total <= 0 or seconds < FOLDED_MIN_SECONDS:
+            return
+        share = min(seconds / total, 1.0)
+        path = path + (_label(func),)
+        key = ";".join(path)
+        folded[key] = folded.get(key, 0.0) + entries[func][2] * share
+        for callee, edge_seconds in callees.get(func, {}).items():
+            if callee not in on_path and callee in entries:
+                walk(callee, path, on_path | {callee}, edge_seconds * share)
+
+    roots = [f for f, entry in entries.items() if not any(c in entries for c in entry[4])]
+    for root in roots:
+        walk(root, (), frozenset({root}), entries[root][3])
+    return folded
+
+
+def write_profile(profiler: cProfile.Profile, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(str(path))
+    with open(path.with_name(path.name + ".folded"), "w") as f:
+        for stack, seconds in sorted(folded_stacks(stats).items()):
+            micros = round(seconds * 1e6)
+            if micros > 0:
+                f.write(f"{stack} {micros}\n")
+
+
+def write_report(record: Step, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(record.to_dict(), indent=2))
+    tmp.replace(path)
+
+
+def stage_main(main: Callable) -> Callable:
+    """Run main() as the root step of a stage named after its script."""
+    name = Path(main.__code__.co_filename).stem
+
+    @functools.wraps(main)
+    def wrapper(*args, **kwargs):
+        report_path = os.environ.get(STAGE_REPORT_ENV)
+        profile_path = os.environ.get(STAGE_PROFILE_ENV)
+        profiler = cProfile.Profile() if profile_path else None
+        record = None
+        try:
+            with step(name) as record:
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    return main(*args, **kwargs)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            # The root step is closed here, so its times are final.
+            if profiler is not None:
+                write_profile(profiler, Path(profile_path))
+            if report_path and record is not None:
+                write_report(record, Path(report_path))
+
+    return wrapper
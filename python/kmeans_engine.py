@@ -0,0 +1,446 @@
+"""kmeans_engine.py
+
+In-process binding to the C++ k-means engine (cpp/libkmeans.so, built with
+`make -C cpp`).
+
+fit() passes a float64 NumPy array to kmeans_fit() without copying it (a
+C-contiguous float64 array is used as-is). Labels, centroids and inertia come
+back as arrays. ctypes releases the GIL for the duration of the call, so other
+Python threads keep running while the engine works.
+
+sweep() fits a range of k in one call (in parallel across k) and scores each
+with the silhouette (on a seeded row sample) and the Davies-Bouldin index.
+
+warm_start() continues from a previous model's centroids and labels,
+assigning only unlabelled rows unless the centroids drift too far.
+
+NeighborIndex is the engine's KD-tree over the rows of a matrix, for exact
+k-nearest-neighbour queries (see similar_games.py).
+
+Usage:
+    from kmeans_engine import fit, sweep
+    result = fit(features, k=5, seed=42)
+    result.labels, result.centroids, result.inertia
+    results = sweep(features, 2, 10)
+    best = best_by_silhouette(results)
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+import ctypes
+import os
+import sys
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if os.name == "nt":
+    LIBRARY_PATH = REPO_ROOT / "cpp" / "kmeans.dll"
+elif sys.platform == "darwin":
+    LIBRARY_PATH = REPO_ROOT / "cpp" / "libkmeans.dylib"
+else:
+    LIBRARY_PATH = REPO_ROOT / "cpp" / "libkmeans.so"
+
+
+class _FitInfo(ctypes.Structure):
+    _fields_ = [
+        ("iterations", ctypes.c_int32),
+        ("converged", ctypes.c_int32),
+        ("distance_evals", ctypes.c_uint64),
+        ("lloyd_evals", ctypes.c_uint64),
+        ("inertia", ctypes.c_double),
+    ]
+
+
+class _SweepInfo(ctypes.Structure):
+    _fields_ = [
+        ("k", ctypes.c_int32),
+        ("iterations", ctypes.c_int32),
+        ("converged", ctypes.c_int32),
+        ("reserved", ctypes.c_int32),
+        ("distance_evals", ctypes.c_uint64),
+        ("lloyd_evals", ctypes.c_uint64),
+        ("inertia", ctypes.c_double),
+        ("silhouette", ctypes.c_double),
+        ("davies_bouldin", ctypes.c_double),
+    ]
+
+
+class _WarmInfo(ctypes.Structure):
+    _fields_ = [
+        ("iterations", ctypes.c_int32),
+        ("converged", ctypes.c_int32),
+        ("full_run", ctypes.c_int32),
+        ("reserved", ctypes.c_int32),
+        ("reassigned", ctypes.c_uint64),
+        ("distance_evals", ctypes.c_uint64),
+        ("lloyd_evals", ctypes.c_uint64),
+        ("inertia", ctypes.c_double),
+        ("drift", ctypes.c_double),
+        ("silhouette", ctypes.c_double),
+        ("davies_bouldin", ctypes.c_double),
+    ]
+
+
+# Rows the silhouette is computed on by default (its cost is quadratic).
+SILHOUETTE_SAMPLE = 2000
+
+
+@dataclass
+class KMeansResult:
+    labels: np.ndarray  # int32, one per row
+    centroids: np.ndarray  # float64, k x dim
+    inertia: float
+    iterations: int
+    converged: bool
+    distance_evals: int
+    lloyd_evals: int
+
+
+@dataclass
+class SweepResult(KMeansResult):
+    k: int
+    silhouette: float  # higher is better, on a row sample
+    davies_bouldin: float  # lower is better
+    sizes: np.ndarray  # int64, rows per cluster
+
+
+@dataclass
+class WarmStartResult(SweepResult):
+    reassigned: int  # rows that had no previous label
+    drift: float  # largest centroid move before any full run, scaled units
+    full_run: bool  # drift exceeded the threshold, all rows were iterated
+
+
+_library: Optional[ctypes.CDLL] = None
+
+
+def load_library(path: Path = LIBRARY_PATH) -> ctypes.CDLL:
+    global _library
+    if _library is not None:
+        return _library
+    if not path.exists():
+        raise FileNotFoundError(f"k-means library not found at {path}. Build it with: make -C cpp")
+    lib = ctypes.CDLL(str(path))
+    double_p = ctypes.POINTER(ctypes.c_double)
+    lib.kmeans_fit.argtypes = [
+        double_p,  # features
+        ctypes.c_int64,  # rows
+        ctypes.c_int64,  # dim
+        ctypes.c_int32,  # k
+        ctypes.c_uint64,  # seed
+        ctypes.c_int32,  # max_iter
+        ctypes.c_double,  # tol
+        ctypes.c_int32,  # threads
+        ctypes.POINTER(ctypes.c_int32),  # labels_out
+        double_p,  # centroids_out
+        ctypes.POINTER(_FitInfo),
+    ]
+    lib.kmeans_fit.restype = ctypes.c_int
+    lib.kmeans_sweep.argtypes = [
+        double_p,  # features
+        ctypes.c_int64,  # rows
+        ctypes.c_int64,  # dim
+        ctypes.c_int32,  # k_min
+        ctypes.c_int32,  # k_max
+        ctypes.c_uint64,  # seed
+        ctypes.c_int32,  # max_iter
+        ctypes.c_double,  # tol
+        ctypes.c_int32,  # threads
+        ctypes.c_int64,  # silhouette_sample
+        ctypes.POINTER(ctypes.c_int32),  # labels_out
+        double_p,  # centroids_out
+        ctypes.POINTER(_SweepInfo),
+    ]
+    lib.kmeans_sweep.restype = ctypes.c_int
+    lib.kmeans_warm_start.argtypes = [
+        double_p,  # features
+        ctypes.c_int64,  # rows
+        ctypes.c_int64,  # dim
+        ctypes.c_int32,  # k
+        double_p,  # centroids_in
+        ctypes.POINTER(ctypes.c_int32),  # labels_in
+        ctypes.c_int32,  # max_iter
+        ctypes.c_double,  # tol
+        ctypes.c_double,  # drift_threshold
+        ctypes.c_int32,  # threads
+        ctypes.c_int64,  # silhouette_sample
+        ctypes.c_uint64,  # seed
+        ctypes.POINTER(ctypes.c_int32),  # labels_out
+        double_p,  # centroids_out
+        ctypes.POINTER(_WarmInfo),
+    ]
+    lib.kmeans_warm_start.restype = ctypes.c_int
+    lib.knn_index_build.argtypes = [double_p, ctypes.c_int64, ctypes.c_int64]
+    lib.knn_index_build.restype = ctypes.c_void_p
+    lib.knn_index_query.argtypes = [
+        ctypes.c_void_p,  # index
+        double_p,  # points
+        ctypes.c_int64,  # n
+        ctypes.POINTER(ctypes.c_int64),  # exclude (nullable)
+        ctypes.c_int32,  # k
+        ctypes.c_int32,  # threads
+        ctypes.POINTER(ctypes.c_int64),  # neighbors_out
+        double_p,  # distances_out
+    ]
+    lib.knn_index_query.restype = ctypes.c_int
+    lib.knn_index_free.argtypes = [ctypes.c_void_p]
+    lib.knn_index_free.restype = None
+    lib.kmeans_last_error.argtypes = []
+    lib.kmeans_last_error.restype = ctypes.c_char_p
+    _library = lib
+    return lib
+
+
+def _as_matrix(features: np.ndarray) -> np.ndarray:
+    X = np.ascontiguousarray(features, dtype=np.float64)
+    if X.ndim != 2 or X.shape[0] == 0:
+        raise ValueError(f"Expected a non-empty 2-D feature matrix, got shape {X.shape}")
+    return X
+
+
+def fit(
+    features: np.ndarray,
+    k: int,
+    seed: int = 42,
+    max_iter: int = 300,
+    tol: float = 1e-6,
+    threads: Optional[int] = None,
+) -> KMeansResult:
+    """k-means++ seeded, Hamerly-accelerated k-means on a rows x dim matrix."""
+    lib = load_library()
+    X = _as_matrix(features)
+    rows, dim = X.shape
+    labels = np.empty(rows, dtype=np.int32)
+    centroids = np.empty((k, dim), dtype=np.float64)
+    info = _FitInfo()
+
+    status = lib.kmeans_fit(
+        X.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+        rows,
+        dim,
+        k,
+        seed,
+        max_iter,
+        tol,
+        threads or os.cpu_count() or 1,
+        labels.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),
+        centroids.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+        ctypes.byref(info),
+    )
+    if status != 0:
+        raise RuntimeError(f"k-means engine failed: {lib.kmeans_last_error().decode()}")
+    return KMeansResult(
+        labels=labels,
+        centroids=centroids,
+        inertia=info.inertia,
+        iterations=info.iterations,
+        converged=bool(info.converged),
+        distance_evals=info.distance_evals,
+        lloyd_evals=info.lloyd_evals,
+    )
+
+
+def sweep(
+    features: np.ndarray,
+    k_min: int,
+    k_max: int,
+    seed: int = 42,
+    max_iter: int = 300,
+    tol: float = 1e-6,
+    threads: Optional[int] = None,
+    silhouette_sample: int = SILHOUETTE_SAMPLE,
+) -> List[SweepResult]:
+    """fit() for every k in [k_min, k_max] with the same seed, scored; in k order."""
+    if k_min < 2 or k_max < k_min:
+        raise ValueError(f"k sweep needs 2 <= k_min <= k_max, got {k_min}..{k_max}")
+    lib = load_library()
+    X = _as_matrix(features)
+    rows, dim = X.shape
+    ks = range(k_min, k_max + 1)
+    labels = np.empty((len(ks), rows), dtype=np.int32)
+    centroids = np.empty(sum(ks) * dim, dtype=np.float64)
+    infos = (_SweepInfo * len(ks))()
+
+    status = lib.kmeans_sweep(
+        X.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+        rows,
+        dim,
+        k_min,
+        k_max,
+        seed,
+        max_iter,
+        tol,
+        threads or os.cpu_count() or 1,
+        silhouette_sample,
+        labels.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),
+        centroids.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+        infos,
+    )
+    if status != 0:
+        raise RuntimeError(f"k-means engine failed: {lib.kmeans_last_error().decode()}")
+
+    results = []
+    offset = 0
+    for i, info in enumerate(infos):
+        k = info.k
+        results.append(
+            SweepResult(
+                labels=labels[i],
+                centroids=centroids[offset : offset + k * dim].reshape(k, dim),
+                inertia=info.inertia,
+                iterations=info.iterations,
+                converged=bool(info.converged),
+                distance_evals=info.distance_evals,
+                lloyd_evals=info.lloyd_evals,
+                k=k,
+                silhouette=info.silhouette,
+                davies_bouldin=info.davies_bouldin,
+                sizes=np.bincount(labels[i], minlength=k),
+            )
+        )
+        offset += k * dim
+    return results
+
+
+def warm_start(
+    features: np.ndarray,
+    centroids: np.ndarray,
+    labels: np.ndarray,
+    max_iter: int = 300,
+    tol: float = 1e-6,
+    drift_threshold: float = 0.05,
+    threads: Optional[int] = None,
+    silhouette_sample: int = SILHOUETTE_SAMPLE,
+    seed: int = 42,
+) -> WarmStartResult:
+    """Continue from previous centroids (k x dim) and labels (-1 for new or changed rows).
+
+    Unlabelled rows go to the nearest previous centroid and centroids are
+    recomputed. If none moves more than drift_threshold that is the result;
+    otherwise full iterations run on every row.
+    """
+    lib = load_library()
+    X = _as_matrix(features)
+    rows, dim = X.shape
+    C = np.ascontiguousarray(centroids, dtype=np.float64)
+    if C.ndim != 2 or C.shape[1] != dim:
+        raise ValueError(f"Expected k x {dim} centroids, got shape {C.shape}")
+    k = C.shape[0]
+    labels_in = np.ascontiguousarray(labels, dtype=np.int32)
+    if labels_in.shape != (rows,):
+        raise ValueError(f"Expected {rows} labels, got shape {labels_in.shape}")
+    labels_out = np.empty(rows, dtype=np.int32)
+    centroids_out = np.empty((k, dim), dtype=np.float64)
+    info = _WarmInfo()
+
+    status = lib.kmeans_warm_start(
+        X.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+        rows,
+        dim,
+        k,
+        C.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+        labels_in.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),
+        max_iter,
+        tol,
+        drift_threshold,
+        threads or os.cpu_count() or 1,
+        silhouette_sample,
+        seed,
+        labels_out.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),
+        centroids_out.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+        ctypes.byref(info),
+    )
+    if status != 0:
+        raise RuntimeError(f"k-means engine failed: {lib.kmeans_last_error().decode()}")
+    return WarmStartResult(
+        labels=labels_out,
+        centroids=centroids_out,
+        inertia=info.inertia,
+        iterations=info.iterations,
+        converged=bool(info.converged),
+        distance_evals=info.distance_evals,
+        lloyd_evals=info.lloyd_evals,
+        k=k,
+        silhouette=info.silhouette,
+        davies_bouldin=info.davies_bouldin,
+        sizes=np.bincount(labels_out, minlength=k),
+        reassigned=info.reassigned,
+        drift=info.drift,
+        full_run=bool(info.full_run),
+    )
+
+
+def best_by_silhouette(results: List[SweepResult]) -> SweepResult:
+    """Highest silhouette, ties broken by the lower Davies-Bouldin index."""
+    return max(results, key=lambda r: (r.silhouette, -r.davies_bouldin))
+
+
+class NeighborIndex:
+    """KD-tree over the rows of a feature matrix, built once and queried many times.
+
+    The matrix is referenced, not copied, so the index keeps it alive.
+    """
+
+    def __init__(self, features: np.ndarray) -> None:
+        self._lib = load_library()
+        self._X = _as_matrix(features)
+        self._handle = self._lib.knn_index_build(
+            self._X.ctypes.data_as(ctypes.POINTER(ctypes.c_double)), *self._X.shape
+        )
+        if not self._handle:
+            raise RuntimeError(f"k-means engine failed: {self._lib.kmeans_last_error().decode()}")
+
+    @property
+    def rows(self) -> int:
+        return self._X.shape[0]
+
+    def query(
+        self,
+        points: np.ndarray,
+        k: int,
+        exclude: Optional[np.ndarray] = None,
+        threads: Optional[int] = None,
+    ) -> tuple:
+        """(row indices, distances), each len(points) x k, nearest first.
+
+        exclude holds one row per point to leave out (-1 for none). Slots
+        beyond the available rows are -1 with distance NaN.
+        """
+        P = _as_matrix(points)
+        if P.shape[1] != self._X.shape[1]:
+            raise ValueError(f"Expected points with {self._X.shape[1]} features, got {P.shape[1]}")
+        n = P.shape[0]
+        neighbors = np.empty((n, k), dtype=np.int64)
+        distances = np.empty((n, k), dtype=np.float64)
+        exclude_ptr = None
+        if exclude is not None:
+            exclude = np.ascontiguousarray(exclude, dtype=np.int64)
+            if exclude.shape != (n,):
+                raise ValueError(f"Expected {n} exclude entries, got shape {exclude.shape}")
+            exclude_ptr = exclude.ctypes.data_as(ctypes.POINTER(ctypes.c_int64))
+        status = self._lib.knn_index_query(
+            self._handle,
+            P.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+            n,
+            exclude_ptr,
+            k,
+            threads or os.cpu_count() or 1,
+            neighbors.ctypes.data_as(ctypes.POINTER(ctypes.c_int64)),
+            distances.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+        )
+        if status != 0:
+            raise RuntimeError(f"k-means engine failed: {self._lib.kmeans_last_error().decode()}")
+        return neighbors, distances
+
+    def query_rows(self, rows: np.ndarray, k: int, threads: Optional[int] = None) -> tuple:
+        """query() for indexed rows themselves, each leaving out its own row."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return self.query(self._X[rows], k, exclude=rows, threads=threads)
+
+    def close(self) -> None:
+        if self._handle:
+            self._lib.knn_index_free(self._handle)
+            self._handle = None
+
+    def __del__(self) -> None:
+        self.close()
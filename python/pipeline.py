@@ -0,0 +1,597 @@
+"""pipeline.py
+
+Incremental runner for pipeline stages 01-10 and similar_games.
+
+Each stage declares the resources it reads and writes. A resource is either a
+file path relative to the repo root (e.g. data/clean_console_data.csv) or a
+SQLite table written as <db path>::<table> (e.g. data/games.db::sales), so the
+stages that share games.db can be tracked independently.
+
+Before running a stage, the runner fingerprints its code (the script plus any
+local modules it imports) and its inputs with SHA-256. A stage is skipped when
+that fingerprint matches the one recorded at its last successful run and its
+outputs still hash to what it produced back then. Because fingerprints are
+content-based, an upstream stage that reruns but produces identical output does
+not invalidate anything downstream.
+
+Stages run as a dependency graph, not in a fixed order. A stage waits for
+every earlier stage whose outputs it reads (or whose inputs or outputs it
+overwrites), and up to --jobs stages run at once. 01 thus runs alongside
+02 -> 03, and 06, 07 and 08 run alongside each other. A stage writing tables
+of a SQLite database never runs while another stage reads or writes that
+database. Ready stages start longest remaining path first (timed from the
+last run). Each stage's output is streamed with a [stage name] prefix. When
+a stage fails, no further stages are started. Running stages are stopped,
+except those writing a database, which are left to finish. The run then
+raises.
+
+Usage (from repo root):
+    python python/pipeline.py              # run stale stages only
+    python python/pipeline.py --dry-run    # show what would run
+    python python/pipeline.py --force      # rerun everything
+    python python/pipeline.py 05 06        # consider only stages 05 and 06
+    python python/pipeline.py --jobs 1     # one stage at a time
+    python python/pipeline.py --profile 05 # also cProfile stage 05
+
+Every run writes reports/run_report.json (or --report PATH): per stage, whether
+it ran, was skipped, failed or was cancelled and why, when it started, plus the
+wall time, CPU time, peak RSS and row counts each stage and its steps recorded
+through instrumentation.py. The top-level wall_seconds is the whole run's, and
+stage_seconds is the sum over stages.
+--profile writes reports/profiles/<stage>.prof and .prof.folded (flamegraph
+input) for the matching stages.
+
+Set INTERMEDIATE_FORMAT=parquet (or feather) to hand stages 01-05 their
+intermediates in a binary columnar format; see storage.py.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+import argparse
+import ast
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from instrumentation import STAGE_PROFILE_ENV, STAGE_REPORT_ENV
+from storage import FORMATS, intermediate_format
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+PYTHON_DIR = REPO_ROOT / "python"
+STATE_PATH = REPO_ROOT / "data" / ".pipeline_state.json"
+REPORT_PATH = REPO_ROOT / "reports" / "run_report.json"
+PROFILE_DIR = REPO_ROOT / "reports" / "profiles"
+
+GAMES_DB = "data/games.db"
+if os.name == "nt":
+    ENGINE_LIBRARY = "cpp/kmeans.dll"
+elif sys.platform == "darwin":
+    ENGINE_LIBRARY = "cpp/libkmeans.dylib"
+else:
+    ENGINE_LIBRARY = "cpp/libkmeans.so"
+
+
+def intermediate(stem: str) -> str:
+    """Resource name for an intermediate table in the configured format."""
+    return f"data/{stem}{FORMATS[intermediate_format()]}"
+
+
+def query(name: str) -> str:
+    """Resource name for a shipped query in sql/queries/."""
+    return f"sql/queries/{name}.sql"
+
+
+def table(db: str, name: str) -> str:
+    """Resource name for a table inside a SQLite database."""
+    return f"{db}::{name}"
+
+
+# Views (games, sales, region_population) are not resources: stages depend on
+# the star schema tables underneath them.
+DIMENSION_TABLES = tuple(table(GAMES_DB, f"dim_{name}") for name in ("platform", "genre", "publisher", "rating"))
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    inputs: tuple
+    outputs: tuple
+
+    @property
+    def script(self) -> Path:
+        return PYTHON_DIR / f"{self.name}.py"
+
+
+STAGES = [
+    Stage(
+        "01_clean_console_data",
+        inputs=("data/Console_Data.csv",),
+        outputs=(intermediate("clean_console_data"),),
+    ),
+    Stage(
+        "02_clean_population_data",
+        inputs=("data/Population.csv",),
+        outputs=(intermediate("clean_population_data"),),
+    ),
+    Stage(
+        "03_build_region_population",
+        inputs=(intermediate("clean_population_data"), "data/region_schemes.csv"),
+        outputs=(
+            intermediate("region_population_by_year"),
+            intermediate("region_population_un_m49"),
+            intermediate("region_population_sales_territories"),
+        ),
+    ),
+    Stage(
+        "04_merge_games_with_population",
+        inputs=(intermediate("clean_console_data"), intermediate("region_population_by_year")),
+        outputs=(intermediate("merged_games_population"),),
+    ),
+    Stage(
+        "05_load_to_sql",
+        inputs=(
+            "sql/schema.sql",
+            intermediate("merged_games_population"),
+            intermediate("region_population_by_year"),
+            query("sales_cube_source"),
+        ),
+        outputs=(
+            table(GAMES_DB, "fact_sales"),
+            *DIMENSION_TABLES,
+            table(GAMES_DB, "dim_year"),
+            table(GAMES_DB, "sales_cube"),
+        ),
+    ),
+    Stage(
+        "06_eda_and_kpis",
+        inputs=(table(GAMES_DB, "sales_cube"),),
+        outputs=(
+            "reports/sales_by_region_over_time.png",
+            "reports/genre_sales_by_region.png",
+        ),
+    ),
+    Stage(
+        "07_ab_tests",
+        inputs=(table(GAMES_DB, "sales_cube"),),
+        outputs=("reports/ab_test_summary.txt",),
+    ),
+    Stage(
+        "08_prepare_features_for_clustering",
+        inputs=(table(GAMES_DB, "fact_sales"), query("clustering_features")),
+        outputs=("data/features_for_clustering.bin",),
+    ),
+    Stage(
+        "similar_games",
+        # Built from stage 08's file with the engine's KD-tree.
+        inputs=(ENGINE_LIBRARY, "data/features_for_clustering.bin"),
+        outputs=(table(GAMES_DB, "similar_games"),),
+    ),
+    Stage(
+        "09_integrate_cpp_clusters",
+        # Clusters in-process from the warehouse with stage 08's functions.
+        inputs=(
+            ENGINE_LIBRARY,
+            "python/08_prepare_features_for_clustering.py",
+            table(GAMES_DB, "fact_sales"),
+            query("clustering_features"),
+        ),
+        outputs=(
+            table(GAMES_DB, "clusters"),
+            table(GAMES_DB, "cluster_metrics"),
+            table(GAMES_DB, "cluster_centroids"),
+            table(GAMES_DB, "cluster_inputs"),
+        ),
+    ),
+    Stage(
+        "10_export_for_tableau",
+        inputs=(
+            table(GAMES_DB, "fact_sales"),
+            *DIMENSION_TABLES,
+            table(GAMES_DB, "dim_year"),
+            table(GAMES_DB, "clusters"),
+            query("tableau_export"),
+        ),
+        outputs=("tableau/games_for_tableau.csv",),
+    ),
+]
+
+
+class Fingerprinter:
+    """SHA-256 fingerprints of files and SQLite tables.
+
+    Digests are cached against the file's (size, mtime_ns) so unchanged files
+    are not re-read on every run; the cache is persisted with the runner state.
+    """
+
+    def __init__(self, repo_root: Path, cache: Optional[dict] = None) -> None:
+        self.repo_root = repo_root
+        self.cache = cache if cache is not None else {}
+
+    def _stat_key(self, path: Path) -> Optional[list]:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+
+    def file_digest(self, rel_path: str) -> Optional[str]:
+        path = self.repo_root / rel_path
+        stat_key = self._stat_key(path)
+        if stat_key is None:
+            return None
+        cached = self.cache.get(rel_path)
+        if cached and cached.get("stat") == stat_key and "sha256" in cached:
+            return cached["sha256"]
+
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        self.cache[rel_path] = {"stat": stat_key, "sha256": digest}
+        return digest
+
+    def table_digest(self, db_rel_path: str, table_name: str) -> Optional[str]:
+        db_path = self.repo_root / db_rel_path
+        stat_key = self._stat_key(db_path)
+        if stat_key is None:
+            return None
+        cached = self.cache.get(db_rel_path)
+        if not cached or cached.get("stat") != stat_key:
+            cached = {"stat": stat_key, "tables": {}}
+            self.cache[db_rel_path] = cached
+        tables = cached.setdefault("tables", {})
+        if table_name in tables:
+            return tables[table_name]
+
+        # Open read-only so fingerprinting never creates or locks a database.
+        with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+            row = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (table_name,),
+            ).fetchone()
+            if row is None:
+                digest = None
+            else:
+                h = hashlib.sha256(row[0].encode())
+                cursor = conn.execute(f'SELECT * FROM "{table_name}" ORDER BY rowid')
+                while True:
+                    batch = cursor.fetchmany(10_000)
+                    if not batch:
+                        break
+                    h.update(repr(batch).encode())
+                digest = h.hexdigest()
+        tables[table_name] = digest
+        return digest
+
+    def resource_digest(self, resource: str) -> Optional[str]:
+        if "::" in resource:
+            db_rel_path, table_name = resource.split("::", 1)
+            return self.table_digest(db_rel_path, table_name)
+        return self.file_digest(resource)
+
+
+def local_imports(script: Path) -> list:
+    """Local python/ modules imported (directly or transitively) by a script."""
+    seen = []
+    pending = [script]
+    while pending:
+        tree = ast.parse(pending.pop().read_text())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module_path = PYTHON_DIR / f"{name.split('.')[0]}.py"
+                if module_path.exists() and module_path not in seen and module_path != script:
+                    seen.append(module_path)
+                    pending.append(module_path)
+    return sorted(seen)
+
+
+def input_fingerprint(stage: Stage, fp: Fingerprinter) -> str:
+    """Combined digest of a stage's code and inputs."""
+    parts = {}
+    for code_path in [stage.script] + local_imports(stage.script):
+        rel = code_path.relative_to(fp.repo_root).as_posix()
+        parts[f"code:{rel}"] = fp.file_digest(rel)
+    for resource in stage.inputs:
+        parts[resource] = fp.resource_digest(resource)
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def output_digests(stage: Stage, fp: Fingerprinter) -> dict:
+    return {resource: fp.resource_digest(resource) for resource in stage.outputs}
+
+
+def load_state(path: Path) -> dict:
+    if not path.exists():
+        return {"stages": {}, "fingerprints": {}}
+    return json.loads(path.read_text())
+
+
+def save_state(path: Path, state: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2, sort_keys=True))
+    tmp.replace(path)
+
+
+def stale_reason(stage: Stage, record: Optional[dict], fp: Fingerprinter) -> Optional[str]:
+    """Why a stage must run, or None if it is up to date."""
+    if record is None:
+        return "never run"
+    if record.get("inputs") != input_fingerprint(stage, fp):
+        return "inputs or code changed"
+    current = output_digests(stage, fp)
+    missing = [r for r, d in current.items() if d is None]
+    if missing:
+        return f"missing output {missing[0]}"
+    if record.get("outputs") != current:
+        return "outputs modified since last run"
+    return None
+
+
+class StageFailed(RuntimeError):
+    def __init__(self, stage: Stage, code: int, metrics: dict) -> None:
+        super().__init__(f"Stage {stage.name} failed (code {code})")
+        self.metrics = metrics
+
+
+def dependencies(stages: list) -> dict:
+    """{stage name: names of the earlier stages it must wait for}.
+
+    A stage waits for an earlier one when it reads what that one writes, or
+    writes what that one reads or writes, so a parallel run produces what the
+    serial run in declaration order would.
+    """
+    deps = {}
+    for i, stage in enumerate(stages):
+        deps[stage.name] = {
+            earlier.name
+            for earlier in stages[:i]
+            if set(stage.inputs) & set(earlier.outputs)
+            or set(stage.outputs) & (set(earlier.inputs) | set(earlier.outputs))
+        }
+    return deps
+
+
+def databases(resources: tuple) -> set:
+    return {resource.split("::", 1)[0] for resource in resources if "::" in resource}
+
+
+def conflicts(stage: Stage, running: list) -> bool:
+    """Whether stage would share a SQLite database with a running stage while either writes it.
+
+    SQLite allows one writer per database, and a long write transaction would
+    make readers time out, so a stage writing tables of a database runs only
+    while no other stage uses that database; readers may overlap each other.
+    """
+    writes = databases(stage.outputs)
+    uses = databases(stage.inputs) | writes
+    for other in running:
+        other_writes = databases(other.outputs)
+        if uses & other_writes or writes & (databases(other.inputs) | other_writes):
+            return True
+    return False
+
+
+def critical_paths(stages: list, deps: dict, records: dict) -> dict:
+    """{stage name: seconds from its start to the end of the longest chain of stages after it}.
+
+    Durations are the stages' last recorded wall times (1 s if never run).
+    Ready stages are started longest path first.
+    """
+    paths = {}
+    for stage in reversed(stages):
+        after = [paths[s.name] for s in stages if stage.name in deps[s.name]]
+        seconds = records.get(stage.name, {}).get("wall_seconds", 1.0)
+        paths[stage.name] = seconds + max(after, default=0.0)
+    return paths
+
+
+class StageRun:
+    """A stage script running in a subprocess.
+
+    Its stdout and stderr are streamed line by line with a [stage name] prefix
+    from a reader thread, which puts the run on the finished queue when the
+    process exits.
+    """
+
+    output_lock = threading.Lock()
+
+    def __init__(
+        self, stage: Stage, entry: dict, fingerprint: str, report_dir: Path, profile: bool, finished: queue.Queue
+    ) -> None:
+        self.stage = stage
+        self.entry = entry
+        self.fingerprint = fingerprint
+        self.report_path = report_dir / f"{stage.name}.json"
+        self.begin = time.perf_counter()
+        self.cancelled = False
+        env = dict(os.environ, PYTHONUNBUFFERED="1", PYTHONIOENCODING="utf-8", **{STAGE_REPORT_ENV: str(self.report_path)})
+        if profile:
+            env[STAGE_PROFILE_ENV] = str(PROFILE_DIR / f"{stage.name}.prof")
+        self.process = subprocess.Popen(
+            [sys.executable, str(stage.script)],
+            cwd=REPO_ROOT,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            encoding="utf-8",
+            errors="replace",
+        )
+        self.thread = threading.Thread(target=self._stream, args=(finished,), daemon=True)
+        self.thread.start()
+
+    def _stream(self, finished: queue.Queue) -> None:
+        for line in self.process.stdout:
+            with self.output_lock:
+                print(f"[{self.stage.name}] {line}", end="", flush=True)
+        self.process.wait()
+        finished.put(self)
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        self.process.terminate()
+
+    def metrics(self) -> dict:
+        """The stage's instrumentation record (empty if it wrote none)."""
+        return json.loads(self.report_path.read_text()) if self.report_path.exists() else {}
+
+
+def log(message: str) -> None:
+    with StageRun.output_lock:
+        print(message, flush=True)
+
+
+def write_report(path: Path, started: str, wall_seconds: float, entries: list) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "started_at": started,
+        "wall_seconds": wall_seconds,
+        "stage_seconds": sum(e.get("wall_seconds", 0.0) for e in entries),
+        "stages": entries,
+    }
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(report, indent=2))
+    tmp.replace(path)
+
+
+def select_stages(prefixes: list) -> list:
+    if not prefixes:
+        return list(STAGES)
+    selected = [s for s in STAGES if any(s.name.startswith(p) for p in prefixes)]
+    if not selected:
+        raise ValueError(f"No stages match: {', '.join(prefixes)}")
+    return selected
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run pipeline stages, skipping up-to-date ones.")
+    parser.add_argument("stages", nargs="*", help="stage name prefixes to consider (default: all)")
+    parser.add_argument("--force", action="store_true", help="run stages even if up to date")
+    parser.add_argument("--dry-run", action="store_true", help="report what would run without running it")
+    parser.add_argument("--report", type=Path, default=REPORT_PATH, help="where to write the JSON run report")
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="how many independent stages to run at once (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="+",
+        default=[],
+        metavar="STAGE",
+        help="cProfile the stages matching these prefixes into reports/profiles/",
+    )
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    state = load_state(STATE_PATH)
+    fp = Fingerprinter(REPO_ROOT, state.setdefault("fingerprints", {}))
+    records = state.setdefault("stages", {})
+
+    stages = select_stages(args.stages)
+    deps = dependencies(stages)
+    paths = critical_paths(stages, deps, records)
+    pending = sorted(stages, key=lambda s: -paths[s.name])
+    done = set()
+    running = {}
+    finished = queue.Queue()
+    failure = None
+
+    started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    run_begin = time.perf_counter()
+    entries = []
+    ran, skipped = 0, 0
+    with tempfile.TemporaryDirectory() as report_dir:
+        while pending or running:
+            # Start every ready stage that fits; a skip can make others ready, so rescan until nothing changes.
+            progress = failure is None
+            while progress:
+                progress = False
+                for stage in pending:
+                    if len(running) >= args.jobs:
+                        break
+                    if not deps[stage.name] <= done or conflicts(stage, [r.stage for r in running.values()]):
+                        continue
+                    pending.remove(stage)
+                    progress = True
+                    reason = "forced" if args.force else stale_reason(stage, records.get(stage.name), fp)
+                    if reason is None:
+                        log(f"skip {stage.name} (up to date)")
+                        entries.append({"name": stage.name, "status": "skipped", "reason": "up to date"})
+                        skipped += 1
+                        done.add(stage.name)
+                        break
+                    log(f"run  {stage.name} ({reason})")
+                    if args.dry_run:
+                        done.add(stage.name)
+                        break
+                    profile = any(stage.name.startswith(p) for p in args.profile)
+                    entry = {
+                        "name": stage.name,
+                        "status": "ran",
+                        "reason": reason,
+                        "start_seconds": time.perf_counter() - run_begin,
+                    }
+                    entries.append(entry)
+                    fingerprint = input_fingerprint(stage, fp)
+                    running[stage.name] = StageRun(stage, entry, fingerprint, Path(report_dir), profile, finished)
+                    break
+            if not running:
+                break
+
+            run = finished.get()
+            run.thread.join()
+            del running[run.stage.name]
+            entry = run.entry
+            entry.update(wall_seconds=time.perf_counter() - run.begin, metrics=run.metrics())
+            if run.process.returncode != 0 and run.cancelled:
+                entry["status"] = "cancelled"
+                continue
+            if run.process.returncode != 0:
+                entry["status"] = "failed"
+                if failure is None:
+                    failure = StageFailed(run.stage, run.process.returncode, entry["metrics"])
+                    log(f"fail {run.stage.name} (code {run.process.returncode}); not starting any more stages")
+                    for other in running.values():
+                        # Killing a database writer mid-transaction could corrupt the database; let it finish.
+                        if not databases(other.stage.outputs):
+                            other.cancel()
+                continue
+            records[run.stage.name] = {
+                "inputs": run.fingerprint,
+                "outputs": output_digests(run.stage, fp),
+                "wall_seconds": entry["wall_seconds"],
+            }
+            save_state(STATE_PATH, state)
+            done.add(run.stage.name)
+            ran += 1
+
+    if not args.dry_run:
+        save_state(STATE_PATH, state)
+        write_report(args.report, started, time.perf_counter() - run_begin, entries)
+        if failure is not None:
+            raise failure
+        print(f"Ran {ran} stage(s), skipped {skipped} up-to-date stage(s).")
+        print(f"Run report: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
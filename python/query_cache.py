@@ -0,0 +1,202 @@
+"""query_cache.py
+
+On-disk cache of query results (pandas DataFrames) for the analytics scripts.
+
+Entries are keyed by the normalized SQL text, the bound parameters and the
+warehouse data version (see warehouse.data_version()). Every write to the
+warehouse by 05_load_to_sql.py or 09_integrate_cpp_clusters.py replaces that
+version, so cached results go stale automatically. Stale entries are purged
+the next time a result is stored. The cache is bounded by total payload size
+and evicts least-recently-used entries beyond it. Hit/miss/eviction counters
+are kept alongside the entries.
+
+Configuration (environment):
+- QUERY_CACHE=off disables the cache (every call runs the query).
+- QUERY_CACHE_PATH overrides the cache file (default data/query_cache.db).
+- QUERY_CACHE_MAX_MB bounds the cache size (default 256).
+
+Usage:
+    from query_cache import read_sql
+    df = read_sql(conn, load_query("sales_by_genre"))
+
+    python python/query_cache.py stats    # print counters and size
+    python python/query_cache.py clear    # drop all entries
+"""
+from pathlib import Path
+from typing import Optional, Sequence
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import re
+import sqlite3
+import time
+import pandas as pd
+
+from warehouse import REPO_ROOT, data_version
+
+DEFAULT_CACHE_PATH = REPO_ROOT / "data" / "query_cache.db"
+DEFAULT_MAX_MB = 256
+
+_LINE_COMMENT = re.compile(r"--[^\n]*")
+
+
+def normalize_sql(sql: str) -> str:
+    """Drop line comments, collapse whitespace and any trailing semicolon."""
+    return " ".join(_LINE_COMMENT.sub(" ", sql).split()).rstrip(";").strip()
+
+
+def cache_key(sql: str, params: Sequence, version: str) -> str:
+    payload = json.dumps([normalize_sql(sql), list(params), version], default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class QueryCache:
+    """Size-bounded LRU cache of DataFrames in a SQLite file."""
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_MB << 20) -> None:
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    data_version TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_entries_last_used ON entries (last_used);
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def _count(conn: sqlite3.Connection, name: str, n: int = 1) -> None:
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            (name, n),
+        )
+
+    def read_sql(self, conn: sqlite3.Connection, sql: str, params: Optional[Sequence] = None) -> pd.DataFrame:
+        """pd.read_sql_query(sql, conn, params), served from the cache when possible."""
+        params = tuple(params or ())
+        version = data_version(conn)
+        if version is None:
+            # Untracked warehouse: nothing to invalidate against, so never cache.
+            return pd.read_sql_query(sql, conn, params=params)
+
+        key = cache_key(sql, params, version)
+        with self._connect() as cache:
+            row = cache.execute("SELECT payload FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                cache.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._count(cache, "hits")
+                return pickle.loads(row[0])
+            self._count(cache, "misses")
+
+        df = pd.read_sql_query(sql, conn, params=params)
+        self._store(key, version, sql, df)
+        return df
+
+    def _store(self, key: str, version: str, sql: str, df: pd.DataFrame) -> None:
+        payload = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_bytes:
+            return
+        with self._connect() as cache:
+            stale = cache.execute("DELETE FROM entries WHERE data_version != ?", (version,)).rowcount
+            if stale:
+                self._count(cache, "invalidations", stale)
+            cache.execute(
+                "INSERT OR REPLACE INTO entries (key, data_version, sql, payload, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, version, normalize_sql(sql), payload, len(payload), time.time()),
+            )
+            self._evict(cache)
+
+    def _evict(self, cache: sqlite3.Connection) -> None:
+        total = cache.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in cache.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            cache.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._count(cache, "evictions", evicted)
+
+    def stats(self) -> dict:
+        with self._connect() as cache:
+            counters = dict(cache.execute("SELECT name, value FROM counters"))
+            entries, size = cache.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "evictions": counters.get("evictions", 0),
+            "invalidations": counters.get("invalidations", 0),
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self) -> None:
+        with self._connect() as cache:
+            cache.execute("DELETE FROM entries")
+            cache.execute("DELETE FROM counters")
+
+
+_default_cache: Optional[QueryCache] = None
+
+
+def default_cache() -> Optional[QueryCache]:
+    """Cache configured from the environment, or None if QUERY_CACHE=off."""
+    global _default_cache
+    if os.environ.get("QUERY_CACHE", "on").strip().lower() in ("off", "0", "false", "no"):
+        return None
+    if _default_cache is None:
+        _default_cache = QueryCache(
+            Path(os.environ.get("QUERY_CACHE_PATH", DEFAULT_CACHE_PATH)),
+            int(float(os.environ.get("QUERY_CACHE_MAX_MB", DEFAULT_MAX_MB)) * (1 << 20)),
+        )
+    return _default_cache
+
+
+def read_sql(conn: sqlite3.Connection, sql: str, params: Optional[Sequence] = None) -> pd.DataFrame:
+    """Drop-in replacement for pd.read_sql_query that goes through the default cache."""
+    cache = default_cache()
+    if cache is None:
+        return pd.read_sql_query(sql, conn, params=tuple(params or ()))
+    return cache.read_sql(conn, sql, params)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect or clear the query result cache.")
+    parser.add_argument("command", choices=["stats", "clear"])
+    args = parser.parse_args()
+
+    cache = default_cache() or QueryCache()
+    if args.command == "clear":
+        cache.clear()
+        print(f"Cleared query cache at: {cache.path}")
+        return
+    for name, value in cache.stats().items():
+        print(f"{name}: {value:.2%}" if name == "hit_rate" else f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
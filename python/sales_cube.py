@@ -0,0 +1,223 @@
+"""sales_cube.py
+
+Precomputed sales cube over year x genre x platform x publisher x rating x
+region, stored in the sales_cube table of data/games.db.
+
+Each cell holds additive aggregates of one region's sales for the games with
+those dimension values: n (non-null values), total (sum) and total_sq (sum of
+squares). Because they are additive, any roll-up or slice is a group-by sum over
+the cells. Mean, variance and standard deviation follow from the sums, so
+reports never read the raw sales rows. The cube size is bounded by the number of
+distinct dimension combinations, not by the number of games.
+
+05_load_to_sql.py rebuilds the cube in the same transaction as every load
+that changes the warehouse. To rebuild it by hand, or to check it against the
+SQL queries in sql/queries/:
+    python python/sales_cube.py
+    python python/sales_cube.py --verify
+
+Usage:
+    cube = SalesCube.load(conn)
+    cube.totals("genre")                                   # one column per region
+    cube.rollup(["rating", "genre"], regions=["global"])   # n, total, mean, std
+    cube.rollup(["year"], where={"platform": ["PS3", "X360"]})
+"""
+from pathlib import Path
+from typing import Optional, Sequence
+import argparse
+import sqlite3
+import numpy as np
+import pandas as pd
+
+from query_cache import read_sql
+from warehouse import DB_PATH, bump_data_version, load_query
+
+DIMENSIONS = ["year", "genre", "platform", "publisher", "rating"]
+REGIONS = ["na", "eu", "jp", "other", "global"]
+MEASURES = ["n", "total", "total_sq"]
+
+# Source rows are aggregated this many at a time, so building the cube needs
+# memory for one chunk plus the cells, however large the sales table is.
+BUILD_CHUNKSIZE = 200_000
+
+
+def aggregate_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Cube cells (DIMENSIONS + region + MEASURES) of a batch of source rows."""
+    long = chunk.melt(
+        id_vars=DIMENSIONS,
+        value_vars=[f"{r}_sales" for r in REGIONS],
+        var_name="region",
+        value_name="sales",
+    )
+    long["region"] = long["region"].str.removesuffix("_sales")
+    long["sales_sq"] = long["sales"] ** 2
+    grouped = long.groupby(DIMENSIONS + ["region"], dropna=False, sort=False)
+    return pd.DataFrame(
+        {
+            "n": grouped["sales"].count(),
+            "total": grouped["sales"].sum(),
+            "total_sq": grouped["sales_sq"].sum(),
+        }
+    ).reset_index()
+
+
+def combine(cells: Sequence) -> pd.DataFrame:
+    """Merge partial cubes by summing cells with the same coordinates."""
+    merged = pd.concat(cells, ignore_index=True)
+    return merged.groupby(DIMENSIONS + ["region"], dropna=False, sort=False)[MEASURES].sum().reset_index()
+
+
+def build_cube(conn: sqlite3.Connection, chunksize: int = BUILD_CHUNKSIZE) -> int:
+    """Recompute sales_cube from games/sales in one pass. Returns the cell count.
+
+    Runs inside the caller's transaction and does not commit.
+    """
+    partials = [
+        aggregate_chunk(chunk)
+        for chunk in pd.read_sql_query(load_query("sales_cube_source"), conn, chunksize=chunksize)
+    ]
+    cells = combine(partials) if partials else pd.DataFrame(columns=DIMENSIONS + ["region"] + MEASURES)
+    columns = DIMENSIONS + ["region"] + MEASURES
+    rows = cells[columns].astype(object).where(cells[columns].notna(), None).itertuples(index=False, name=None)
+    conn.execute("DELETE FROM sales_cube")
+    conn.executemany(
+        f"INSERT INTO sales_cube ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        rows,
+    )
+    return len(cells)
+
+
+def cube_is_empty(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM sales_cube LIMIT 1").fetchone() is None
+
+
+class SalesCube:
+    """Roll-ups and slices of the precomputed cube cells."""
+
+    def __init__(self, cells: pd.DataFrame) -> None:
+        self.cells = cells
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection) -> "SalesCube":
+        try:
+            cells = read_sql(conn, "SELECT * FROM sales_cube")
+        except (sqlite3.OperationalError, pd.errors.DatabaseError) as exc:
+            raise RuntimeError("sales_cube table not found; run 05_load_to_sql.py first") from exc
+        return cls(cells)
+
+    def slice(self, where: Optional[dict] = None, regions: Optional[Sequence] = None) -> pd.DataFrame:
+        """Cells matching ``where`` ({dimension: value or list of values}) and ``regions``.
+
+        A value of None selects cells where that dimension is NULL.
+        """
+        mask = np.ones(len(self.cells), dtype=bool)
+        for dim, value in (where or {}).items():
+            if dim not in DIMENSIONS:
+                raise ValueError(f"Unknown cube dimension: {dim}")
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            col = self.cells[dim]
+            match = col.isin([v for v in values if v is not None])
+            if any(v is None for v in values):
+                match |= col.isna()
+            mask &= match.to_numpy()
+        if regions is not None:
+            mask &= self.cells["region"].isin(regions).to_numpy()
+        return self.cells[mask]
+
+    def rollup(
+        self,
+        by: Sequence = (),
+        where: Optional[dict] = None,
+        regions: Optional[Sequence] = None,
+    ) -> pd.DataFrame:
+        """Aggregates per ``by`` x region: n, total, total_sq, mean, var, std.
+
+        var and std are sample statistics (ddof=1), NaN where n < 2.
+        """
+        by = list(by)
+        unknown = [d for d in by if d not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown cube dimension(s): {', '.join(unknown)}")
+        cells = self.slice(where, regions)
+        out = cells.groupby(by + ["region"], dropna=False, sort=False)[MEASURES].sum().reset_index()
+        n = out["n"].to_numpy(dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out["mean"] = np.where(n > 0, out["total"] / n, np.nan)
+            ss = np.maximum(out["total_sq"] - out["total"] ** 2 / n, 0.0)
+            out["var"] = np.where(n > 1, ss / (n - 1), np.nan)
+        out["std"] = np.sqrt(out["var"])
+        out["n"] = out["n"].astype("int64")
+        return out
+
+    def totals(self, by, where: Optional[dict] = None) -> pd.DataFrame:
+        """Sales totals per ``by`` with one <region>_sales column per region."""
+        by = [by] if isinstance(by, str) else list(by)
+        rolled = self.rollup(by, where)
+        wide = rolled.set_index(by + ["region"])["total"].unstack("region")
+        wide = wide.reindex(columns=[r for r in REGIONS if r in wide.columns])
+        wide.columns = [f"{r}_sales" for r in wide.columns]
+        return wide.reset_index()
+
+
+def verify(conn: sqlite3.Connection) -> list:
+    """Differences between cube roll-ups and the equivalent SQL queries."""
+    cube = SalesCube.load(conn)
+    problems = []
+
+    def compare(name: str, expected: pd.DataFrame, actual: pd.DataFrame, key: list) -> None:
+        merged = expected.merge(actual, on=key, how="outer", suffixes=("_sql", "_cube"), indicator=True)
+        if (merged["_merge"] != "both").any():
+            problems.append(f"{name}: groups differ")
+            return
+        for col in expected.columns.difference(key):
+            if not np.allclose(merged[f"{col}_sql"], merged[f"{col}_cube"], equal_nan=True):
+                problems.append(f"{name}: {col} differs")
+
+    for dim, query in (("year", "sales_by_year"), ("genre", "sales_by_genre")):
+        compare(query, pd.read_sql_query(load_query(query), conn), cube.totals(dim), [dim])
+
+    expected = pd.read_sql_query(load_query("top_genres"), conn)
+    actual = cube.totals("genre").nlargest(len(expected), "global_sales")[["genre", "global_sales"]]
+    compare("top_genres", expected, actual, ["genre"])
+
+    expected = pd.read_sql_query(load_query("rating_genre_summary"), conn)
+    actual = cube.rollup(["rating", "genre"], regions=["global"])
+    actual = actual.rename(columns={"mean": "avg_global_sales"})[["rating", "genre", "avg_global_sales", "n"]]
+    compare("rating_genre_summary", expected, actual, ["rating", "genre"])
+
+    # Per-genre sums of raw fact rows against the cube's n, total and total_sq.
+    rows = []
+    for (genre,) in conn.execute("SELECT genre FROM dim_genre"):
+        sales = pd.read_sql_query(load_query("genre_global_sales"), conn, params=(genre,))["global_sales"].dropna()
+        rows.append({"genre": genre, "n": len(sales), "total": sales.sum(), "total_sq": (sales**2).sum()})
+    actual = cube.rollup(["genre"], regions=["global"])[["genre"] + MEASURES]
+    expected = pd.DataFrame(rows)
+    compare("genre_global_sales", expected[expected["n"] > 0], actual[actual["n"] > 0], ["genre"])
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild or verify the precomputed sales cube.")
+    parser.add_argument("--db", type=Path, default=DB_PATH)
+    parser.add_argument("--verify", action="store_true", help="compare roll-ups with sql/queries/ instead")
+    args = parser.parse_args()
+
+    if not args.db.exists():
+        raise FileNotFoundError(f"Database not found: {args.db}")
+
+    with sqlite3.connect(args.db) as conn:
+        if args.verify:
+            problems = verify(conn)
+            for problem in problems:
+                print(f"FAIL {problem}")
+            if problems:
+                raise SystemExit(1)
+            print("Sales cube matches the SQL queries.")
+            return
+        cells = build_cube(conn)
+        bump_data_version(conn)
+    print(f"Built sales_cube with {cells} cells in: {args.db}")
+
+
+if __name__ == "__main__":
+    main()
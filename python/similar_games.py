@@ -0,0 +1,130 @@
+"""similar_games.py
+
+"What games look like this one": nearest neighbours by score and regional
+sales profile, i.e. Euclidean distance between rows of the scaled clustering
+features (data/features_for_clustering.bin, written by
+08_prepare_features_for_clustering.py).
+
+The index is the C++ engine's KD-tree (kmeans_engine.NeighborIndex), so a
+top-k query costs about O(log n) distance checks instead of a scan of the
+catalog, and the full table about O(n log n) instead of all pairs. Results
+are exact: the same neighbours, in the same order, as a brute-force scan.
+
+pipeline.py runs the table build as a stage after 08, so it is rebuilt
+whenever the features file changes, and its state records which features
+file it was built from. Writing the table does not bump the warehouse
+data_version: no cached query or Tableau partition reads similar_games.
+
+Usage (from repo root, after 08 and make -C cpp):
+    python python/similar_games.py --game-id 12 345   # print neighbours of these games
+    python python/similar_games.py --k 10             # rebuild the similar_games table
+    python python/similar_games.py --k 10 --csv       # ...and tableau/similar_games.csv
+"""
+from pathlib import Path
+from typing import Iterator, Optional, Sequence
+import argparse
+import sqlite3
+import numpy as np
+import pandas as pd
+
+from feature_io import read_features
+from instrumentation import record_rows, stage_main, step
+from kmeans_engine import NeighborIndex
+from warehouse import DB_PATH, REPO_ROOT
+
+FEATURES_PATH = REPO_ROOT / "data" / "features_for_clustering.bin"
+CSV_PATH = REPO_ROOT / "tableau" / "similar_games.csv"
+DEFAULT_K = 10
+
+# Games queried (and rows inserted) per step when building the table.
+TABLE_BATCH_GAMES = 50_000
+
+
+class SimilarGames:
+    def __init__(self, ids: np.ndarray, features: np.ndarray) -> None:
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.index = NeighborIndex(features)
+        self._positions = pd.Index(self.ids)
+
+    @classmethod
+    def from_file(cls, path: Path = FEATURES_PATH) -> "SimilarGames":
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Features not found: {path}. Run 08_prepare_features_for_clustering.py first.")
+        ids, features = read_features(path)
+        return cls(ids, features)
+
+    def _frame(self, rows: np.ndarray, k: int, threads: Optional[int]) -> pd.DataFrame:
+        neighbors, distances = self.index.query_rows(rows, k, threads=threads)
+        found = neighbors >= 0
+        return pd.DataFrame(
+            {
+                "game_id": np.repeat(self.ids[rows], k)[found.ravel()],
+                "neighbor_id": self.ids[neighbors[found]],
+                "rank": np.tile(np.arange(1, k + 1), len(rows))[found.ravel()],
+                "distance": distances[found],
+            }
+        )
+
+    def top_k(self, game_ids: Sequence, k: int = DEFAULT_K, threads: Optional[int] = None) -> pd.DataFrame:
+        """game_id, neighbor_id, rank (1 = nearest) and distance for each requested game."""
+        rows = self._positions.get_indexer(pd.Index(np.asarray(game_ids, dtype=np.int64)))
+        if (rows < 0).any():
+            missing = np.asarray(game_ids)[rows < 0]
+            raise KeyError(f"No clustering features for game_id {', '.join(map(str, missing[:10]))}")
+        if len(rows) == 0:
+            return pd.DataFrame(columns=["game_id", "neighbor_id", "rank", "distance"])
+        return self._frame(rows, k, threads)
+
+    def all_pairs(self, k: int = DEFAULT_K, threads: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """top_k() of every game, TABLE_BATCH_GAMES games per frame."""
+        for begin in range(0, len(self.ids), TABLE_BATCH_GAMES):
+            yield self._frame(np.arange(begin, min(begin + TABLE_BATCH_GAMES, len(self.ids))), k, threads)
+
+
+def write_table(conn: sqlite3.Connection, similar: SimilarGames, k: int, threads: Optional[int] = None) -> int:
+    """Replace the similar_games table with every game's top k."""
+    conn.execute("DELETE FROM similar_games")
+    count = 0
+    for batch in similar.all_pairs(k, threads):
+        conn.executemany(
+            "INSERT INTO similar_games (game_id, neighbor_id, rank, distance) VALUES (?, ?, ?, ?)",
+            batch.astype(object).itertuples(index=False, name=None),
+        )
+        count += len(batch)
+    return count
+
+
+@stage_main
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Find similar games with the C++ engine's KD-tree.")
+    parser.add_argument("--k", type=int, default=DEFAULT_K, help="neighbours per game")
+    parser.add_argument("--game-id", type=int, nargs="+", help="print neighbours of these games instead of writing the table")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--csv", action="store_true", help=f"also write {CSV_PATH.relative_to(REPO_ROOT)}")
+    args = parser.parse_args()
+    if args.k <= 0:
+        parser.error("--k must be positive")
+
+    with step("build_index"):
+        similar = SimilarGames.from_file()
+    if args.game_id:
+        print(similar.top_k(args.game_id, args.k, args.threads).to_string(index=False))
+        return
+
+    if not DB_PATH.exists():
+        raise FileNotFoundError(f"Database not found: {DB_PATH}")
+    with sqlite3.connect(DB_PATH) as conn:
+        with step("write_table") as s:
+            count = write_table(conn, similar, args.k, args.threads)
+            conn.commit()
+            s.rows_out = count
+        if args.csv:
+            CSV_PATH.parent.mkdir(parents=True, exist_ok=True)
+            pd.read_sql_query("SELECT * FROM similar_games ORDER BY game_id, rank", conn).to_csv(CSV_PATH, index=False)
+            print(f"Wrote CSV copy to: {CSV_PATH}")
+    record_rows(rows_out=count)
+    print(f"Wrote {count} rows ({args.k} neighbours per game) into similar_games table.")
+
+
+if __name__ == "__main__":
+    main()
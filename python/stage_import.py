@@ -0,0 +1,22 @@
+"""stage_import.py
+
+Import a numbered stage script (whose name is not a valid module name, e.g.
+05_load_to_sql) as a module, to reuse its functions from another stage or a
+benchmark.
+
+Kept apart from pipeline.py on purpose: pipeline.py fingerprints every local
+module a stage imports, so a stage importing the runner would be rerun
+whenever the runner changes.
+"""
+from pathlib import Path
+import importlib.util
+
+PYTHON_DIR = Path(__file__).resolve().parent
+
+
+def import_stage(name: str):
+    """Import a numbered stage script (e.g. 05_load_to_sql) as a module."""
+    spec = importlib.util.spec_from_file_location(name, PYTHON_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
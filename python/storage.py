@@ -0,0 +1,146 @@
+"""storage.py
+
+Read/write helpers for the intermediate tables handed between stages 01-05
+(clean_console_data, clean_population_data, region_population_by_year and the
+other region_population_<scheme> tables, merged_games_population).
+
+The on-disk format is chosen with the INTERMEDIATE_FORMAT environment variable:
+- csv (default): plain text, e.g. data/clean_console_data.csv
+- parquet: zstd-compressed Parquet, e.g. data/clean_console_data.parquet
+- feather: lz4-compressed Arrow IPC, e.g. data/clean_console_data.feather
+
+The binary formats keep column dtypes (such as the nullable Int64 year)
+across stages, and readers can ask for just the columns they need; both are
+read through a memory map. They require pyarrow.
+"""
+from pathlib import Path
+from typing import Optional
+import os
+import pandas as pd
+
+FORMAT_ENV_VAR = "INTERMEDIATE_FORMAT"
+FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+
+
+def intermediate_format() -> str:
+    """Format selected through INTERMEDIATE_FORMAT (default: csv)."""
+    fmt = os.environ.get(FORMAT_ENV_VAR, "csv").strip().lower()
+    if fmt not in FORMATS:
+        raise ValueError(
+            f"Unsupported {FORMAT_ENV_VAR}={fmt!r}; expected one of: {', '.join(FORMATS)}"
+        )
+    return fmt
+
+
+def intermediate_path(data_dir: Path, stem: str, fmt: Optional[str] = None) -> Path:
+    """Path of an intermediate table, e.g. data/clean_console_data.parquet."""
+    return data_dir / f"{stem}{FORMATS[fmt or intermediate_format()]}"
+
+
+def _require_pyarrow(fmt: str):
+    try:
+        import pyarrow
+    except ImportError as exc:
+        raise ImportError(
+            f"{FORMAT_ENV_VAR}={fmt} requires pyarrow (pip install pyarrow)"
+        ) from exc
+    return pyarrow
+
+
+def write_table(df: pd.DataFrame, data_dir: Path, stem: str) -> Path:
+    """Write an intermediate table in the configured format and return its path."""
+    fmt = intermediate_format()
+    path = intermediate_path(data_dir, stem, fmt)
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+    elif fmt == "parquet":
+        _require_pyarrow(fmt)
+        df.to_parquet(path, index=False, compression="zstd")
+    else:
+        _require_pyarrow(fmt)
+        df.reset_index(drop=True).to_feather(path, compression="lz4")
+    return path
+
+
+def read_table(data_dir: Path, stem: str, columns: Optional[list] = None) -> pd.DataFrame:
+    """Read an intermediate table, optionally restricted to ``columns``."""
+    fmt = intermediate_format()
+    path = intermediate_path(data_dir, stem, fmt)
+    if not path.exists():
+        raise FileNotFoundError(f"Intermediate table not found: {path}")
+
+    if fmt == "csv":
+        df = pd.read_csv(path, usecols=columns)
+        return df[columns] if columns is not None else df
+
+    _require_pyarrow(fmt)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        arrow_table = pq.read_table(path, columns=columns, memory_map=True)
+    else:
+        import pyarrow.feather as feather
+
+        arrow_table = feather.read_table(path, columns=columns, memory_map=True)
+    return arrow_table.to_pandas()
+
+
+class TableWriter:
+    """Append DataFrame batches to an intermediate table in the configured format.
+
+    Every batch must have the same columns and dtypes. The schema of the binary
+    formats is fixed by the first batch.
+    """
+
+    def __init__(self, data_dir: Path, stem: str) -> None:
+        self.fmt = intermediate_format()
+        self.path = intermediate_path(data_dir, stem, self.fmt)
+        self.rows = 0
+        self._started = False
+        self._schema = None
+        self._writer = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.fmt == "csv":
+            df.to_csv(
+                self.path,
+                index=False,
+                mode="a" if self._started else "w",
+                header=not self._started,
+            )
+        else:
+            pa = _require_pyarrow(self.fmt)
+            if self._writer is None:
+                self._open_arrow_writer(pa, df)
+            self._writer.write_table(
+                pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            )
+        self._started = True
+        self.rows += len(df)
+
+    def _open_arrow_writer(self, pa, df: pd.DataFrame) -> None:
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        # A text column that is empty throughout the first batch is typed null.
+        for i, field in enumerate(schema):
+            if pa.types.is_null(field.type):
+                schema = schema.set(i, field.with_type(pa.string()))
+        self._schema = schema
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            self._writer = pq.ParquetWriter(self.path, schema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_file(
+                self.path, schema, options=pa.ipc.IpcWriteOptions(compression="lz4")
+            )
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
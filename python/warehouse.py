@@ -0,0 +1,80 @@
+"""warehouse.py
+
+Shared access to the SQLite warehouse (data/games.db) and the analytical
+queries shipped in sql/queries/.
+
+Writers call bump_data_version() in the same transaction as their changes;
+readers use data_version() to tell whether anything changed since a result
+was computed (see query_cache.py).
+
+Each query file may carry header comments that check_query_plans.py
+enforces against EXPLAIN QUERY PLAN:
+    -- uses-index: ux_dim_genre, ix_fact_sales_genre
+    -- allow-full-scan: fact_sales
+"""
+from pathlib import Path
+from typing import Optional
+import re
+import sqlite3
+import uuid
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DB_PATH = REPO_ROOT / "data" / "games.db"
+SCHEMA_PATH = REPO_ROOT / "sql" / "schema.sql"
+QUERIES_DIR = REPO_ROOT / "sql" / "queries"
+
+DATA_VERSION_KEY = "data_version"
+
+_DIRECTIVE = re.compile(r"^--\s*(uses-index|allow-full-scan):\s*(.+)$")
+
+
+def load_query(name: str) -> str:
+    """SQL text of sql/queries/<name>.sql."""
+    path = QUERIES_DIR / f"{name}.sql"
+    if not path.exists():
+        raise FileNotFoundError(f"Query not found: {path}")
+    return path.read_text()
+
+
+def query_names() -> list:
+    return sorted(p.stem for p in QUERIES_DIR.glob("*.sql"))
+
+
+def query_directives(sql: str) -> dict:
+    """Plan expectations declared in a query's header comments."""
+    directives = {"uses-index": [], "allow-full-scan": []}
+    for line in sql.splitlines():
+        match = _DIRECTIVE.match(line.strip())
+        if match:
+            directives[match.group(1)].extend(v.strip() for v in match.group(2).split(","))
+    return directives
+
+
+def missing_tables(conn: sqlite3.Connection, names: list) -> list:
+    """Those of names that are not tables in the warehouse."""
+    present = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [name for name in names if name not in present]
+
+
+def data_version(conn: sqlite3.Connection) -> Optional[str]:
+    """Current content version of the warehouse, or None if it is not tracked."""
+    try:
+        row = conn.execute(
+            "SELECT value FROM warehouse_meta WHERE key = ?", (DATA_VERSION_KEY,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # Warehouse built before warehouse_meta existed.
+        return None
+    return row[0] if row else None
+
+
+def bump_data_version(conn: sqlite3.Connection) -> str:
+    """Record that the warehouse contents changed; call inside the writer's transaction."""
+    version = uuid.uuid4().hex
+    # Same DDL as schema.sql, for warehouses loaded before the table existed.
+    conn.execute("CREATE TABLE IF NOT EXISTS warehouse_meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute(
+        "INSERT OR REPLACE INTO warehouse_meta (key, value) VALUES (?, ?)",
+        (DATA_VERSION_KEY, version),
+    )
+    return version
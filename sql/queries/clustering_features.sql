@@ -0,0 +1,13 @@
+-- Raw clustering features per game (08_prepare_features_for_clustering.py).
+-- Reads every game, so the scan of fact_sales is expected.
+-- allow-full-scan: fact_sales
+SELECT
+    game_id,
+    critic_score,
+    user_score,
+    na_sales,
+    eu_sales,
+    jp_sales,
+    other_sales,
+    global_sales
+FROM fact_sales
@@ -0,0 +1,7 @@
+-- Global sales of every game in one genre; sales_cube.py --verify checks
+-- each genre's count, sum and sum of squares in the cube against it.
+-- uses-index: ux_dim_genre, ix_fact_sales_genre
+SELECT f.global_sales
+FROM dim_genre d
+JOIN fact_sales f ON f.genre_id = d.genre_id
+WHERE d.genre = ?
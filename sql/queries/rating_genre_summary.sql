@@ -0,0 +1,9 @@
+-- Average global sales per ESRB rating x genre (07_ab_tests.py). Groups on
+-- the integer keys; the dimension tables only supply the labels.
+-- uses-index: ix_fact_sales_rating_genre
+SELECT r.rating, g.genre, AVG(f.global_sales) AS avg_global_sales, COUNT(*) AS n
+FROM fact_sales f
+LEFT JOIN dim_rating r ON r.rating_id = f.rating_id
+LEFT JOIN dim_genre g ON g.genre_id = f.genre_id
+GROUP BY f.rating_id, f.genre_id
+ORDER BY avg_global_sales DESC
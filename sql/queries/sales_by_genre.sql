@@ -0,0 +1,14 @@
+-- Sales by genre for the grouped bar chart (06_eda_and_kpis.py). Groups on
+-- the integer key; dim_genre only supplies the label.
+-- uses-index: ix_fact_sales_genre
+SELECT
+    g.genre,
+    SUM(f.na_sales) AS na_sales,
+    SUM(f.eu_sales) AS eu_sales,
+    SUM(f.jp_sales) AS jp_sales,
+    SUM(f.other_sales) AS other_sales,
+    SUM(f.global_sales) AS global_sales
+FROM fact_sales f
+LEFT JOIN dim_genre g ON g.genre_id = f.genre_id
+GROUP BY f.genre_id
+ORDER BY global_sales DESC
@@ -0,0 +1,12 @@
+-- Regional totals per year for the time-series chart (06_eda_and_kpis.py).
+-- uses-index: ix_fact_sales_year
+SELECT
+    year,
+    SUM(na_sales) AS na_sales,
+    SUM(eu_sales) AS eu_sales,
+    SUM(jp_sales) AS jp_sales,
+    SUM(other_sales) AS other_sales,
+    SUM(global_sales) AS global_sales
+FROM fact_sales
+GROUP BY year
+ORDER BY year
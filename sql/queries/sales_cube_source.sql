@@ -0,0 +1,20 @@
+-- Cube dimensions and regional measures of every game (sales_cube.py).
+-- Reads every game, so the scan of fact_sales is expected; the labels come
+-- from the dimension tables by primary key.
+-- allow-full-scan: fact_sales
+SELECT
+    f.year,
+    g.genre,
+    p.platform,
+    pb.publisher,
+    r.rating,
+    f.na_sales,
+    f.eu_sales,
+    f.jp_sales,
+    f.other_sales,
+    f.global_sales
+FROM fact_sales f
+JOIN dim_platform p ON p.platform_id = f.platform_id
+LEFT JOIN dim_genre g ON g.genre_id = f.genre_id
+LEFT JOIN dim_publisher pb ON pb.publisher_id = f.publisher_id
+LEFT JOIN dim_rating r ON r.rating_id = f.rating_id
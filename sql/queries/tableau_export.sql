@@ -0,0 +1,31 @@
+-- Flattened table for Tableau (10_export_for_tableau.py).
+-- Reads every game, so the scan of fact_sales is expected; dimensions,
+-- population and clusters are looked up by primary key.
+-- allow-full-scan: fact_sales
+SELECT
+    f.game_id,
+    f.name,
+    p.platform,
+    f.year,
+    g.genre,
+    pb.publisher,
+    r.rating,
+    f.critic_score,
+    f.user_score,
+    f.na_sales,
+    f.eu_sales,
+    f.jp_sales,
+    f.other_sales,
+    f.global_sales,
+    y.na_population,
+    y.eu_population,
+    y.jp_population,
+    y.other_population,
+    c.cluster_id
+FROM fact_sales f
+JOIN dim_platform p ON p.platform_id = f.platform_id
+LEFT JOIN dim_genre g ON g.genre_id = f.genre_id
+LEFT JOIN dim_publisher pb ON pb.publisher_id = f.publisher_id
+LEFT JOIN dim_rating r ON r.rating_id = f.rating_id
+LEFT JOIN dim_year y ON y.year = f.year
+LEFT JOIN clusters c ON c.game_id = f.game_id
@@ -0,0 +1,11 @@
+-- Top 10 genres globally; sales_cube.py --verify checks the cube's genre
+-- totals against it.
+-- uses-index: ix_fact_sales_genre
+SELECT
+    g.genre,
+    SUM(f.global_sales) AS global_sales
+FROM fact_sales f
+LEFT JOIN dim_genre g ON g.genre_id = f.genre_id
+GROUP BY f.genre_id
+ORDER BY global_sales DESC
+LIMIT 10
@@ -0,0 +1,16 @@
+-- Raw clustering features of games without a cluster assignment
+-- (09_integrate_cpp_clusters.py --predict). The anti-join probes clusters by
+-- its primary key; fact_sales is read in full to find the new games.
+-- allow-full-scan: fact_sales
+SELECT
+    f.game_id,
+    f.critic_score,
+    f.user_score,
+    f.na_sales,
+    f.eu_sales,
+    f.jp_sales,
+    f.other_sales,
+    f.global_sales
+FROM fact_sales f
+LEFT JOIN clusters c ON c.game_id = f.game_id
+WHERE c.game_id IS NULL
@@ -1,41 +1,240 @@
-DROP TABLE IF EXISTS clusters;
-DROP TABLE IF EXISTS sales;
-DROP TABLE IF EXISTS games;
-DROP TABLE IF EXISTS region_population;
-
-CREATE TABLE games (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT,
-    platform TEXT,
+-- Idempotent: 05_load_to_sql.py runs this on every load and upserts into the
+-- existing tables. Use 05_load_to_sql.py --rebuild to start from empty tables.
+
+-- Star schema. Each distinct platform, genre, publisher and rating string is
+-- stored once in its dimension table under an integer key; fact_sales holds
+-- one row per game with those keys, the release year, the scores and the
+-- regional sales. dim_year is joined on year with LEFT JOIN, since it only
+-- covers the years with population data. The games, sales and region_population
+-- views at the end of this file present the earlier wide tables.
+CREATE TABLE IF NOT EXISTS dim_platform (
+    platform_id INTEGER PRIMARY KEY,
+    platform TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_dim_platform ON dim_platform (platform);
+
+CREATE TABLE IF NOT EXISTS dim_genre (
+    genre_id INTEGER PRIMARY KEY,
+    genre TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_dim_genre ON dim_genre (genre);
+
+CREATE TABLE IF NOT EXISTS dim_publisher (
+    publisher_id INTEGER PRIMARY KEY,
+    publisher TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_dim_publisher ON dim_publisher (publisher);
+
+CREATE TABLE IF NOT EXISTS dim_rating (
+    rating_id INTEGER PRIMARY KEY,
+    rating TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_dim_rating ON dim_rating (rating);
+
+-- Regional population per year; year is the rowid, so lookups by year need no
+-- separate index.
+CREATE TABLE IF NOT EXISTS dim_year (
+    year INTEGER PRIMARY KEY,
+    na_population REAL,
+    eu_population REAL,
+    jp_population REAL,
+    other_population REAL
+);
+
+-- game_id is the rowid and never reused (AUTOINCREMENT), so clusters and the
+-- other per-game tables can keep referring to it across loads. name is a
+-- degenerate dimension: it is nearly unique per game, so a dimension table
+-- would not make it smaller.
+CREATE TABLE IF NOT EXISTS fact_sales (
+    game_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    platform_id INTEGER NOT NULL,
     year INTEGER,
-    genre TEXT,
-    publisher TEXT,
+    genre_id INTEGER,
+    publisher_id INTEGER,
+    rating_id INTEGER,
     critic_score REAL,
     user_score REAL,
-    rating TEXT
+    na_sales REAL,
+    eu_sales REAL,
+    jp_sales REAL,
+    other_sales REAL,
+    global_sales REAL,
+    FOREIGN KEY (platform_id) REFERENCES dim_platform (platform_id),
+    FOREIGN KEY (genre_id) REFERENCES dim_genre (genre_id),
+    FOREIGN KEY (publisher_id) REFERENCES dim_publisher (publisher_id),
+    FOREIGN KEY (rating_id) REFERENCES dim_rating (rating_id)
+);
+
+-- Natural key used by the incremental loader.
+CREATE UNIQUE INDEX IF NOT EXISTS ux_fact_sales_natural_key ON fact_sales (name, platform_id, year);
+
+-- Covering indexes for the KPI queries in sql/queries/: each holds the
+-- integer grouping/filter keys followed by the measures the query sums, so
+-- aggregates read the keys in order from the index without visiting the table.
+CREATE INDEX IF NOT EXISTS ix_fact_sales_year
+    ON fact_sales (year, na_sales, eu_sales, jp_sales, other_sales, global_sales);
+CREATE INDEX IF NOT EXISTS ix_fact_sales_genre
+    ON fact_sales (genre_id, na_sales, eu_sales, jp_sales, other_sales, global_sales);
+CREATE INDEX IF NOT EXISTS ix_fact_sales_rating_genre ON fact_sales (rating_id, genre_id, global_sales);
+
+CREATE TABLE IF NOT EXISTS clusters (
+    game_id INTEGER PRIMARY KEY,
+    cluster_id INTEGER,
+    FOREIGN KEY (game_id) REFERENCES fact_sales (game_id)
 );
 
-CREATE TABLE sales (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    game_id INTEGER,
+-- Key/value metadata. data_version is replaced with a fresh token by every
+-- writer (05_load_to_sql.py, 09_integrate_cpp_clusters.py) and keys the
+-- query result cache in python/query_cache.py.
+CREATE TABLE IF NOT EXISTS warehouse_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+-- Precomputed sales cube (python/sales_cube.py): additive aggregates of one
+-- region's sales per combination of game dimensions. Rebuilt by
+-- 05_load_to_sql.py whenever games or sales change.
+CREATE TABLE IF NOT EXISTS sales_cube (
+    year INTEGER,
+    genre TEXT,
+    platform TEXT,
+    publisher TEXT,
+    rating TEXT,
+    region TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    total REAL NOT NULL,
+    total_sq REAL NOT NULL
+);
+
+-- Ranked all-pairs Welch tests of global sales (07_ab_tests.py --all-pairs),
+-- replaced per dimension on every run.
+CREATE TABLE IF NOT EXISTS pairwise_tests (
+    dimension TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    group_a TEXT NOT NULL,
+    group_b TEXT NOT NULL,
+    n_a INTEGER,
+    n_b INTEGER,
+    mean_a REAL,
+    mean_b REAL,
+    t_stat REAL,
+    df REAL,
+    p_value REAL,
+    correction TEXT,
+    p_adjusted REAL,
+    significant INTEGER,
+    PRIMARY KEY (dimension, group_a, group_b)
+);
+
+-- Model selection metrics of the last 09_integrate_cpp_clusters.py run, one
+-- row per k fitted; chosen = 1 marks the k whose labels are in clusters.
+CREATE TABLE IF NOT EXISTS cluster_metrics (
+    k INTEGER PRIMARY KEY,
+    inertia REAL,
+    silhouette REAL,
+    davies_bouldin REAL,
+    iterations INTEGER,
+    chosen INTEGER
+);
+
+-- Size and centroid (in original feature units) of every cluster of the
+-- chosen model.
+CREATE TABLE IF NOT EXISTS cluster_centroids (
+    cluster_id INTEGER PRIMARY KEY,
+    size INTEGER,
+    critic_score REAL,
+    user_score REAL,
     na_sales REAL,
     eu_sales REAL,
     jp_sales REAL,
     other_sales REAL,
-    global_sales REAL,
-    FOREIGN KEY (game_id) REFERENCES games (id)
+    global_sales REAL
 );
 
-CREATE TABLE region_population (
-    year INTEGER PRIMARY KEY,
-    na_population REAL,
-    eu_population REAL,
-    jp_population REAL,
-    other_population REAL
+-- Versioned cluster models (python/cluster_model.py), saved by every
+-- 09_integrate_cpp_clusters.py run (--predict excepted): the feature scaler and the
+-- centroids in scaled units, enough to assign new games without
+-- re-clustering. Not dropped by 05_load_to_sql.py --rebuild.
+CREATE TABLE IF NOT EXISTS cluster_models (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    k INTEGER NOT NULL,
+    seed INTEGER,
+    inertia REAL,
+    silhouette REAL,
+    davies_bouldin REAL
+);
+
+CREATE TABLE IF NOT EXISTS cluster_model_features (
+    version INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    feature TEXT NOT NULL,
+    mean REAL NOT NULL,
+    scale REAL NOT NULL,
+    PRIMARY KEY (version, position),
+    FOREIGN KEY (version) REFERENCES cluster_models (version)
 );
 
-CREATE TABLE clusters (
+CREATE TABLE IF NOT EXISTS cluster_model_centroids (
+    version INTEGER NOT NULL,
+    cluster_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (version, cluster_id, position),
+    FOREIGN KEY (version) REFERENCES cluster_models (version)
+);
+
+-- Each game's nearest other games by distance between scaled clustering
+-- features (python/similar_games.py); rank 1 is the most similar.
+CREATE TABLE IF NOT EXISTS similar_games (
+    game_id INTEGER NOT NULL,
+    neighbor_id INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    distance REAL NOT NULL,
+    PRIMARY KEY (game_id, rank)
+);
+
+-- Hash of the clustering features each game had when it was last assigned a
+-- cluster (09_integrate_cpp_clusters.py); a warm-started run reassigns only
+-- games whose hash changed or is missing.
+CREATE TABLE IF NOT EXISTS cluster_inputs (
     game_id INTEGER PRIMARY KEY,
-    cluster_id INTEGER,
-    FOREIGN KEY (game_id) REFERENCES games (id)
+    features_hash INTEGER NOT NULL,
+    FOREIGN KEY (game_id) REFERENCES fact_sales (game_id)
 );
+
+-- Compatibility views with the columns of the tables the star schema
+-- replaced, for ad-hoc SQL and queries written against them. sales.id is
+-- the game_id.
+CREATE VIEW IF NOT EXISTS games AS
+SELECT
+    f.game_id AS id,
+    f.name,
+    p.platform,
+    f.year,
+    g.genre,
+    pb.publisher,
+    f.critic_score,
+    f.user_score,
+    r.rating
+FROM fact_sales f
+JOIN dim_platform p ON p.platform_id = f.platform_id
+LEFT JOIN dim_genre g ON g.genre_id = f.genre_id
+LEFT JOIN dim_publisher pb ON pb.publisher_id = f.publisher_id
+LEFT JOIN dim_rating r ON r.rating_id = f.rating_id;
+
+CREATE VIEW IF NOT EXISTS sales AS
+SELECT
+    game_id AS id,
+    game_id,
+    na_sales,
+    eu_sales,
+    jp_sales,
+    other_sales,
+    global_sales
+FROM fact_sales;
+
+CREATE VIEW IF NOT EXISTS region_population AS
+SELECT year, na_population, eu_population, jp_population, other_population
+FROM dim_year;